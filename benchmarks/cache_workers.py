@@ -0,0 +1,132 @@
+"""
+Caché por worker frente a caché compartida por el nodo.
+
+Lanza 1, 4 y 8 procesos (como los workers de uvicorn de un pod) que piden claves con
+distribución Zipf (unas pocas conversaciones/credenciales muy calientes y una cola
+larga). En cada fallo se simula la llamada al upstream (MS de credenciales, login,
+historial) con una espera fija y se guarda el valor con el TTL indicado. Para cada
+backend (memory = un LRU por proceso, sqlite = fichero WAL compartido con L1 local)
+mide:
+
+- tasa de aciertos y llamadas totales al upstream (lo que se ahorra en red);
+- latencia de la consulta a la caché (p50/p99, sin contar el upstream).
+
+Uso (desde la raíz del repo):
+    python benchmarks/cache_workers.py
+    python benchmarks/cache_workers.py --workers 1 4 8 --lookups 3000 --json cache.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src")]
+
+from app.services.cache import MemoryCache, SQLiteCache, TieredCache  # noqa: E402
+
+
+def _zipf_keys(rng: random.Random, n: int, keys: int, s: float) -> List[str]:
+    weights = [1 / (i + 1) ** s for i in range(keys)]
+    return [f"conv-{k}" for k in rng.choices(range(keys), weights=weights, k=n)]
+
+
+def _worker(args: Dict[str, Any]) -> Dict[str, Any]:
+    if args["backend"] == "memory":
+        cache = MemoryCache(args["max_entries"])
+    else:
+        cache = TieredCache(MemoryCache(args["max_entries"]), SQLiteCache(args["path"]), local_ttl_s=args["l1_ttl"])
+    rng = random.Random(args["seed"])
+    keys = _zipf_keys(rng, args["lookups"], args["keys"], args["zipf"])
+    payload = b"x" * args["value_bytes"]
+    hits, upstream, timings = 0, 0, []
+    for key in keys:
+        started = time.perf_counter()
+        value = cache.get(key)
+        timings.append(time.perf_counter() - started)
+        if value is not None:
+            hits += 1
+            continue
+        upstream += 1
+        time.sleep(args["upstream_ms"] / 1000)
+        cache.set(key, payload, args["ttl"])
+    cache.close()
+    return {"hits": hits, "upstream": upstream, "timings": timings}
+
+
+def run(backend: str, workers: int, opts: argparse.Namespace) -> Dict[str, Any]:
+    path = os.path.join(tempfile.mkdtemp(prefix="cache-bench-"), "cache.sqlite")
+    jobs = [
+        {
+            "backend": backend,
+            "path": path,
+            "seed": opts.seed + i,
+            "lookups": opts.lookups,
+            "keys": opts.keys,
+            "zipf": opts.zipf,
+            "ttl": opts.ttl,
+            "l1_ttl": opts.l1_ttl,
+            "upstream_ms": opts.upstream_ms,
+            "value_bytes": opts.value_bytes,
+            "max_entries": opts.keys,
+        }
+        for i in range(workers)
+    ]
+    started = time.perf_counter()
+    with mp.get_context("spawn").Pool(workers) as pool:
+        results = pool.map(_worker, jobs)
+    wall = time.perf_counter() - started
+    timings = sorted(t for r in results for t in r["timings"])
+    lookups = len(timings)
+    return {
+        "backend": backend,
+        "workers": workers,
+        "lookups": lookups,
+        "hit_rate": round(sum(r["hits"] for r in results) / lookups, 3),
+        "upstream_calls": sum(r["upstream"] for r in results),
+        "get_p50_us": round(1e6 * statistics.median(timings), 1),
+        "get_p99_us": round(1e6 * timings[int(0.99 * (lookups - 1))], 1),
+        "wall_s": round(wall, 2),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--backends", nargs="+", default=["memory", "sqlite"])
+    parser.add_argument("--lookups", type=int, default=2000, help="consultas por worker")
+    parser.add_argument("--keys", type=int, default=2000)
+    parser.add_argument("--zipf", type=float, default=1.1)
+    parser.add_argument("--ttl", type=float, default=240.0)
+    parser.add_argument("--l1-ttl", type=float, default=5.0)
+    parser.add_argument("--upstream-ms", type=float, default=2.0)
+    parser.add_argument("--value-bytes", type=int, default=512)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="guarda los resultados en este fichero")
+    opts = parser.parse_args()
+
+    results = [run(b, w, opts) for w in opts.workers for b in opts.backends]
+
+    print(f"{opts.lookups} consultas/worker, {opts.keys} claves (Zipf s={opts.zipf}), upstream {opts.upstream_ms} ms\n")
+    print(f"{'workers':>7} {'backend':>8} {'aciertos':>9} {'upstream':>9} {'get p50':>10} {'get p99':>10} {'total':>8}")
+    for r in results:
+        print(
+            f"{r['workers']:>7} {r['backend']:>8} {r['hit_rate']:>9} {r['upstream_calls']:>9} "
+            f"{r['get_p50_us']:>7} µs {r['get_p99_us']:>7} µs {r['wall_s']:>6} s"
+        )
+    if opts.json:
+        with open(opts.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+Memoria del historial de conversación en el worker.
+
+Simula N conversaciones concurrentes de M mensajes cada una (por defecto 1000 x 200,
+textos distintos de --chars caracteres) y mide con tracemalloc lo que ocupa tenerlas
+en memoria con las dos representaciones:
+
+- messages: HumanMessage/AIMessage con response_metadata (la conversión anterior,
+  `to_langchain`);
+- records: HistoryRecord con __slots__ (app.agent.history_record).
+
+Informa la memoria total, por cada 1000 conversaciones y por mensaje sin contar el
+texto (que es igual en ambos casos), el tiempo de conversión desde MessageWire y lo
+que cuesta convertir una conversación a mensajes de LangChain en cada paso del modelo.
+
+Uso (desde la raíz del repo):
+    python benchmarks/history_memory.py
+    python benchmarks/history_memory.py --conversations 200 --messages 200 --json historial.json
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src")]
+
+from app.agent.history_record import HistoryRecord, to_messages  # noqa: E402
+from app.agent.ms_clients.history_client import to_langchain  # noqa: E402
+from app.schemas.history_schema import MessageWire  # noqa: E402
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def wires(conversation: int, messages: int, chars: int) -> List[MessageWire]:
+    base = "lorem ipsum " * (chars // 12 + 1)
+    return [
+        MessageWire(
+            message_id=f"conv-{conversation}-{i}",
+            message_type="INPUT" if i % 2 == 0 else "RESPONSE",
+            date_created=START + timedelta(seconds=i),
+            insight_id=f"conv-{conversation}",
+            message_text=f"{i} {base}"[:chars],
+        )
+        for i in range(messages)
+    ]
+
+
+def measure(convert: Callable[[MessageWire], Any], opts: argparse.Namespace) -> Dict[str, float]:
+    """Memoria retenida (bytes) y tiempo de convertir todas las conversaciones."""
+    gc.collect()
+    tracemalloc.start()
+    kept, text_bytes, elapsed = [], 0, 0.0
+    for c in range(opts.conversations):
+        batch = wires(c, opts.messages, opts.chars)
+        text_bytes += sum(sys.getsizeof(w.message_text) for w in batch)
+        started = time.perf_counter()
+        kept.append(tuple(convert(w) for w in batch))
+        elapsed += time.perf_counter() - started
+        del batch
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    n = opts.conversations * opts.messages
+    del kept
+    return {
+        "total_mb": round(current / 2**20, 1),
+        "mb_per_1k_conversations": round(current / 2**20 * 1000 / opts.conversations, 1),
+        "overhead_bytes_per_message": round((current - text_bytes) / n, 1),
+        "convert_us_per_message": round(1e6 * elapsed / n, 2),
+    }
+
+
+def boundary_cost(opts: argparse.Namespace) -> float:
+    """µs para convertir una conversación de registros a mensajes (una vez por paso)."""
+    records = [HistoryRecord.from_wire(w) for w in wires(0, opts.messages, opts.chars)]
+    rounds = 50
+    started = time.perf_counter()
+    for _ in range(rounds):
+        to_messages(records)
+    return round(1e6 * (time.perf_counter() - started) / rounds, 1)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--chars", type=int, default=200)
+    parser.add_argument("--json", help="guarda los resultados en este fichero")
+    opts = parser.parse_args()
+
+    results = {
+        "messages": measure(to_langchain, opts),
+        "records": measure(HistoryRecord.from_wire, opts),
+    }
+    step_us = boundary_cost(opts)
+
+    print(f"{opts.conversations} conversaciones x {opts.messages} mensajes de {opts.chars} caracteres\n")
+    print(f"{'representación':>15} {'total':>10} {'por 1k conv.':>13} {'overhead/msg':>13} {'conversión':>11}")
+    for name, r in results.items():
+        print(
+            f"{name:>15} {r['total_mb']:>7} MB {r['mb_per_1k_conversations']:>10} MB "
+            f"{r['overhead_bytes_per_message']:>11} B {r['convert_us_per_message']:>8} µs"
+        )
+    saved = 1 - results["records"]["total_mb"] / results["messages"]["total_mb"]
+    print(f"\nahorro: {100 * saved:.1f}%; registros -> mensajes por paso del modelo: {step_us} µs/conversación")
+    if opts.json:
+        with open(opts.json, "w") as f:
+            json.dump({**results, "boundary_us_per_conversation": step_us}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""
+Tiempo de importación del servicio (arranque en frío), medido con `python -X importtime`.
+
+Importa `main` en un intérprete nuevo varias veces y se queda con la ejecución más
+rápida (la primera suele pagar la compilación a .pyc). Informa el tiempo total, los
+paquetes que más pesan (tiempo propio sumado por paquete raíz) y falla (código 1) si:
+  - se importa al arrancar algún módulo de DEFERRED (debe cargarse en su primer uso),
+  - el total supera --budget-ms,
+  - el total es más lento que benchmarks/baselines/import_time.json * (1 + threshold).
+
+Uso (desde la raíz del repo):
+    python benchmarks/import_time.py                  # mide y compara con la baseline
+    python benchmarks/import_time.py --save           # actualiza la baseline
+    python benchmarks/import_time.py --budget-ms 2500 --top 20
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baselines", "import_time.json")
+
+TARGET = "main"
+# Dependencias opcionales o de caminos poco frecuentes: no deben cargarse al arrancar
+DEFERRED = ("langchain_tavily", "langchain.chat_models")
+
+
+@dataclass
+class ImportRecord:
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(stderr: str) -> List[ImportRecord]:
+    """Líneas 'import time: self | cumulative | nombre' (la indentación es la profundidad)."""
+    records = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # cabecera
+        raw_name = parts[2].rstrip()
+        name = raw_name.lstrip()
+        depth = (len(raw_name) - len(name) - 1) // 2
+        records.append(ImportRecord(name, int(parts[0]), int(parts[1]), depth))
+    return records
+
+
+def total_us(records: Sequence[ImportRecord]) -> int:
+    return sum(r.cumulative_us for r in records if r.depth == 0)
+
+
+def by_package(records: Sequence[ImportRecord]) -> Dict[str, int]:
+    """Tiempo propio (µs) sumado por paquete raíz, de mayor a menor."""
+    totals: Dict[str, int] = {}
+    for r in records:
+        root = r.name.split(".", 1)[0]
+        totals[root] = totals.get(root, 0) + r.self_us
+    return dict(sorted(totals.items(), key=lambda kv: -kv[1]))
+
+
+def deferred_violations(records: Sequence[ImportRecord], deferred: Sequence[str] = DEFERRED) -> List[str]:
+    names = {r.name for r in records}
+    return [m for m in deferred if m in names]
+
+
+def run_once(target: str = TARGET) -> List[ImportRecord]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (SRC, env.get("PYTHONPATH")) if p)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=SRC, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {target} failed:\n{proc.stderr[-2000:]}")
+    return parse_importtime(proc.stderr)
+
+
+def measure(runs: int, target: str = TARGET) -> List[ImportRecord]:
+    """La ejecución más rápida de `runs` intérpretes nuevos."""
+    best: Optional[List[ImportRecord]] = None
+    for _ in range(max(runs, 1)):
+        records = run_once(target)
+        if best is None or total_us(records) < total_us(best):
+            best = records
+    return best or []
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="paquetes a mostrar")
+    parser.add_argument("--budget-ms", type=float, default=None, help="presupuesto absoluto de importación")
+    parser.add_argument("--threshold", type=float, default=0.25, help="regresión si es >25%% más lento")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="guarda los resultados como baseline")
+    parser.add_argument("--json", dest="json_out", help="guarda los resultados en este fichero")
+    args = parser.parse_args(argv)
+
+    records = measure(args.runs)
+    total_ms = total_us(records) / 1000
+    packages = by_package(records)
+    violations = deferred_violations(records)
+
+    print(f"import {TARGET}: {total_ms:.1f} ms ({len(records)} módulos)")
+    for name, us in list(packages.items())[: args.top]:
+        print(f"  {name:<40} {us / 1000:8.1f} ms")
+
+    report: Dict[str, Any] = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "total_ms": round(total_ms, 1),
+        "modules": len(records),
+        "packages_ms": {k: round(v / 1000, 1) for k, v in list(packages.items())[: args.top]},
+        "deferred_violations": violations,
+    }
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    status = 0
+    if violations:
+        print(f"\nMódulos diferidos importados al arrancar: {', '.join(violations)}")
+        status = 1
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"\nPresupuesto superado: {total_ms:.1f} ms > {args.budget_ms:.1f} ms")
+        status = 1
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        base_ms = baseline.get("total_ms")
+        if base_ms:
+            ratio = total_ms / base_ms
+            regression = ratio > 1 + args.threshold
+            print(
+                f"\nBaseline {baseline.get('commit')}: {base_ms:.1f} ms -> {total_ms:.1f} ms  x{ratio:.2f}"
+                + (" REGRESIÓN" if regression else "")
+            )
+            if regression:
+                status = 1
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline guardada en {os.path.relpath(args.baseline, ROOT)}")
+        status = 1 if violations else 0
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+"""
+Prueba de carga del agente sin red corporativa.
+
+Arranca en local (127.0.0.1, puertos efímeros):
+  - un AI Core falso OpenAI-compatible con streaming SSE (TTFT, tokens/s y guion
+    Action / Final Answer configurables) y su login de AI Server,
+  - un MS de historial falso (get-user-messages-by-conversation-id),
+  - la app real (main.app) con la autenticación sustituida,
+y lanza /agent/react-run y /agent/react-stream con la concurrencia indicada.
+Informa p50/p95/p99 de TTFT (primer evento token del stream) y de latencia total,
+throughput y memoria por stream (crecimiento de RSS del proceso / streams en vuelo;
+cliente y servidor comparten proceso, así que es una cota superior).
+
+Uso (desde la raíz del repo):
+    python benchmarks/load_test.py --concurrency 32 --requests 500 --ttft 0.3 --tokens-per-s 40
+    python benchmarks/load_test.py --endpoint stream --scenario tool --json resultados.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import functools
+import json
+import os
+import sys
+import time
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "tests")]
+
+import httpx  # noqa: E402
+
+from fakes.aicore import FakeAICore, FakeAICoreConfig, FakeAIServerClient, fake_retrieve_credentials  # noqa: E402
+from fakes.history import FakeHistoryConfig, FakeHistoryMS  # noqa: E402
+from fakes.server import LocalServer  # noqa: E402
+
+PARAMS = {"feature": "bench", "model_id": "bench", "version": "1"}
+
+SCENARIOS = {
+    # Respuesta directa de ~60 tokens
+    "answer": ["Final Answer: " + " ".join(f"palabra{i}" for i in range(60))],
+    # Un paso de tool y luego respuesta final
+    "tool": [
+        'Action: get_horoscope\nAction Input: {"sign": "leo"}',
+        "Final Answer: " + " ".join(f"palabra{i}" for i in range(60)),
+    ],
+}
+
+
+@dataclass
+class Sample:
+    ok: bool
+    latency_s: float
+    ttft_s: Optional[float] = None
+    bytes: int = 0
+    error: Optional[str] = None
+
+
+@dataclass
+class Report:
+    endpoint: str
+    samples: List[Sample] = field(default_factory=list)
+    wall_s: float = 0.0
+    rss_growth_bytes: Optional[int] = None
+    concurrency: int = 1
+
+    def as_dict(self) -> Dict[str, object]:
+        ok = [s for s in self.samples if s.ok]
+        ttfts = [s.ttft_s for s in ok if s.ttft_s is not None]
+        errors: Dict[str, int] = {}
+        for s in self.samples:
+            if not s.ok:
+                errors[s.error or "unknown"] = errors.get(s.error or "unknown", 0) + 1
+        return {
+            "endpoint": self.endpoint,
+            "requests": len(self.samples),
+            "ok": len(ok),
+            "errors": errors,
+            "throughput_rps": round(len(ok) / self.wall_s, 2) if self.wall_s else None,
+            "latency_ms": _percentiles([s.latency_s for s in ok]),
+            "ttft_ms": _percentiles(ttfts) if ttfts else None,
+            "mem_per_stream_kb": (
+                round(self.rss_growth_bytes / self.concurrency / 1024, 1)
+                if self.rss_growth_bytes is not None
+                else None
+            ),
+        }
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    data = sorted(values)
+
+    def pick(q: float) -> float:
+        return round(data[min(len(data) - 1, int(q * len(data)))] * 1000, 1)
+
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": round(data[-1] * 1000, 1)}
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+async def _react_run(client: httpx.AsyncClient, i: int) -> Sample:
+    started = time.perf_counter()
+    resp = await client.post(
+        "/agent/react-run", params=PARAMS, json={"message": f"pregunta {i}", "session_id": f"bench-{i}"}
+    )
+    elapsed = time.perf_counter() - started
+    if resp.status_code != 200:
+        return Sample(False, elapsed, bytes=len(resp.content), error=f"http_{resp.status_code}")
+    return Sample(True, elapsed, bytes=len(resp.content))
+
+
+async def _react_stream(client: httpx.AsyncClient, i: int) -> Sample:
+    started = time.perf_counter()
+    ttft = None
+    n_bytes = 0
+    error = None
+    async with client.stream(
+        "POST", "/agent/react-stream", params=PARAMS, json={"message": f"pregunta {i}", "session_id": f"bench-{i}"}
+    ) as resp:
+        if resp.status_code != 200:
+            await resp.aread()
+            return Sample(False, time.perf_counter() - started, error=f"http_{resp.status_code}")
+        async for line in resp.aiter_lines():
+            n_bytes += len(line) + 1
+            if not line:
+                continue
+            event = json.loads(line)
+            kind = event.get("type")
+            if kind == "token" and ttft is None:
+                ttft = time.perf_counter() - started
+            elif kind == "error":
+                error = "stream_error: " + str((event.get("data") or {}).get("message"))[:120]
+    return Sample(error is None, time.perf_counter() - started, ttft_s=ttft, bytes=n_bytes, error=error)
+
+
+async def run_load(base_url: str, endpoint: str, requests: int, concurrency: int) -> Report:
+    call = _react_run if endpoint == "run" else _react_stream
+    report = Report(endpoint=f"react-{endpoint}", concurrency=concurrency)
+    counter = iter(range(requests))
+    peak_rss = baseline_rss = _rss_bytes()
+
+    async def worker(client: httpx.AsyncClient):
+        for i in counter:
+            try:
+                report.samples.append(await call(client, i))
+            except Exception as e:
+                report.samples.append(Sample(False, 0.0, error=type(e).__name__))
+
+    async def watch_rss():
+        nonlocal peak_rss
+        while True:
+            rss = _rss_bytes()
+            if rss is not None and peak_rss is not None:
+                peak_rss = max(peak_rss, rss)
+            await asyncio.sleep(0.05)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        watcher = asyncio.create_task(watch_rss())
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        report.wall_s = time.perf_counter() - started
+        watcher.cancel()
+    if baseline_rss is not None and peak_rss is not None:
+        report.rss_growth_bytes = peak_rss - baseline_rss
+    return report
+
+
+def _print_report(report: Dict[str, object]) -> None:
+    print(f"\n== {report['endpoint']} ==")
+    print(f"  peticiones: {report['requests']}  ok: {report['ok']}  errores: {report['errors'] or 0}")
+    print(f"  throughput: {report['throughput_rps']} req/s")
+    print(f"  latencia (ms): {report['latency_ms']}")
+    if report["ttft_ms"]:
+        print(f"  TTFT (ms): {report['ttft_ms']}")
+    if report["mem_per_stream_kb"] is not None:
+        print(f"  memoria por stream: {report['mem_per_stream_kb']} KB")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint", choices=["run", "stream", "both"], default="both")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="answer")
+    parser.add_argument("--ttft", type=float, default=0.2, help="segundos hasta el primer token")
+    parser.add_argument("--tokens-per-s", type=float, default=50.0)
+    parser.add_argument("--login-latency", type=float, default=0.05, help="login de AI Server (s)")
+    parser.add_argument("--credentials-latency", type=float, default=0.02, help="retrieve_credentials (s)")
+    parser.add_argument("--history-messages", type=int, default=10)
+    parser.add_argument("--history-latency", type=float, default=0.01)
+    parser.add_argument("--json", dest="json_out", help="guarda el informe en este fichero")
+    args = parser.parse_args(argv)
+
+    aicore = FakeAICore(
+        FakeAICoreConfig(
+            script=SCENARIOS[args.scenario],
+            script_by_turn=True,
+            ttft_s=args.ttft,
+            tokens_per_s=args.tokens_per_s or None,
+            login_s=args.login_latency,
+        )
+    )
+    history = FakeHistoryMS(FakeHistoryConfig(messages=args.history_messages, latency_s=args.history_latency))
+
+    with ExitStack() as stack:
+        aicore_srv = stack.enter_context(LocalServer(aicore.app))
+        history_srv = stack.enter_context(LocalServer(history.app))
+
+        from app.settings import settings_provider
+        from app.agent import aicore_langchain
+
+        original = settings_provider.current
+        settings_provider.swap(
+            original.model_copy(
+                update={"AICORE_URL": aicore_srv.url, "URL_HIST_CONV": "http://127.0.0.1", "HIST_CONV_PORT": str(history_srv.port)}
+            )
+        )
+        stack.callback(settings_provider.swap, original)
+        stack.enter_context(
+            mock.patch.object(
+                aicore_langchain,
+                "retrieve_credentials",
+                functools.partial(fake_retrieve_credentials, latency_s=args.credentials_latency),
+            )
+        )
+        stack.enter_context(mock.patch.object(aicore_langchain.ai_core, "AIServerClient", FakeAIServerClient))
+
+        from app.services.auth import authenticated_headers
+        from main import app
+
+        app.dependency_overrides[authenticated_headers] = lambda: {"Token": "bench", "IAG-App-Id": "bench"}
+        app_srv = stack.enter_context(LocalServer(app))
+
+        endpoints = ["run", "stream"] if args.endpoint == "both" else [args.endpoint]
+        results = []
+        for endpoint in endpoints:
+            report = asyncio.run(run_load(app_srv.url, endpoint, args.requests, args.concurrency)).as_dict()
+            _print_report(report)
+            results.append(report)
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2, ensure_ascii=False)
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,303 @@
+"""
+Micro-benchmarks de las funciones puras del hot path del agente.
+
+Cada caso mide una función con entradas realistas y adversarias de tamaño creciente
+(de 1 KB a 1 MB de salida del modelo, salidas de tool profundas...). El tiempo por
+llamada es el mínimo de varias repeticiones calibradas (timeit). Si el crecimiento
+observado predice que el siguiente tamaño tardaría más de --max-call-s por llamada
+(p.ej. backtracking cuadrático de una regex), ese tamaño se marca como "skipped".
+
+Los resultados se comparan con benchmarks/baselines/micro.json (generado con --save
+en otro commit de la misma máquina): un caso más lento que baseline * (1 + threshold)
+es una regresión y el comando termina con código 1.
+
+Uso (desde la raíz del repo):
+    python benchmarks/micro.py                    # ejecuta y compara con la baseline
+    python benchmarks/micro.py --save             # actualiza la baseline
+    python benchmarks/micro.py --filter extract --quick
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import timeit
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src")]
+
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage  # noqa: E402
+
+from app.agent.ms_clients.history_client import to_langchain  # noqa: E402
+from app.agent.utils import (  # noqa: E402
+    _best_effort_json,
+    build_forced_tool_prompt,
+    extract_toolcall_array,
+    normalize_ai_toolcalls,
+    parse_forced_tool_or_answer,
+)
+from app.routes.agent import _event_to_wire, _msg_to_text  # noqa: E402
+from app.schemas.history_schema import MessageWire  # noqa: E402
+
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baselines", "micro.json")
+
+KB = 1024
+SIZES = (1 * KB, 16 * KB, 128 * KB, 1024 * KB)
+
+
+# ----------------------------------------------------------------- entradas
+
+
+def _prose(n: int) -> str:
+    base = "El resultado de la consulta indica que el cliente tiene tres productos activos. "
+    return (base * (n // len(base) + 1))[:n]
+
+
+def final_answer_text(n: int) -> str:
+    return "Final Answer: " + _prose(n)
+
+
+def action_text(n: int) -> str:
+    args = json.dumps({"query": _prose(max(n - 60, 1)), "top_k": 5}, ensure_ascii=False)
+    return f"Action: search_documents\nAction Input: {args}"
+
+
+def no_marker_text(n: int) -> str:
+    # Adversaria: ni Final Answer ni Action Input, con muchos "Action:" sueltos
+    chunk = "Action: pensando en voz alta sin formato. "
+    return (chunk * (n // len(chunk) + 1))[:n]
+
+
+def json_object_text(n: int) -> str:
+    return json.dumps({"items": [{"id": i, "text": "x" * 40} for i in range(max(n // 60, 1))]})
+
+
+def unclosed_json_text(n: int) -> str:
+    # Adversaria: empieza como objeto y nunca se cierra
+    return "{" + '"k": "v", ' * (n // 10)
+
+
+def toolcall_array_text(n: int) -> str:
+    call = {"id": "call_1", "type": "function", "name": "get_horoscope", "arguments": '{"sign": "Virgo"}'}
+    prefix = _prose(max(n - 120, 0))
+    return prefix + json.dumps([call])
+
+
+def unclosed_toolcall_array_text(n: int) -> str:
+    # Adversaria: muchos '[{"id"' sin '}]' de cierre -> la regex perezosa DOTALL
+    # reintenta desde cada apertura hasta el final del texto.
+    chunk = '[{"id": "call", "name": "x" '
+    return (chunk * (n // len(chunk) + 1))[:n]
+
+
+def stream_event(n: int) -> Dict[str, Any]:
+    return {
+        "event": "on_chat_model_stream",
+        "name": "ChatOpenAI",
+        "run_id": "run-1",
+        "data": {"chunk": AIMessageChunk(content=_prose(n))},
+    }
+
+
+def _deep(depth: int, width: int, leaf: Any) -> Any:
+    node: Any = leaf
+    for i in range(depth):
+        node = {f"k{j}": (node if j == 0 else [leaf] * 3) for j in range(width)} if i % 2 else [node, leaf]
+    return node
+
+
+def deep_tool_output(n: int) -> Dict[str, Any]:
+    leaf = "valor de ejemplo"
+    width = max(n // 1024, 1)
+    return {"results": [_deep(20, 3, leaf) for _ in range(width)], "message": ToolMessage(content="ok", tool_call_id="c1")}
+
+
+def tool_end_event(n: int) -> Dict[str, Any]:
+    return {
+        "event": "on_tool_end",
+        "name": "search_documents",
+        "run_id": "run-2",
+        "data": {"input": {"query": "q"}, "output": ToolMessage(content=_prose(n), tool_call_id="c1")},
+    }
+
+
+def message_wire(n: int) -> MessageWire:
+    return MessageWire(
+        message_id="m-1",
+        message_type="RESPONSE",
+        date_created=datetime(2024, 1, 1, tzinfo=timezone.utc),
+        insight_id="conv-1",
+        message_text=_prose(n),
+    )
+
+
+def tool_functions(n: int) -> List[Callable[..., Any]]:
+    tools = []
+    for i in range(n):
+        def tool(arg: str) -> str:
+            return arg
+        tool.__name__ = f"tool_{i}"
+        tool.__doc__ = f"Herramienta sintética número {i}: " + _prose(120)
+        tools.append(tool)
+    return tools
+
+
+# ------------------------------------------------------------------- casos
+
+
+@dataclass
+class Case:
+    name: str
+    fn: Callable[[Any], Any]
+    make_input: Callable[[int], Any]
+    sizes: Sequence[int] = SIZES
+    unit: str = "B"
+
+
+CASES: List[Case] = [
+    Case("parse_forced/final_answer", parse_forced_tool_or_answer, final_answer_text),
+    Case("parse_forced/action", parse_forced_tool_or_answer, action_text),
+    Case("parse_forced/no_marker", parse_forced_tool_or_answer, no_marker_text),
+    Case("best_effort_json/object", _best_effort_json, json_object_text),
+    Case("best_effort_json/unclosed", _best_effort_json, unclosed_json_text),
+    Case("extract_json_array/embedded", extract_toolcall_array, toolcall_array_text),
+    Case("extract_json_array/unclosed", extract_toolcall_array, unclosed_toolcall_array_text),
+    Case("normalize_toolcalls/embedded", normalize_ai_toolcalls, lambda n: AIMessage(content=toolcall_array_text(n))),
+    Case(
+        "normalize_toolcalls/unclosed",
+        normalize_ai_toolcalls,
+        lambda n: AIMessage(content=unclosed_toolcall_array_text(n)),
+    ),
+    Case("event_to_wire/token", _event_to_wire, stream_event, sizes=(16, 1 * KB, 16 * KB)),
+    Case("event_to_wire/tool_end", _event_to_wire, tool_end_event),
+    Case("msg_to_text/deep_tool_output", _msg_to_text, deep_tool_output),
+    Case("to_langchain/message", to_langchain, message_wire),
+    Case("build_forced_tool_prompt", build_forced_tool_prompt, tool_functions, sizes=(1, 10, 50, 200), unit="tools"),
+]
+
+
+# ------------------------------------------------------------------ medición
+
+
+def time_per_call(fn: Callable[[Any], Any], arg: Any, *, min_run_s: float = 0.05, repeat: int = 5) -> float:
+    timer = timeit.Timer(lambda: fn(arg))
+    number, elapsed = 1, timer.timeit(1)
+    while elapsed < min_run_s and number < 1_000_000:
+        number *= 10 if elapsed < min_run_s / 10 else 2
+        elapsed = timer.timeit(number)
+    runs = timer.repeat(repeat=repeat, number=number) if elapsed < 1.0 else [elapsed]
+    return min(runs) / number
+
+
+def run_case(case: Case, sizes: Sequence[int], max_call_s: float) -> Dict[str, Dict[str, Any]]:
+    results: Dict[str, Dict[str, Any]] = {}
+    prev: Optional[tuple] = None
+    exponent = 1.0
+    for size in sizes:
+        key = f"{case.name}@{size}{case.unit}"
+        if prev is not None:
+            predicted = prev[1] * (size / prev[0]) ** exponent
+            if predicted > max_call_s:
+                results[key] = {"skipped": f"predicted {predicted:.1f}s per call"}
+                continue
+        seconds = time_per_call(case.fn, case.make_input(size))
+        if prev is not None and prev[1] > 0:
+            exponent = max(1.0, math.log(seconds / prev[1]) / math.log(size / prev[0]))
+        prev = (size, seconds)
+        results[key] = {"seconds": seconds}
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Any], threshold: float, floor_s: float = 1e-6):
+    """Devuelve [(clave, baseline_s, actual_s, ratio, regresión)] de los casos medidos en ambos."""
+    rows = []
+    for key, res in results.items():
+        base = (baseline.get("results") or {}).get(key) or {}
+        if "seconds" not in res or "seconds" not in base:
+            continue
+        ratio = res["seconds"] / base["seconds"] if base["seconds"] else float("inf")
+        regression = ratio > 1 + threshold and res["seconds"] - base["seconds"] > floor_s
+        rows.append((key, base["seconds"], res["seconds"], ratio, regression))
+    return rows
+
+
+def _fmt_s(s: float) -> str:
+    if s < 1e-3:
+        return f"{s * 1e6:.1f} µs"
+    if s < 1:
+        return f"{s * 1e3:.2f} ms"
+    return f"{s:.2f} s"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", default="", help="solo casos cuyo nombre contenga este texto")
+    parser.add_argument("--quick", action="store_true", help="solo tamaños pequeños (CI)")
+    parser.add_argument("--max-call-s", type=float, default=2.0)
+    parser.add_argument("--threshold", type=float, default=0.25, help="regresión si es >25%% más lento")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="guarda los resultados como baseline")
+    parser.add_argument("--json", dest="json_out", help="guarda los resultados en este fichero")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for case in CASES:
+        if args.filter not in case.name:
+            continue
+        sizes = case.sizes[:2] if args.quick else case.sizes
+        for key, res in run_case(case, sizes, args.max_call_s).items():
+            results[key] = res
+            print(f"{key:<52} {_fmt_s(res['seconds']) if 'seconds' in res else res['skipped']}")
+
+    report = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "results": results,
+    }
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    status = 0
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline, args.threshold)
+        if rows:
+            print(f"\nComparación con baseline {baseline.get('commit')} (umbral +{args.threshold:.0%}):")
+        for key, base_s, cur_s, ratio, regression in rows:
+            mark = "REGRESIÓN" if regression else ""
+            print(f"{key:<52} {_fmt_s(base_s):>10} -> {_fmt_s(cur_s):>10}  x{ratio:.2f} {mark}")
+            if regression:
+                status = 1
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline guardada en {os.path.relpath(args.baseline, ROOT)}")
+        status = 0
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
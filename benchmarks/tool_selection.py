@@ -0,0 +1,152 @@
+"""
+Ahorro de tokens de la selección de tools por turno.
+
+Genera catálogos sintéticos de tools bancarias (dominio x operación, con descripciones
+de longitud realista) de 10, 50 y 200 tools y, para una muestra de peticiones de
+usuario dirigidas a una tool concreta, compara el prompt del protocolo con el catálogo
+completo frente al de las TOOL_SELECTION_TOP_K tools elegidas por el índice local:
+
+- tokens del prompt (media) con todas las tools y con la selección, y el ahorro;
+- recall@k: fracción de peticiones en las que la tool buscada está entre las ofrecidas;
+- coste de la selección por paso (índice ya construido).
+
+Los tokens se cuentan con tiktoken si la codificación está disponible y, si no, con la
+estimación por longitud (se indica en la salida).
+
+Uso (desde la raíz del repo):
+    python benchmarks/tool_selection.py
+    python benchmarks/tool_selection.py --sizes 10 50 200 --top-k 5 --json seleccion.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src")]
+
+from app.agent.tokens import tokenizer  # noqa: E402
+from app.agent.tool_executor import ToolExecutor  # noqa: E402
+from app.agent.tool_registry import ToolRegistry  # noqa: E402
+from app.settings import settings, settings_provider  # noqa: E402
+
+DOMAINS = [
+    ("cuenta", "cuentas corrientes y de ahorro del cliente"),
+    ("tarjeta", "tarjetas de débito y crédito"),
+    ("prestamo", "préstamos personales y al consumo"),
+    ("hipoteca", "hipotecas y financiación de vivienda"),
+    ("seguro", "pólizas de seguro de hogar, vida y coche"),
+    ("fondo", "fondos de inversión y planes de pensiones"),
+    ("transferencia", "transferencias nacionales e internacionales"),
+    ("recibo", "recibos domiciliados y adeudos"),
+    ("bizum", "pagos entre particulares con Bizum"),
+    ("oficina", "oficinas, cajeros y citas presenciales"),
+    ("nomina", "nóminas y pensiones domiciliadas"),
+    ("divisa", "cambio de divisas y cotizaciones"),
+    ("bolsa", "compraventa de acciones y valores"),
+    ("deposito", "depósitos a plazo fijo"),
+    ("factura", "facturas y justificantes de pago"),
+    ("impuesto", "impuestos, tributos y certificados fiscales"),
+    ("alerta", "alertas y notificaciones configuradas"),
+    ("perfil", "datos personales y de contacto del cliente"),
+    ("fraude", "operaciones sospechosas y fraude"),
+    ("gasto", "análisis y categorización de gastos"),
+]
+OPERATIONS = [
+    ("consultar", "Consulta el estado y el detalle de", "¿Cuál es el estado de mi {d}?"),
+    ("listar", "Lista los movimientos y operaciones recientes de", "Enséñame los últimos movimientos de la {d}"),
+    ("bloquear", "Bloquea temporalmente o cancela", "Quiero bloquear mi {d} ya"),
+    ("simular", "Simula condiciones, cuotas e intereses de", "Simula cuánto pagaría por una {d}"),
+    ("contratar", "Inicia la contratación de", "Me gustaría contratar una {d} nueva"),
+    ("modificar", "Modifica límites y condiciones de", "Cambia el límite de mi {d}"),
+    ("descargar", "Descarga certificados y extractos en PDF de", "Descarga el extracto en PDF de la {d}"),
+    ("notificar", "Configura avisos sobre", "Avísame cuando haya cambios en mi {d}"),
+    ("comparar", "Compara productos y comisiones de", "Compara comisiones de {d} de otros bancos"),
+    ("reclamar", "Abre una reclamación sobre", "Quiero reclamar un cargo de la {d}"),
+]
+FILLER = (
+    " Requiere el identificador del cliente y devuelve un JSON con los campos relevantes;"
+    " respeta los permisos de la aplicación que llama."
+)
+
+
+def catalogue(n: int) -> List[Tuple[str, str, str]]:
+    """n tools (nombre, descripción, petición de ejemplo) repartidas por dominio y operación."""
+    pairs = [(d, o) for o in OPERATIONS for d in DOMAINS][:n]
+    return [
+        (f"{op}_{dom}", f"{verb} {desc}.{FILLER}", question.format(d=dom.replace("_", " ")))
+        for (dom, desc), (op, verb, question) in pairs
+    ]
+
+
+def _set_top_k(top_k: int) -> None:
+    settings_provider.swap(settings_provider.current.model_copy(update={"TOOL_SELECTION_TOP_K": top_k}))
+
+
+def run_size(n: int, top_k: int, queries: int, rng: random.Random) -> Dict[str, Any]:
+    tools = catalogue(n)
+    config = {name: {"target": f"benchmarks.synthetic:{name}", "description": desc} for name, desc, _ in tools}
+    registry = ToolRegistry.discover(config, executor=ToolExecutor())
+
+    _set_top_k(0)
+    _, full_prompt = registry.select(None, "warm")
+    full_tokens = tokenizer.count(full_prompt)
+
+    _set_top_k(top_k)
+    registry.select(None, "warm-up del índice")
+    hits, selected_tokens, elapsed = 0, 0, 0.0
+    sample = [rng.choice(tools) for _ in range(queries)]
+    for name, _, question in sample:
+        started = time.perf_counter()
+        offered, prompt = registry.select(None, question)
+        elapsed += time.perf_counter() - started
+        hits += name in offered
+        selected_tokens += tokenizer.count(prompt)
+
+    selected_avg = selected_tokens / queries
+    return {
+        "tools": n,
+        "top_k": top_k,
+        "full_prompt_tokens": full_tokens,
+        "selected_prompt_tokens": round(selected_avg, 1),
+        "saved_tokens": round(full_tokens - selected_avg, 1),
+        "saved_pct": round(100 * (1 - selected_avg / full_tokens), 1),
+        "recall_at_k": round(hits / queries, 3),
+        "select_us": round(1e6 * elapsed / queries, 1),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--top-k", type=int, default=settings.TOOL_SELECTION_TOP_K or 8)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="guarda los resultados en este fichero")
+    args = parser.parse_args()
+
+    tokenizer.load()
+    rng = random.Random(args.seed)
+    results = [run_size(n, args.top_k, args.queries, rng) for n in args.sizes]
+
+    counter = f"tiktoken {tokenizer.encoding_name}" if tokenizer.exact else "estimación ~4 caracteres/token"
+    print(f"Tokens contados con {counter}; top-k = {args.top_k}, {args.queries} peticiones por tamaño\n")
+    print(f"{'tools':>6} {'prompt completo':>16} {'prompt top-k':>13} {'ahorro':>14} {'recall@k':>9} {'selección':>11}")
+    for r in results:
+        print(
+            f"{r['tools']:>6} {r['full_prompt_tokens']:>16} {r['selected_prompt_tokens']:>13} "
+            f"{r['saved_tokens']:>8} ({r['saved_pct']:>4}%) {r['recall_at_k']:>9} {r['select_us']:>8} µs"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"tokenizer": counter, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
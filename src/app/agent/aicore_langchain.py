@@ -1,36 +1,194 @@
 from __future__ import annotations
+import asyncio
 import httpx
-from typing import Dict
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Set, Tuple
 from langchain_openai import ChatOpenAI
 
 from qgdiag_lib_arquitectura.utilities.ai_core import ai_core
 from qgdiag_lib_arquitectura.utilities.ai_core.ai_core import retrieve_credentials
 
-async def get_openai_compatible_chat(*, headers: Dict[str, str], base_url: str, engine_id: str) -> ChatOpenAI:
+from app.services.cache import CacheNamespace, MemoryCache, fingerprint
+from app.services.metrics import CREDENTIALS_LATENCY, LOGIN_LATENCY
+from app.settings import settings, settings_provider
+
+
+@dataclass(frozen=True)
+class AICoreSession:
+    """Credenciales + cookies de sesión de AI Server, reutilizables entre llamadas al modelo."""
+    access_key: str
+    secret_key: str
+    cookies: Any
+    base_url: str
+
+
+# Pools de conexiones compartidos por base_url. Cada sesión crea un cliente ligero
+# (con sus cookies) sobre el mismo transport, así no se repite el handshake TLS.
+_TRANSPORTS: Dict[str, Tuple[httpx.HTTPTransport, httpx.AsyncHTTPTransport]] = {}
+# URLs retiradas (AICORE_URL cambió) y sus pools mientras se drenan. Las peticiones
+# fijadas a la instantánea anterior siguen usando ese pool en lugar de crear otro.
+_RETIRED: Set[str] = set()
+_DRAINING: Dict[str, Tuple[httpx.HTTPTransport, httpx.AsyncHTTPTransport]] = {}
+
+
+def _shared_transports(base_url: str) -> Tuple[httpx.HTTPTransport, httpx.AsyncHTTPTransport]:
+    transports = _TRANSPORTS.get(base_url)
+    if transports is None and base_url in _RETIRED:
+        # Ya cerrado el pool: uno propio del cliente, que no entra en el reparto
+        return _DRAINING.get(base_url) or (httpx.HTTPTransport(), httpx.AsyncHTTPTransport())
+    if transports is None:
+        transports = (httpx.HTTPTransport(), httpx.AsyncHTTPTransport())
+        _TRANSPORTS[base_url] = transports
+    return transports
+
+
+def retire_transports(base_url: str, grace_s: float) -> bool:
     """
-    Build a ChatOpenAI instance against AI Server's OpenAI-compatible endpoint.
-    - Retrieves credentials via your standard flow (headers → keys)
-    - Logs into AI Server to get cookies and reuses them on the http_client
-    - Returns a ChatOpenAI bound to <base_url>/model/openai with model=<engine_id>
+    Saca del reparto el pool de base_url (p.ej. AICORE_URL ha cambiado). Las peticiones
+    en curso conservan sus clientes; el pool se cierra pasados `grace_s` segundos.
     """
-    # 1) Get keys from your microservice
+    transports = _TRANSPORTS.pop(base_url, None)
+    if transports is None:
+        return False
+    _RETIRED.add(base_url)
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return True  # sin loop (scripts/tests): lo cerrará el recolector
+    _DRAINING[base_url] = transports
+    sync_transport, async_transport = transports
+
+    def _close() -> None:
+        if _DRAINING.get(base_url) is transports:
+            del _DRAINING[base_url]
+        sync_transport.close()
+        loop.create_task(async_transport.aclose())
+
+    loop.call_later(grace_s, _close)
+    return True
+
+
+def _on_settings_change(old, new, changed) -> None:
+    if "AICORE_URL" in changed:
+        _RETIRED.discard(new.AICORE_URL)  # vuelve a ser la vigente: pool compartido nuevo
+        retire_transports(old.AICORE_URL, grace_s=new.REQUEST_TIMEOUT_MAX_S)
+    if "AICORE_SESSION_CACHE_TTL_S" in changed:
+        _SESSIONS.ttl_s = _SECRETS.ttl_s = new.AICORE_SESSION_CACHE_TTL_S
+
+
+settings_provider.subscribe(_on_settings_change)
+
+
+async def warm_connection_pool(base_url: str, *, connections: int = 1, timeout: float = 10.0) -> int:
+    """
+    Abre `connections` conexiones (DNS + TCP + TLS) en el pool compartido de base_url
+    para que la primera petición real no pague el handshake. Cualquier respuesta HTTP
+    vale: solo interesa la conexión. Devuelve cuántas se abrieron.
+    """
+    _, async_transport = _shared_transports(base_url)
+    # Sin 'async with': cerrar el cliente cerraría también el transport compartido
+    client = httpx.AsyncClient(transport=async_transport, timeout=timeout)
+    results = await asyncio.gather(*(client.get(base_url) for _ in range(connections)), return_exceptions=True)
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if len(errors) == len(results):
+        raise errors[0]
+    return len(results) - len(errors)
 
+
+# Sesión por cabeceras del llamante. En la caché compartida (con CACHE_BACKEND=sqlite
+# la ven todos los workers del nodo) solo van access_key y cookies: otro worker se
+# ahorra el login. La secret_key nunca sale del proceso; sin ella en este worker se
+# vuelven a pedir las credenciales, pero no se repite el login.
+_SESSIONS = CacheNamespace("aicore_session", settings.AICORE_SESSION_CACHE_TTL_S)
+_SECRETS = CacheNamespace("aicore_secret", settings.AICORE_SESSION_CACHE_TTL_S, MemoryCache(settings.CACHE_MAX_ENTRIES))
+
+
+def _cookies_to_dict(cookies: Any) -> Optional[Dict[str, str]]:
+    if cookies is None:
+        return None
+    if hasattr(cookies, "get_dict"):  # RequestsCookieJar
+        return cookies.get_dict()
+    if hasattr(cookies, "items"):  # httpx.Cookies, dict
+        return dict(cookies.items())
+    return {c.name: c.value for c in cookies}  # CookieJar
+
+
+async def invalidate_aicore_session(headers: Dict[str, str], base_url: str) -> None:
+    """Descarta la sesión cacheada (p.ej. AI Core la ha rechazado con 401/403)."""
+    key = fingerprint(headers, base_url)
+    _SECRETS.delete(key)
+    await _SESSIONS.adelete(key)
+
+
+async def open_aicore_session(*, headers: Dict[str, str], base_url: str) -> AICoreSession:
+    """
+    Retrieves credentials via your standard flow (headers → keys) and logs into
+    AI Server to get the cookie session. The session is cached for
+    AICORE_SESSION_CACHE_TTL_S (see app.services.cache).
+    """
+    key = fingerprint(headers, base_url)
+    cached = await _SESSIONS.aget(key)
+    secret_key = _SECRETS.get(key) if cached is not None else None
+    if secret_key is not None:
+        return AICoreSession(
+            access_key=cached["access_key"], secret_key=secret_key, cookies=cached["cookies"], base_url=base_url
+        )
+
+    # 1) Get keys from your microservice
+    started = time.perf_counter()
     access_key, secret_key = await retrieve_credentials(headers)
+    CREDENTIALS_LATENCY.observe(time.perf_counter() - started)
+    _SECRETS.set(key, secret_key)
+    if cached is not None and cached["access_key"] == access_key:
+        # Otro worker ya hizo login con estas credenciales: se reutilizan sus cookies
+        return AICoreSession(access_key=access_key, secret_key=secret_key, cookies=cached["cookies"], base_url=base_url)
 
-    # 2) Login to AI Server to get cookie session
-    server = ai_core.AIServerClient(access_key=access_key, secret_key=secret_key, base=base_url)
+    # 2) Login to AI Server to get cookie session. AIServerClient hace el login con
+    # una llamada HTTP síncrona: en un hilo, para no bloquear el event loop.
+    started = time.perf_counter()
+    server = await asyncio.to_thread(
+        ai_core.AIServerClient, access_key=access_key, secret_key=secret_key, base=base_url
+    )
+    LOGIN_LATENCY.observe(time.perf_counter() - started)
+    cookies = _cookies_to_dict(server.cookies)
+    await _SESSIONS.aset(key, {"access_key": access_key, "cookies": cookies})
+    return AICoreSession(access_key=access_key, secret_key=secret_key, cookies=cookies, base_url=base_url)
 
-    http_client = httpx.Client()
-    http_client.cookies = server.cookies
 
-    openai_api_key = f"{access_key}:{secret_key}"
-    openai_endpoint = f"{base_url}/model/openai"
+def build_chat(session: AICoreSession, engine_id: str, *, timeout: Optional[float] = None) -> ChatOpenAI:
+    """
+    Returns a ChatOpenAI bound to <base_url>/model/openai with model=<engine_id>,
+    reusing the session cookies and the shared connection pool for base_url.
+    `timeout` caps each HTTP request (normally the remaining request budget).
+    """
+    sync_transport, async_transport = _shared_transports(session.base_url)
+    http_client = httpx.Client(transport=sync_transport, cookies=session.cookies)
+    http_async_client = httpx.AsyncClient(transport=async_transport, cookies=session.cookies)
 
-    # 3) Return LangChain chat model using OpenAI-compatible endpoint
     return ChatOpenAI(
-        openai_api_key=openai_api_key,
+        openai_api_key=f"{session.access_key}:{session.secret_key}",
         model=engine_id,
-        base_url=openai_endpoint,
+        base_url=f"{session.base_url}/model/openai",
         http_client=http_client,
-        streaming=True
+        http_async_client=http_async_client,
+        timeout=timeout,
+        # Los reintentos los gestiona ResilientChatInvoker (TTFT, hedging y breaker)
+        max_retries=0,
+        streaming=True,
+        # usage de tokens en el último chunk del stream (AIMessageChunk.usage_metadata)
+        stream_usage=settings.AICORE_STREAM_USAGE,
     )
+
+
+async def get_openai_compatible_chat(
+    *, headers: Dict[str, str], base_url: str, engine_id: str, timeout: Optional[float] = None
+) -> ChatOpenAI:
+    """
+    Build a ChatOpenAI instance against AI Server's OpenAI-compatible endpoint.
+    - Retrieves credentials via your standard flow (headers → keys)
+    - Logs into AI Server to get cookies and reuses them on the http clients
+    - Returns a ChatOpenAI bound to <base_url>/model/openai with model=<engine_id>
+    """
+    session = await open_aicore_session(headers=headers, base_url=base_url)
+    return build_chat(session, engine_id, timeout=timeout)
@@ -2,11 +2,13 @@ from __future__ import annotations
 
 import os
 from dataclasses import dataclass, field, fields
-from typing import Annotated, Dict, Optional
+from typing import Annotated, Any, Dict, Optional
 from app.settings import settings
 
 
 SYSTEM_PROMPT = """You are a helpful AI assistant"""
+# Engine del turno sintético del warm-up: no cuenta consumo ni estadísticas del router
+WARMUP_ENGINE_ID = "warmup-noop"
 
 @dataclass(kw_only=True)
 class Context:
@@ -16,7 +18,9 @@ class Context:
         default=SYSTEM_PROMPT,
         metadata={"description": "System prompt for the agent."},
     )
-    engine_id: str = ""
+    engine_id: str = ""  # engine por defecto si el router no tiene pool para feature/model_id
+    feature: Optional[str] = field(default=None)
+    model_id: Optional[str] = field(default=None)
     max_search_results: int = field(
         default=10,
         metadata={"description": "Max Tavily results."},
@@ -28,6 +32,16 @@ class Context:
     history_max_messages: int = field(default=40)
     conversation_id: Optional[str] = field(default=None)
     raw_app_id: Optional[str] = field(default=None)  # para validaciones del MS de historial
+    # Sesión de AI Core ya abierta (p.ej. compartida por un lote); si es None, call_model hace login
+    aicore_session: Optional[Any] = field(default=None)
+    # Chat ya construido (p.ej. el engine no-op del warm-up); si se indica, call_model no hace login
+    chat_model: Optional[Any] = field(default=None)
+    # Deadline absoluto (time.monotonic()) de la petición; None = sin límite
+    deadline: Optional[float] = field(default=None)
+    # Guardrails del turno (app.agent.guardrails.GuardrailsRun), lo crea el nodo guard_input
+    guardrails_run: Optional[Any] = field(default=None)
+    # Si el modelo pide una tool que no se le ofreció, el resto del turno ve el catálogo completo
+    all_tools: bool = field(default=False)
 
     def __post_init__(self) -> None:
         for f in fields(self):
@@ -35,3 +49,8 @@ class Context:
                 continue
             if getattr(self, f.name) == f.default:
                 setattr(self, f.name, os.environ.get(f.name.upper(), f.default))
+
+    @property
+    def synthetic(self) -> bool:
+        """Turno del warm-up contra el engine no-op (sin modelo real detrás)."""
+        return self.chat_model is not None and self.engine_id == WARMUP_ENGINE_ID
@@ -0,0 +1,47 @@
+# app/agent/deadline.py
+"""
+Presupuesto de tiempo por petición.
+
+El endpoint fija un deadline absoluto (time.monotonic()) en el Context y cada nodo
+del grafo consume del tiempo que queda: si se agota, el nodo corta su trabajo y
+devuelve un resultado parcial o una respuesta controlada en lugar de quedarse colgado.
+"""
+from __future__ import annotations
+import time
+from typing import Optional
+
+DEADLINE_ANSWER = (
+    "No he podido completar la respuesta a tiempo. Por favor, inténtalo de nuevo en unos instantes."
+)
+
+
+def deadline_after(timeout_s: Optional[float]) -> Optional[float]:
+    """Convierte un timeout relativo en un deadline absoluto (None = sin límite)."""
+    if timeout_s is None:
+        return None
+    return time.monotonic() + timeout_s
+
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    """Segundos que quedan hasta el deadline (nunca negativo). None si no hay deadline."""
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def expired(deadline: Optional[float]) -> bool:
+    left = remaining(deadline)
+    return left is not None and left <= 0.0
+
+
+def budget(deadline: Optional[float], cap: Optional[float] = None) -> Optional[float]:
+    """
+    Tiempo disponible para una operación: lo que quede del deadline, acotado por `cap`
+    (el timeout propio de la dependencia). None si no hay ningún límite.
+    """
+    left = remaining(deadline)
+    if left is None:
+        return cap
+    if cap is None:
+        return left
+    return min(left, cap)
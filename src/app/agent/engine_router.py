@@ -0,0 +1,144 @@
+# app/agent/engine_router.py
+"""
+Enrutado de peticiones entre engines de AI Core.
+
+Cada (feature, model_id) se resuelve a un pool de engines (ENGINE_POOLS); dentro del
+pool se elige con "power of two choices" sobre una puntuación que combina la EWMA de
+TTFT y la EWMA de tasa de error de cada engine, descartando los que tienen el circuit
+breaker abierto. Los turnos sencillos (resumir el resultado de una tool) van al pool
+SUMMARY_ENGINE_POOL si está configurado, normalmente un engine más barato y rápido.
+"""
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from app.agent.resilience import breaker_for
+from app.settings import settings, settings_provider
+
+# Penalización de la tasa de error sobre el TTFT: con un 50% de errores el engine "parece" 3x más lento
+ERROR_PENALTY = 4.0
+
+
+@dataclass
+class EngineStats:
+    ttft_ewma_s: Optional[float] = None
+    error_ewma: float = 0.0
+    samples: int = 0
+
+
+@dataclass
+class RouteDecision:
+    engine_id: str
+    pool: List[str]
+    reason: str
+    scores: Dict[str, Optional[float]] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"engine_id": self.engine_id, "pool": self.pool, "reason": self.reason, "scores": self.scores}
+
+
+class EngineRouter:
+    def __init__(
+        self,
+        *,
+        default_engine: str,
+        pools: Optional[Dict[str, List[str]]] = None,
+        summary_pool: Optional[List[str]] = None,
+        alpha: float = 0.2,
+        rng: Optional[random.Random] = None,
+    ):
+        self.configure(default_engine=default_engine, pools=pools, summary_pool=summary_pool, alpha=alpha)
+        self.stats: Dict[str, EngineStats] = {}
+        self._rng = rng or random.Random()
+
+    def configure(
+        self,
+        *,
+        default_engine: str,
+        pools: Optional[Dict[str, List[str]]] = None,
+        summary_pool: Optional[List[str]] = None,
+        alpha: float = 0.2,
+    ) -> None:
+        """Sustituye pools y engine por defecto; las estadísticas por engine se conservan."""
+        self.default_engine = default_engine
+        self.pools = {k: list(v) for k, v in (pools or {}).items() if v}
+        self.summary_pool = list(summary_pool or [])
+        self.alpha = alpha
+
+    @classmethod
+    def from_settings(cls, cfg=settings) -> "EngineRouter":
+        return cls(**_routing_from(cfg))
+
+    def pool_for(self, feature: Optional[str], model_id: Optional[str], default_engine: Optional[str] = None) -> List[str]:
+        """Resuelve el pool: 'feature/model_id' > 'model_id' > 'feature' > engine por defecto."""
+        for key in (f"{feature}/{model_id}", model_id, feature):
+            if key and key in self.pools:
+                return self.pools[key]
+        return [default_engine or self.default_engine]
+
+    def choose(
+        self,
+        feature: Optional[str],
+        model_id: Optional[str],
+        *,
+        simple_turn: bool = False,
+        default_engine: Optional[str] = None,
+    ) -> RouteDecision:
+        reason = "pool"
+        pool = self.pool_for(feature, model_id, default_engine)
+        if simple_turn and self.summary_pool:
+            pool, reason = self.summary_pool, "summary"
+
+        scores = {engine: self.score(engine) for engine in pool}
+        if len(pool) == 1:
+            return RouteDecision(pool[0], pool, "single" if reason == "pool" else reason, scores)
+
+        available = [e for e in pool if not self._circuit_open(e)] or pool
+        candidates = self._rng.sample(available, 2) if len(available) > 2 else available
+        engine = min(candidates, key=lambda e: (scores[e] is not None, scores[e] or 0.0))
+        return RouteDecision(engine, pool, reason, scores)
+
+    def score(self, engine_id: str) -> Optional[float]:
+        """Menor es mejor. None = sin muestras todavía (se prefiere para explorarlo)."""
+        st = self.stats.get(engine_id)
+        if st is None:
+            return None
+        # Un engine que solo ha fallado no tiene TTFT: se le supone el peor caso aceptable.
+        ttft = st.ttft_ewma_s if st.ttft_ewma_s is not None else settings.AICORE_TTFT_TIMEOUT_S
+        return ttft * (1.0 + ERROR_PENALTY * st.error_ewma)
+
+    def record(self, engine_id: str, *, ttft_s: Optional[float] = None, ok: bool = True) -> None:
+        st = self.stats.setdefault(engine_id, EngineStats())
+        a = self.alpha
+        if ttft_s is not None:
+            st.ttft_ewma_s = ttft_s if st.ttft_ewma_s is None else (1 - a) * st.ttft_ewma_s + a * ttft_s
+        st.error_ewma = (1 - a) * st.error_ewma + a * (0.0 if ok else 1.0)
+        st.samples += 1
+
+    @staticmethod
+    def _circuit_open(engine_id: str) -> bool:
+        return breaker_for(engine_id).rejecting()
+
+
+def _routing_from(cfg) -> Dict[str, Any]:
+    return dict(
+        default_engine=cfg.ENGINE_ID,
+        pools=cfg.ENGINE_POOLS,
+        summary_pool=cfg.SUMMARY_ENGINE_POOL,
+        alpha=cfg.ENGINE_EWMA_ALPHA,
+    )
+
+
+engine_router = EngineRouter.from_settings()
+
+_ROUTING_FIELDS = {"ENGINE_ID", "ENGINE_POOLS", "SUMMARY_ENGINE_POOL", "ENGINE_EWMA_ALPHA"}
+
+
+def _on_settings_change(old, new, changed) -> None:
+    if changed & _ROUTING_FIELDS:
+        engine_router.configure(**_routing_from(new))
+
+
+settings_provider.subscribe(_on_settings_change)
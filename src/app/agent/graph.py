@@ -6,9 +6,8 @@ from langgraph.graph import StateGraph
 from langgraph.prebuilt import ToolNode
 from langgraph.runtime import Runtime
  
-from app.agent.context import Context
+from app.agent.context import WARMUP_ENGINE_ID, Context
 from app.agent.state import InputState, State
-from app.agent.tools import TOOLS
 from app.agent.aicore_langchain import get_openai_compatible_chat
 from app.agent.ms_nodes.history_node import load_history, write_user, write_ai
 from app.agent.utils import normalize_ai_toolcalls
@@ -18,7 +17,7 @@ from langchain_core.runnables import RunnableConfig
 from datetime import UTC, datetime
  
 from datetime import UTC, datetime
-from typing import Dict, List, Literal
+from typing import Any, Dict, List, Literal, Optional, Tuple
 from langchain_core.messages import AIMessage, AIMessageChunk
 from langgraph.graph import StateGraph
 from langgraph.prebuilt import ToolNode
@@ -26,13 +25,33 @@ from langgraph.runtime import Runtime
  
 from app.agent.context import Context
 from app.agent.state import InputState, State
-from app.agent.tools import TOOLS
-from app.agent.aicore_langchain import get_openai_compatible_chat
+from app.agent.aicore_langchain import build_chat, get_openai_compatible_chat, invalidate_aicore_session
 from app.agent.ms_nodes.history_node import load_history, write_user, write_ai
-from app.agent.utils import parse_forced_tool_or_answer, build_forced_tool_prompt
+from app.agent.utils import get_message_text, parse_forced_tool_or_answer
  
 from langchain_core.runnables import RunnableConfig
+from langchain_core.messages import HumanMessage, ToolMessage
+from app.agent.deadline import DEADLINE_ANSWER, expired, remaining
+from app.agent.resilience import CircuitOpenError, ResilientChatInvoker
+from app.agent.engine_router import engine_router
+from app.agent.guardrails import GUARDRAIL_ANSWER, OutputGuard, guard_input
+from app.agent.ms_clients.prompt_client import prompt_client
+from langchain_core.callbacks import adispatch_custom_event
+from app.services.metrics import MODEL_TOKENS_PER_S, MODEL_TTFT, NODE_LATENCY, TOOL_CALL_REPEATS, TOOL_LOOP_FINALS, TOOL_MEMO_HITS
+from app.services.usage import usage_accountant
+from app.agent.tokens import estimate_prompt_tokens, tokenizer
+from app.agent.tool_registry import tool_registry
+from app.agent.history_record import to_messages
+from app.agent.tool_loop import FINAL_ANSWER_PROMPT, LOOP_ANSWER, call_key, memo_message, repeated_calls, turn_memo
+from app.settings import settings
+from qgdiag_lib_arquitectura.utilities.logging_conf import CustomLogger
+import asyncio
+import dataclasses
+import functools
+import time
  
+log = CustomLogger(name="agent.graph", log_type="Technical")
+
 # --------- Nodo: llamada al modelo -------------
  
 async def call_model(state: State, config: RunnableConfig, runtime: Runtime[Context]) -> Dict[str, List[AIMessage]]:
@@ -40,40 +59,273 @@ async def call_model(state: State, config: RunnableConfig, runtime: Runtime[Cont
     Llama al chat vía AI Core en streaming, fuerza protocolo de tool-calling por texto,
     y al terminar convierte en AIMessage con tool_calls (si procede).
     """
-    chat = await get_openai_compatible_chat(
-        headers=runtime.context.headers,
-        base_url=runtime.context.base_url,
-        engine_id=runtime.context.engine_id,
-    )
+    ctx = runtime.context
+    if expired(ctx.deadline):
+        # Sin presupuesto (p.ej. tras unas tools lentas): respuesta controlada sin llamar al modelo.
+        return {"messages": [AIMessage(content=DEADLINE_ANSWER, response_metadata={"finish_reason": "deadline"})]}
+ 
+    # Elegimos engine: pool de feature/model_id, o el barato si solo hay que resumir una tool.
+    # El turno sintético del warm-up no pasa por el router ni cuenta en consumo, estadísticas
+    # ni métricas: todo lo que registre va a WARMUP_ENGINE_ID.
+    if ctx.synthetic:
+        engine_id = WARMUP_ENGINE_ID
+    else:
+        route = engine_router.choose(
+            ctx.feature,
+            ctx.model_id,
+            simple_turn=_is_simple_turn(state),
+            default_engine=ctx.engine_id or None,
+        )
+        engine_id = route.engine_id
+        await _emit_event("engine_route", route.as_dict(), config)
  
     # IMPORTANTE: NO usamos .bind_tools() aquí, para evitar que AI Core rompa tool_calls JSON.
     # Forzamos el protocolo vía system prompt.
-    forced_prompt = build_forced_tool_prompt(TOOLS)
-    print(f"###FORCED PROMPT###: {forced_prompt}")
+    # Solo las tools relevantes para el turno (todas si el modelo ya pidió una no ofrecida)
+    # El historial compacto se convierte a mensajes de LangChain solo aquí
+    conversation = [*to_messages(state.history), *state.messages]
+    # Si el modelo ya repitió llamadas TOOL_LOOP_MAX_REPEATS veces, último paso sin tools
+    repeats = len(repeated_calls(state.messages))
+    force_final = 0 < settings.TOOL_LOOP_MAX_REPEATS <= repeats
+    if force_final:
+        offered_tools, forced_prompt = [], FINAL_ANSWER_PROMPT
+        TOOL_LOOP_FINALS.inc(engine_id)
+        await _emit_event("tool_loop", {"engine_id": engine_id, "repeats": repeats, "final_answer": True}, config)
+    else:
+        offered_tools, forced_prompt = tool_registry.select(
+            ctx.feature, _selection_query(conversation), full=ctx.all_tools
+        )
+    # Prompt de la feature desde la caché del gestor de prompts (nunca sale a red aquí)
+    feature_prompt = prompt_client.get(ctx.feature) if settings.PROMPTS_ENABLED else None
+    if feature_prompt is not None:
+        forced_prompt = f"{feature_prompt.render(system_time=datetime.now(tz=UTC).isoformat())}\n{forced_prompt}"
     # system_message = forced_prompt.format(system_time=datetime.now(tz=UTC).isoformat())
-    messages = [{"role": "system", "content": forced_prompt}, *state.messages]
+    messages = [{"role": "system", "content": forced_prompt}, *conversation]
+    # Estimación previa (tokenizer local): disponible para presupuesto/empaquetado y de
+    # respaldo si el proveedor no informa usage
+    prompt_estimate = estimate_prompt_tokens(messages)
  
     # Consumimos streaming, acumulando el texto.
     parts: List[str] = []
+    generated: Optional[List[str]] = None  # texto producido, si se descarta antes de facturar
+    usage: Dict[str, int] = {}  # usage_metadata del proveedor, si lo envía
+    guards = ctx.guardrails_run
+    out_guard = guards.output() if guards is not None else None
  
-    async for ch in chat.astream(messages, config=config):
-        if isinstance(ch, AIMessageChunk):
-            c = getattr(ch, "content", None)
-            if isinstance(c, str) and c:
-                parts.append(c)
-                # logging voluntario
-                print(f"[Δ] {c!r}")
+    try:
+        async with asyncio.timeout(remaining(ctx.deadline)):
+            if ctx.chat_model is not None:
+                chat = ctx.chat_model
+            elif ctx.aicore_session is not None:
+                chat = build_chat(ctx.aicore_session, engine_id, timeout=remaining(ctx.deadline))
+            else:
+                chat = await get_openai_compatible_chat(
+                    headers=ctx.headers,
+                    base_url=ctx.base_url,
+                    engine_id=engine_id,
+                    timeout=remaining(ctx.deadline),
+                )
+ 
+            invoker = ResilientChatInvoker(chat, engine_id=engine_id)
+            consume = _consume(invoker.astream(messages, config=config), parts, out_guard, usage)
+            if guards is None:
+                n_chunks, first_token_at = await consume
+            else:
+                # Los guardrails corren en paralelo: si fallan se cancela la generación, y
+                # la respuesta no se da por buena hasta que la entrada y la salida pasan.
+                consumed = await guards.run(consume)
+                if guards.violation is None:
+                    await out_guard.finish()
+                if guards.violation is not None:
+                    out_guard.cancel()
+                    await _emit_event("guardrail", guards.violation.model_dump(), config)
+                    return {"messages": [_blocked_answer()]}
+                n_chunks, first_token_at = consumed
+    except TimeoutError:
+        if out_guard is not None:
+            out_guard.cancel()
+            if not settings.GUARDRAILS_FAIL_OPEN:
+                generated = list(parts)  # se factura aunque no se devuelva
+                parts.clear()  # sin verificar no se devuelve texto parcial
+        return {"messages": [_partial_answer("".join(parts).strip())]}
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        if not ctx.synthetic:
+            engine_router.record(engine_id, ok=False)
+        if getattr(e, "status_code", None) in (401, 403) and ctx.chat_model is None and ctx.aicore_session is None:
+            # Sesión de AI Core caducada: que el siguiente intento vuelva a hacer login
+            await invalidate_aicore_session(ctx.headers, ctx.base_url)
+        raise
+    finally:
+        step_usage = _step_usage(engine_id, prompt_estimate, parts if generated is None else generated, usage)
+        if step_usage is not None and not ctx.synthetic:
+            if settings.USAGE_ENABLED:
+                usage_accountant.record(
+                    ctx.headers.get("IAG-App-Id"),
+                    engine_id,
+                    step_usage["prompt_tokens"],
+                    step_usage["completion_tokens"],
+                    estimated=step_usage["source"] != "provider",
+                )
+            await _emit_event("usage", step_usage, config)
+    if not ctx.synthetic:
+        engine_router.record(engine_id, ttft_s=invoker.ttft_s, ok=True)
+        if invoker.ttft_s is not None:
+            MODEL_TTFT.observe(invoker.ttft_s, engine_id)
+        if n_chunks > 1:
+            gen_s = time.perf_counter() - first_token_at
+            if gen_s > 0:
+                MODEL_TOKENS_PER_S.observe((n_chunks - 1) / gen_s, engine_id)
  
     final_text = "".join(parts).strip()
-    print(f"###PARTS###: {parts}")
-    print(f"###FINAL TEXT###: {final_text}")
  
     # Parseamos el protocolo forzado -> AIMessage con tool_calls o respuesta final.
     ai_msg = parse_forced_tool_or_answer(final_text)
-    print(f"###AI MSG###: {ai_msg}")
+    if force_final and ai_msg.tool_calls:
+        # Sigue pidiendo tools: se corta el bucle con una respuesta controlada
+        ai_msg = AIMessage(content=ai_msg.content or LOOP_ANSWER, response_metadata={"finish_reason": "tool_loop"})
+    if any(call["name"] not in offered_tools for call in ai_msg.tool_calls):
+        ctx.all_tools = True
+    new_repeats = len(repeated_calls(state.messages, ai_msg.tool_calls)) - repeats
+    if new_repeats:
+        TOOL_CALL_REPEATS.inc(engine_id, amount=new_repeats)
+        await _emit_event("tool_loop", {"engine_id": engine_id, "repeats": repeats + new_repeats, "final_answer": False}, config)
+    # Sin prompt ni texto del modelo (datos de usuario): solo la forma del paso
+    log.debug(
+        f"call_model engine={engine_id} chunks={n_chunks} chars={len(final_text)} "
+        f"tool_calls={[c['name'] for c in ai_msg.tool_calls]}"
+    )
  
     return {"messages": [ai_msg]}
  
+async def _consume(
+    stream, parts: List[str], out_guard: Optional[OutputGuard], usage: Dict[str, int]
+) -> Tuple[int, Optional[float]]:
+    """
+    Acumula en `parts` el texto del stream y en `usage` los tokens que informe el
+    proveedor. Devuelve (nº de chunks, instante del primero).
+    """
+    n_chunks, first_token_at = 0, None
+    async for ch in stream:
+        n_chunks += 1
+        if n_chunks == 1:
+            first_token_at = time.perf_counter()
+        if isinstance(ch, AIMessageChunk):
+            if ch.usage_metadata:
+                for k in ("input_tokens", "output_tokens"):
+                    usage[k] = usage.get(k, 0) + (ch.usage_metadata.get(k) or 0)
+            c = getattr(ch, "content", None)
+            if isinstance(c, str) and c:
+                parts.append(c)
+                if out_guard is not None:
+                    out_guard.feed(c)
+    return n_chunks, first_token_at
+ 
+def _step_usage(engine_id: str, prompt_estimate: int, parts: List[str], usage: Dict[str, int]) -> Optional[Dict]:
+    """
+    Consumo de un paso del modelo: usage del proveedor si lo envió en el stream; si no,
+    la estimación previa del prompt y el conteo local de la respuesta. None si no llegó
+    a generarse nada.
+    """
+    if not parts and not usage:
+        return None
+    if usage:
+        prompt, completion, source = usage.get("input_tokens", 0), usage.get("output_tokens", 0), "provider"
+    else:
+        prompt = prompt_estimate
+        completion = tokenizer.count("".join(parts))
+        source = "tokenizer" if tokenizer.exact else "estimate"
+    return {
+        "engine_id": engine_id,
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "total_tokens": prompt + completion,
+        "prompt_tokens_estimate": prompt_estimate,
+        "source": source,
+    }
+ 
+def _blocked_answer() -> AIMessage:
+    return AIMessage(content=GUARDRAIL_ANSWER, response_metadata={"finish_reason": "guardrail"})
+ 
+def _selection_query(messages: List[Any]) -> str:
+    """Texto con el que se eligen las tools: último mensaje del usuario y los más recientes."""
+    recent = messages[-settings.TOOL_SELECTION_HISTORY_MESSAGES:] if settings.TOOL_SELECTION_HISTORY_MESSAGES > 0 else []
+    last_human = next((m for m in reversed(messages) if isinstance(m, HumanMessage)), None)
+    if last_human is not None and not any(m is last_human for m in recent):
+        recent = [last_human, *recent]
+    return "\n".join(get_message_text(m) for m in recent if not isinstance(m, ToolMessage))
+ 
+def _is_simple_turn(state: State) -> bool:
+    """Tras ejecutar tools el modelo normalmente solo resume su resultado."""
+    return bool(state.messages) and isinstance(state.messages[-1], ToolMessage)
+ 
+async def _emit_event(name: str, data: Dict, config: RunnableConfig) -> None:
+    """Evento custom hacia astream_events (llega como on_custom_event)."""
+    try:
+        await adispatch_custom_event(name, data, config=config)
+    except RuntimeError:
+        # Fuera de un run del grafo (p.ej. invocando el nodo directamente) no hay a quién avisar.
+        pass
+ 
+def _partial_answer(partial_text: str) -> AIMessage:
+    """
+    Deadline agotado a mitad de generación: si lo recibido ya es una respuesta final
+    la devolvemos truncada; una llamada a tool a medias no se ejecuta.
+    """
+    ai_msg = parse_forced_tool_or_answer(partial_text) if partial_text else None
+    if ai_msg is None or ai_msg.tool_calls or not ai_msg.content:
+        return AIMessage(content=DEADLINE_ANSWER, response_metadata={"finish_reason": "deadline"})
+    return AIMessage(content=ai_msg.content, response_metadata={"finish_reason": "deadline"})
+ 
+# --------- Nodo: ejecución de tools -------------
+ 
+_tool_node = ToolNode(tool_registry.tools())
+ 
+async def run_tools(state: State, config: RunnableConfig, runtime: Runtime[Context]) -> Dict[str, List[ToolMessage]]:
+    """
+    Ejecuta las tools pedidas por el modelo dentro del presupuesto restante.
+    Si se agota, cada llamada pendiente recibe un ToolMessage de error.
+    Una llamada idéntica a otra ya resuelta en el turno se responde con ese resultado.
+    """
+    last = state.messages[-1]
+    calls = getattr(last, "tool_calls", None) or []
+    memo = turn_memo(state.messages[:-1])
+    memoized = [call for call in calls if call_key(call) in memo]
+    if memoized:
+        for call in memoized:
+            TOOL_MEMO_HITS.inc(call["name"])
+        pending = [call for call in calls if call_key(call) not in memo]
+        answered = [memo_message(call, memo[call_key(call)]) for call in memoized]
+        if not pending:
+            return {"messages": answered}
+        pending_state = dataclasses.replace(
+            state, messages=[*state.messages[:-1], last.model_copy(update={"tool_calls": pending})]
+        )
+        out = await _execute_tools(pending_state, config, runtime, pending)
+        by_id = {m.tool_call_id: m for m in [*answered, *out["messages"]]}
+        return {"messages": [by_id[call["id"]] for call in calls if call["id"] in by_id]}
+    return await _execute_tools(state, config, runtime, calls)
+
+async def _execute_tools(state: State, config: RunnableConfig, runtime: Runtime[Context], calls) -> Dict[str, List[ToolMessage]]:
+    left = remaining(runtime.context.deadline)
+    if left is None or left > 0:
+        try:
+            return await asyncio.wait_for(_tool_node.ainvoke(state, config), timeout=left)
+        except TimeoutError:
+            pass
+    return {
+        "messages": [
+            ToolMessage(
+                content="Error: tool execution cancelled, the request deadline was exceeded.",
+                tool_call_id=call["id"],
+                name=call["name"],
+                status="error",
+            )
+            for call in calls
+        ]
+    }
+ 
 # ------------------ Aristas ----------------------
  
 def route_model_output(state: State) -> Literal["__end__", "tools"]:
@@ -82,18 +334,31 @@ def route_model_output(state: State) -> Literal["__end__", "tools"]:
         raise ValueError(f"Expected AIMessage, got {type(last_message).__name__}")
     return "__end__" if not last_message.tool_calls else "tools"
  
+def _timed(name: str, node):
+    """Envuelve un nodo para registrar su duración en agent_node_duration_seconds."""
+    @functools.wraps(node)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await node(*args, **kwargs)
+        finally:
+            NODE_LATENCY.observe(time.perf_counter() - started, name)
+    return wrapper
+ 
 # ------------------- Grafo ------------------------
 builder = StateGraph(State, input_schema=InputState, context_schema=Context)
  
 # Nodos
-builder.add_node("load_history", load_history)
+builder.add_node("guard_input", guard_input)
+builder.add_node("load_history", _timed("load_history", load_history))
 builder.add_node("write_user", write_user)
-builder.add_node("call_model", call_model)
-builder.add_node("tools", ToolNode(TOOLS))
+builder.add_node("call_model", _timed("call_model", call_model))
+builder.add_node("tools", _timed("tools", run_tools))
 builder.add_node("write_ai", write_ai)
  
 # aristas
-builder.add_edge("__start__", "load_history")
+builder.add_edge("__start__", "guard_input")
+builder.add_edge("guard_input", "load_history")
 builder.add_edge("load_history", "write_user")
 builder.add_edge("write_user", "call_model")
 builder.add_conditional_edges("call_model", route_model_output)
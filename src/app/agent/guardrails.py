@@ -0,0 +1,162 @@
+# app/agent/guardrails.py
+"""
+Guardrails concurrentes con la generación.
+
+Comprobar la entrada antes de llamar al modelo añadía un round trip completo a cada
+turno. En su lugar:
+
+- La comprobación de entrada arranca al principio del grafo (nodo `guard_input`) y
+  corre en paralelo con la carga del historial y la primera llamada al modelo. Si
+  falla, se cancela la generación en curso. La respuesta del modelo (texto o tool
+  calls) no se da por buena hasta que la comprobación ha pasado.
+- La salida se comprueba por ventanas de GUARDRAILS_OUTPUT_WINDOW_CHARS (con solape)
+  a medida que llegan los chunks, sin retener el streaming; al terminar se comprueba
+  el resto y se esperan las ventanas pendientes.
+
+Si alguna comprobación falla, call_model devuelve GUARDRAIL_ANSWER y emite un evento
+`guardrail` para que el cliente de /react-stream descarte lo ya recibido. Un error
+del MS de guardrails bloquea el turno salvo que GUARDRAILS_FAIL_OPEN=true.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Dict, List, Optional
+
+from langchain_core.messages import HumanMessage
+
+from qgdiag_lib_arquitectura.utilities.logging_conf import CustomLogger
+
+from app.agent.deadline import budget
+from app.agent.ms_clients.guardrails_client import GuardrailsClient
+from app.agent.utils import get_message_text
+from app.schemas.guardrails_schema import GuardrailStage, GuardrailVerdict
+from app.services.metrics import GUARDRAIL_CHECKS
+from app.settings import settings
+
+log = CustomLogger(name="agent.guardrails", log_type="Technical")
+
+GUARDRAIL_ANSWER = "No puedo ayudarte con esa petición."
+
+
+class GuardrailsRun:
+    """Estado de los guardrails de un turno (vive en Context.guardrails_run)."""
+
+    def __init__(self, ctx: Any, client: Optional[GuardrailsClient] = None):
+        self.ctx = ctx
+        self.client = client or GuardrailsClient()
+        self.blocked = asyncio.Event()
+        self.violation: Optional[GuardrailVerdict] = None
+        self.input_task: Optional[asyncio.Task] = None
+
+    def start_input(self, text: str) -> None:
+        self.input_task = asyncio.get_running_loop().create_task(self._check("input", text), name="guardrail-input")
+
+    async def _check(self, stage: GuardrailStage, text: str) -> None:
+        ctx = self.ctx
+        try:
+            verdict = await asyncio.wait_for(
+                self.client.check(
+                    stage,
+                    text,
+                    headers=ctx.headers,
+                    feature=ctx.feature,
+                    conversation_id=ctx.conversation_id,
+                    timeout=budget(ctx.deadline, settings.GUARDRAILS_TIMEOUT_S),
+                ),
+                timeout=budget(ctx.deadline, settings.GUARDRAILS_TIMEOUT_S),
+            )
+        except Exception as e:
+            GUARDRAIL_CHECKS.inc(stage, "error")
+            log.warning(f"Guardrail de {stage} no disponible: {type(e).__name__}: {e}")
+            if settings.GUARDRAILS_FAIL_OPEN:
+                return
+            verdict = GuardrailVerdict(allowed=False, reason="guardrails unavailable")
+        else:
+            GUARDRAIL_CHECKS.inc(stage, "pass" if verdict.allowed else "block")
+        if not verdict.allowed and self.violation is None:
+            self.violation = verdict
+            self.blocked.set()
+
+    def output(self) -> "OutputGuard":
+        return OutputGuard(self)
+
+    async def run(self, generation: Awaitable[Any]) -> Any:
+        """
+        Ejecuta `generation` y devuelve su resultado; si un guardrail falla antes de que
+        termine, la cancela y devuelve None (ver `violation`). Sus excepciones se propagan.
+        """
+        if self.violation is not None:
+            if asyncio.iscoroutine(generation):
+                generation.close()
+            return None
+        task = asyncio.ensure_future(generation)
+        blocked = asyncio.ensure_future(self.blocked.wait())
+        try:
+            await asyncio.wait({task, blocked}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            blocked.cancel()
+            if not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        if self.violation is not None:
+            if not task.cancelled():
+                task.exception()  # marca como recuperada la excepción de la tarea cancelada
+            return None
+        return task.result()
+
+
+async def guard_input(state: Any, runtime: Any) -> Dict:
+    """Nodo inicial: lanza la comprobación de la entrada del turno y sigue sin esperarla."""
+    ctx = runtime.context
+    if settings.GUARDRAILS_ENABLED and ctx.guardrails_run is None:
+        text = next((get_message_text(m) for m in reversed(state.messages) if isinstance(m, HumanMessage)), "")
+        run = GuardrailsRun(ctx)
+        run.start_input(text or "")
+        ctx.guardrails_run = run
+    return {}
+
+
+class OutputGuard:
+    """Comprueba por ventanas el texto que va generando una llamada al modelo."""
+
+    def __init__(self, run: GuardrailsRun):
+        self.run = run
+        self.window = max(1, settings.GUARDRAILS_OUTPUT_WINDOW_CHARS)
+        self.overlap = max(0, min(settings.GUARDRAILS_OUTPUT_OVERLAP_CHARS, self.window - 1))
+        self._parts: List[str] = []
+        self._size = 0
+        self._checked = 0  # hasta dónde se ha lanzado comprobación
+        self._tasks: List[asyncio.Task] = []
+
+    def feed(self, delta: str) -> None:
+        self._parts.append(delta)
+        self._size += len(delta)
+        if self._size - self._checked >= self.window:
+            text = "".join(self._parts)
+            self._parts = [text]
+            while len(text) - self._checked >= self.window:
+                self._launch(text, self._checked + self.window)
+
+    def _launch(self, text: str, end: int) -> None:
+        start = max(0, self._checked - self.overlap)
+        self._checked = end
+        self._tasks.append(
+            asyncio.get_running_loop().create_task(self.run._check("output", text[start:end]), name="guardrail-output")
+        )
+
+    async def finish(self) -> Optional[GuardrailVerdict]:
+        """Comprueba el texto pendiente, espera a las ventanas en vuelo y a la entrada."""
+        text = "".join(self._parts)
+        if len(text) > self._checked:
+            self._launch(text, len(text))
+        pending = [t for t in (self.run.input_task, *self._tasks) if t is not None]
+        if pending:
+            await self.run.run(asyncio.gather(*pending))
+        return self.run.violation
+
+    def cancel(self) -> None:
+        for t in self._tasks:
+            t.cancel()
@@ -0,0 +1,75 @@
+# app/agent/history_record.py
+"""
+Representación compacta de los mensajes del historial de conversación.
+
+El historial se guarda en el estado del grafo (y en la caché del cliente) como
+`HistoryRecord`: un objeto con __slots__ de cuatro campos en lugar de un
+HumanMessage/AIMessage de pydantic con su dict de response_metadata. Así no se copia
+por el reducer add_messages ni viaja en los eventos de astream_events, y solo se
+convierte a mensajes de LangChain al construir el prompt del modelo.
+
+De los metadatos del MS se conservan message_id y la fecha (como timestamp); insight_id
+es el conversation_id de la petición y "source" es constante, así que no se guardan.
+"""
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Any, List, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+HUMAN = "human"
+AI = "ai"
+# Los roles leídos de JSON se sustituyen por estas constantes (una sola copia por proceso)
+_ROLES = {HUMAN: HUMAN, AI: AI}
+SOURCE = "history-ms"
+
+
+class HistoryRecord:
+    __slots__ = ("role", "text", "message_id", "created_at")
+
+    def __init__(self, role: str, text: str, message_id: str = "", created_at: float = 0.0):
+        self.role = _ROLES[role]
+        self.text = text
+        self.message_id = message_id
+        self.created_at = created_at  # epoch en segundos (UTC); 0.0 = desconocida
+
+    @classmethod
+    def from_wire(cls, m: Any) -> "HistoryRecord":
+        """MessageWire del MS de historial -> registro."""
+        role = HUMAN if (m.message_type or "").upper() == "INPUT" else AI
+        created = m.date_created.timestamp() if isinstance(m.date_created, datetime) else 0.0
+        return cls(role, m.message_text or "", m.message_id, created)
+
+    @classmethod
+    def from_row(cls, row: Sequence[Any]) -> "HistoryRecord":
+        return cls(*row)
+
+    def as_row(self) -> List[Any]:
+        """Forma serializable para la caché: [role, text, message_id, created_at]."""
+        return [self.role, self.text, self.message_id, self.created_at]
+
+    def to_message(self, *, metadata: bool = False) -> BaseMessage:
+        """
+        Mensaje de LangChain para el modelo. Con `metadata` incluye message_id, fecha y
+        origen en response_metadata (p.ej. para devolver el historial al cliente); la
+        fecha es None si el MS no la informó.
+        """
+        meta = {}
+        if metadata:
+            created = datetime.fromtimestamp(self.created_at, tz=timezone.utc).isoformat() if self.created_at else None
+            meta = {"message_id": self.message_id, "date_created": created, "source": SOURCE}
+        cls = HumanMessage if self.role == HUMAN else AIMessage
+        return cls(content=self.text, response_metadata=meta)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, HistoryRecord):
+            return NotImplemented
+        return self.as_row() == other.as_row()
+
+    def __repr__(self) -> str:
+        return f"HistoryRecord({self.role!r}, {self.text[:40]!r}, message_id={self.message_id!r})"
+
+
+def to_messages(records: Sequence[HistoryRecord], *, metadata: bool = False) -> List[BaseMessage]:
+    return [r.to_message(metadata=metadata) for r in records]
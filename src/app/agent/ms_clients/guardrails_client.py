@@ -0,0 +1,37 @@
+# app/agent/ms_clients/guardrails_client.py
+from __future__ import annotations
+import time
+from typing import Any, Dict, Optional
+from qgdiag_lib_arquitectura.clients.rest_client import RestClient
+from qgdiag_lib_arquitectura.utilities.logging_conf import CustomLogger
+from app.settings import settings
+from app.schemas.guardrails_schema import GuardrailCheck, GuardrailStage, GuardrailVerdict
+from app.services.metrics import GUARDRAIL_LATENCY
+
+ENDPOINT = "/qgdiag-ms-guardrails/check"
+log = CustomLogger(name="guardrails.client", log_type="Technical")
+
+
+class GuardrailsClient:
+    """Guardrails MS client using corporate RestClient."""
+
+    async def check(
+        self,
+        stage: GuardrailStage,
+        text: str,
+        headers: Dict[str, Any],
+        feature: Optional[str] = None,
+        conversation_id: Optional[str] = None,
+        timeout: Optional[float] = None) -> GuardrailVerdict:
+
+        body = GuardrailCheck(stage=stage, text=text, feature=feature, conversation_id=conversation_id)
+        started = time.perf_counter()
+        client = RestClient(
+            url=settings.GUARDRAILS_URL,
+            port=settings.GUARDRAILS_PORT,
+            timeout=timeout if timeout is not None else settings.GUARDRAILS_TIMEOUT_S,
+        )
+        response = await client.post_call(endpoint=ENDPOINT, headers=headers, json=body.model_dump())
+        response.raise_for_status()
+        GUARDRAIL_LATENCY.observe(time.perf_counter() - started, stage)
+        return GuardrailVerdict.model_validate(response.json())
@@ -3,13 +3,27 @@ from __future__ import annotations
 from typing import Dict, List, Optional, Any
 from qgdiag_lib_arquitectura.clients.rest_client import RestClient
 from qgdiag_lib_arquitectura.utilities.logging_conf import CustomLogger
-from app.settings import settings
+from app.settings import settings, settings_provider
+from app.agent.history_record import HistoryRecord
 from app.schemas.history_schema import MessageWire, MessageWireList
+from app.services.cache import CacheNamespace, fingerprint
+from app.services.metrics import HISTORY_BYTES, HISTORY_LATENCY
 from datetime import datetime, timezone
+import time
 from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
 
 ENDPOINT = "/qgdiag-ms-historial-de-conversacion/get-user-messages-by-conversation-id"
 log = CustomLogger(name="history.client", log_type="Technical")
+# Historial compacto por conversación y cabeceras del llamante (HISTORY_CACHE_TTL_S, 0 = desactivada)
+_HISTORY = CacheNamespace("history", settings.HISTORY_CACHE_TTL_S)
+
+
+def _on_settings_change(old, new, changed) -> None:
+    if "HISTORY_CACHE_TTL_S" in changed:
+        _HISTORY.ttl_s = new.HISTORY_CACHE_TTL_S
+
+
+settings_provider.subscribe(_on_settings_change)
 
 
 def to_langchain(m: MessageWire) -> BaseMessage:
@@ -45,17 +59,19 @@ class HistoryClient:
     async def get_messages(
         self,
         conversation_id: str,
-        headers: Dict[str, Any]) -> List[MessageWire]:
+        headers: Dict[str, Any],
+        timeout: Optional[float] = None) -> List[MessageWire]:
         
         log.info(f"Fetching history for conversation_id: {conversation_id}")
         params = {"conversation_id": conversation_id}
 
         # The endpoint returns a *flat list* of Message
+        started = time.perf_counter()
         try:
             client = RestClient(
                 url=settings.URL_HIST_CONV,
                 port=settings.HIST_CONV_PORT,
-                timeout=30
+                timeout=timeout if timeout is not None else settings.HISTORY_TIMEOUT_S
             )
             response = await client.get_call(
                 endpoint=ENDPOINT,
@@ -63,6 +79,8 @@ class HistoryClient:
                 params=params,
             )
             response.raise_for_status()
+            HISTORY_LATENCY.observe(time.perf_counter() - started)
+            HISTORY_BYTES.observe(len(response.content))
             json_data = response.json()
             # The endpoint returns a flat list, so we validate it directly.
             res = [MessageWire.model_validate(item) for item in json_data]
@@ -71,3 +89,18 @@ class HistoryClient:
         except Exception:
             log.exception(f"Failed to fetch history for conversation_id: {conversation_id}")
             raise
+
+    async def get_records(
+        self,
+        conversation_id: str,
+        headers: Dict[str, Any],
+        timeout: Optional[float] = None) -> List[HistoryRecord]:
+        """History as compact records (what the graph keeps in its state), cached per HISTORY_CACHE_TTL_S."""
+        cache_key = fingerprint(conversation_id, headers)
+        cached = await _HISTORY.aget(cache_key)
+        if cached is not None:
+            return [HistoryRecord.from_row(row) for row in cached]
+        wires = await self.get_messages(conversation_id, headers, timeout)
+        records = [HistoryRecord.from_wire(m) for m in wires]
+        await _HISTORY.aset(cache_key, [r.as_row() for r in records])
+        return records
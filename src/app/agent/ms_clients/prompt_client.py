@@ -0,0 +1,287 @@
+# app/agent/ms_clients/prompt_client.py
+"""
+Cliente del MS gestor de prompts con caché local de plantillas compiladas.
+
+La consulta de un prompt (`get`) nunca sale a red: devuelve lo que haya en memoria.
+- Las plantillas de las features de PROMPTS_FEATURES se precargan en el arranque
+  (paso de warm-up `prompts`).
+- Una entrada con más de PROMPTS_TTL_S se sigue sirviendo (stale-while-revalidate)
+  y dispara una revalidación en segundo plano con If-None-Match: un 304 solo
+  renueva la entrada; un 200 la sustituye por la nueva versión ya compilada.
+- Si el MS falla se conserva la versión anterior. Las revalidaciones de una misma
+  plantilla son single-flight.
+- Una plantilla que aún no está en caché devuelve None (el agente usa solo el
+  prompt del protocolo de tools) y se pide en segundo plano, solo si la feature está
+  en PROMPTS_FEATURES (la feature llega en la query del usuario). Si no existe o el
+  MS falla, el fallo se recuerda PROMPTS_MISS_TTL_S antes de volver a pedirla.
+- Con una caché compartida (CACHE_BACKEND=sqlite) lo que descarga un worker lo
+  reutilizan los demás del nodo: antes de ir al MS se mira si otro worker tiene
+  una versión descargada hace menos de PROMPTS_TTL_S.
+"""
+from __future__ import annotations
+
+import asyncio
+import string
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from qgdiag_lib_arquitectura.clients.rest_client import RestClient
+from qgdiag_lib_arquitectura.utilities.logging_conf import CustomLogger
+
+from app.schemas.prompt_schema import PromptWire
+from app.services.auth import service_headers
+from app.services.cache import CacheNamespace
+from app.services.metrics import REGISTRY
+from app.settings import settings, settings_provider
+
+ENDPOINT = "/qgdiag-ms-gestor-prompts/get-prompt"
+log = CustomLogger(name="prompt.client", log_type="Technical")
+
+PROMPT_CACHE = REGISTRY.counter("agent_prompt_cache_total", "Consultas a la caché de prompts", ("result",))
+PROMPT_FETCHES = REGISTRY.counter(
+    "agent_prompt_fetches_total", "Descargas/revalidaciones de prompts por resultado", ("result",)
+)
+
+Key = Tuple[str, str]  # (feature, name)
+# fetch(feature, name, etag) -> (plantilla nueva o None si 304, etag)
+Fetch = Callable[[str, str, Optional[str]], Awaitable[Tuple[Optional[PromptWire], Optional[str]]]]
+
+
+class CompiledPrompt:
+    """Plantilla con sus huecos `{variable}` ya analizados; render() no vuelve a parsear."""
+
+    __slots__ = ("template", "version", "etag", "fields", "_pieces")
+
+    def __init__(self, template: str, *, version: Optional[str] = None, etag: Optional[str] = None):
+        self.template = template
+        self.version = version
+        self.etag = etag
+        try:
+            parsed = list(string.Formatter().parse(template))
+        except ValueError:
+            parsed = [(template, None, None, None)]  # llaves desparejadas: texto literal
+        pieces: List[Tuple[str, Optional[str]]] = []
+        for literal, name, spec, conv in parsed:
+            if name is None:
+                pieces.append((literal, None))
+            elif name.isidentifier() and not spec and not conv:
+                pieces.append((literal, name))
+            else:
+                # Solo se sustituyen huecos simples; "{}", "{a.b}", "{x:>3}"... quedan literales
+                hole = "{" + name + (f"!{conv}" if conv else "") + (f":{spec}" if spec else "") + "}"
+                pieces.append((literal + hole, None))
+        self._pieces = pieces
+        self.fields = frozenset(n for _, n in pieces if n)
+
+    def render(self, **values: Any) -> str:
+        """Sustituye las variables indicadas; las que falten se dejan tal cual."""
+        out: List[str] = []
+        for literal, name in self._pieces:
+            out.append(literal)
+            if name is not None:
+                out.append(str(values[name]) if name in values else "{" + name + "}")
+        return "".join(out)
+
+
+@dataclass
+class _Entry:
+    prompt: CompiledPrompt
+    fetched_at: float = field(default_factory=time.monotonic)
+
+
+async def fetch_prompt(feature: str, name: str, etag: Optional[str]) -> Tuple[Optional[PromptWire], Optional[str]]:
+    """GET condicional al MS gestor de prompts."""
+    client = RestClient(
+        url=settings.GESTOR_PROMPT_URL,
+        port=settings.GESTOR_PROMPT_PORT,
+        timeout=settings.PROMPTS_TIMEOUT_S,
+    )
+    headers = service_headers({"If-None-Match": etag} if etag else None)
+    response = await client.get_call(endpoint=ENDPOINT, headers=headers, params={"feature": feature, "name": name})
+    if response.status_code == 304:
+        return None, etag
+    response.raise_for_status()
+    wire = PromptWire.model_validate(response.json())
+    return wire, response.headers.get("ETag") or wire.version
+
+
+class PromptClient:
+    def __init__(
+        self,
+        fetch: Optional[Fetch] = None,
+        *,
+        ttl_s: float = 300.0,
+        default_name: str = "system",
+        shared: Optional[CacheNamespace] = None,
+        allowed: Optional[Callable[[str], bool]] = None,
+        miss_ttl_s: float = 30.0,
+    ):
+        self._fetch = fetch or fetch_prompt
+        self._shared = shared
+        self._allowed = allowed  # None = cualquier feature
+        self.ttl_s = ttl_s
+        self.miss_ttl_s = miss_ttl_s
+        self.default_name = default_name
+        self._entries: Dict[Key, _Entry] = {}
+        self._misses: Dict[Key, float] = {}  # clave -> instante (monotonic) hasta el que no se reintenta
+        self._inflight: Dict[Key, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, feature: Optional[str], name: Optional[str] = None) -> Optional[CompiledPrompt]:
+        """Plantilla en caché (sin red). Si falta o está caducada, la pide en segundo plano."""
+        if not feature:
+            return None
+        key = (feature, name or self.default_name)
+        entry = self._entries.get(key)
+        if entry is None:
+            if self._allowed is not None and not self._allowed(feature):
+                PROMPT_CACHE.inc("unknown_feature")
+                return None
+            if self._misses.get(key, 0.0) > time.monotonic():
+                PROMPT_CACHE.inc("negative")
+                return None
+            PROMPT_CACHE.inc("miss")
+            self._schedule(key)
+            return None
+        if time.monotonic() - entry.fetched_at > self.ttl_s:
+            PROMPT_CACHE.inc("stale")
+            self._schedule(key)
+        else:
+            PROMPT_CACHE.inc("hit")
+        return entry.prompt
+
+    def _schedule(self, key: Key) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # sin event loop (p.ej. código síncrono): ya se revalidará en otra consulta
+        task = self._inflight.get(key)
+        if task is None or task.done():
+            self._track(key, loop.create_task(self._revalidate_logged(key), name=f"prompt-revalidate:{key[0]}/{key[1]}"))
+
+    def _track(self, key: Key, task: asyncio.Task) -> asyncio.Task:
+        """Registra la tarea single-flight de `key`; se quita del registro al terminar."""
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._inflight.pop(key) if self._inflight.get(key) is t else None)
+        return task
+
+    async def refresh(self, feature: str, name: Optional[str] = None) -> Optional[CompiledPrompt]:
+        """Descarga/revalida ya; las llamadas concurrentes comparten la misma petición."""
+        key = (feature, name or self.default_name)
+        task = self._inflight.get(key)
+        if task is None or task.done():
+            task = self._track(key, asyncio.get_running_loop().create_task(self._revalidate(key)))
+        await asyncio.shield(task)
+        entry = self._entries.get(key)
+        return entry.prompt if entry is not None else None
+
+    async def _revalidate(self, key: Key) -> None:
+        if await self._adopt_shared(key):
+            return
+        entry = self._entries.get(key)
+        try:
+            wire, etag = await self._fetch(key[0], key[1], entry.prompt.etag if entry is not None else None)
+        except Exception:
+            PROMPT_FETCHES.inc("error")
+            if entry is None:
+                self._misses[key] = time.monotonic() + self.miss_ttl_s  # p.ej. 404: no se repite en cada turno
+            raise
+        if wire is None:
+            if entry is None:
+                PROMPT_FETCHES.inc("error")
+                self._misses[key] = time.monotonic() + self.miss_ttl_s
+                raise LookupError(f"El MS de prompts respondió 304 sin versión en caché para {key}")
+            PROMPT_FETCHES.inc("not_modified")
+            entry.fetched_at = time.monotonic()
+            await self._share(key, entry.prompt)
+            return
+        PROMPT_FETCHES.inc("ok")
+        prompt = CompiledPrompt(wire.prompt_text, version=wire.version, etag=etag)
+        self._entries[key] = _Entry(prompt)
+        self._misses.pop(key, None)
+        await self._share(key, prompt)
+
+    async def _adopt_shared(self, key: Key) -> bool:
+        """Usa la versión que otro worker descargó hace menos de ttl_s, si es más reciente que la local."""
+        if self._shared is None:
+            return False
+        shared = await self._shared.aget(f"{key[0]}/{key[1]}")
+        if shared is None:
+            return False
+        age = max(0.0, time.time() - shared["fetched_at"])
+        entry = self._entries.get(key)
+        if age >= self.ttl_s or (entry is not None and time.monotonic() - entry.fetched_at <= age):
+            return False
+        PROMPT_FETCHES.inc("shared")
+        prompt = CompiledPrompt(shared["template"], version=shared.get("version"), etag=shared.get("etag"))
+        self._entries[key] = _Entry(prompt, fetched_at=time.monotonic() - age)
+        self._misses.pop(key, None)
+        return True
+
+    async def _share(self, key: Key, prompt: CompiledPrompt) -> None:
+        if self._shared is not None:
+            await self._shared.aset(
+                f"{key[0]}/{key[1]}",
+                {"template": prompt.template, "version": prompt.version, "etag": prompt.etag, "fetched_at": time.time()},
+            )
+
+    async def _revalidate_logged(self, key: Key) -> None:
+        try:
+            await self._revalidate(key)
+        except Exception as e:
+            # Se sigue sirviendo la versión anterior (si la hay)
+            log.warning(f"No se pudo revalidar el prompt {key[0]}/{key[1]}: {type(e).__name__}: {e}")
+
+    async def preload(self, features: Iterable[str], name: Optional[str] = None) -> int:
+        """Descarga en paralelo las plantillas de `features`. Devuelve cuántas hay en caché."""
+        keys = [(f, name or self.default_name) for f in features]
+        results = await asyncio.gather(*(self.refresh(*key) for key in keys), return_exceptions=True)
+        for key, result in zip(keys, results):
+            if isinstance(result, Exception):
+                log.warning(f"Precarga del prompt {key[0]}/{key[1]} fallida: {type(result).__name__}: {result}")
+        return sum(1 for key in keys if key in self._entries)
+
+    async def invalidate(self, feature: Optional[str] = None) -> None:
+        """Olvida las plantillas (todas o las de una feature); la próxima consulta las pide de nuevo."""
+        for key in [k for k in self._misses if feature is None or k[0] == feature]:
+            del self._misses[key]
+        for key in [k for k in self._entries if feature is None or k[0] == feature]:
+            del self._entries[key]
+            if self._shared is not None:
+                await self._shared.adelete(f"{key[0]}/{key[1]}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            f"{feature}/{name}": {
+                "version": e.prompt.version,
+                "etag": e.prompt.etag,
+                "age_s": round(now - e.fetched_at, 1),
+                "stale": now - e.fetched_at > self.ttl_s,
+            }
+            for (feature, name), e in self._entries.items()
+        }
+
+
+prompt_client = PromptClient(
+    ttl_s=settings.PROMPTS_TTL_S,
+    default_name=settings.PROMPTS_DEFAULT_NAME,
+    shared=CacheNamespace("prompts", settings.PROMPTS_TTL_S),
+    allowed=lambda feature: feature in settings.PROMPTS_FEATURES,
+    miss_ttl_s=settings.PROMPTS_MISS_TTL_S,
+)
+
+
+def _on_settings_change(old, new, changed) -> None:
+    if "PROMPTS_TTL_S" in changed:
+        prompt_client.ttl_s = prompt_client._shared.ttl_s = new.PROMPTS_TTL_S
+    if "PROMPTS_MISS_TTL_S" in changed:
+        prompt_client.miss_ttl_s = new.PROMPTS_MISS_TTL_S
+    if "PROMPTS_DEFAULT_NAME" in changed:
+        prompt_client.default_name = new.PROMPTS_DEFAULT_NAME
+
+
+settings_provider.subscribe(_on_settings_change)
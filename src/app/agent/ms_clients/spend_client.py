@@ -0,0 +1,37 @@
+# app/agent/ms_clients/spend_client.py
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+from qgdiag_lib_arquitectura.clients.rest_client import RestClient
+from qgdiag_lib_arquitectura.utilities.logging_conf import CustomLogger
+from app.services.auth import service_headers
+from app.settings import settings
+from app.schemas.usage_schema import QuotaWire, UsageRecord, UsageReport
+
+REPORT_ENDPOINT = "/qgdiag-ms-control-gastos/register-usage"
+QUOTAS_ENDPOINT = "/qgdiag-ms-control-gastos/get-quotas"
+log = CustomLogger(name="spend.client", log_type="Technical")
+
+
+class SpendClient:
+    """Cost-control MS client using corporate RestClient."""
+
+    def _client(self, timeout: Optional[float]) -> RestClient:
+        return RestClient(
+            url=settings.URL_CONTROL_GASTOS,
+            port=settings.CONTROL_GASTOS_PORT,
+            timeout=timeout if timeout is not None else settings.USAGE_TIMEOUT_S,
+        )
+
+    async def report(self, records: List[UsageRecord], headers: Optional[Dict[str, Any]] = None,
+                     timeout: Optional[float] = None) -> None:
+        body = UsageReport(records=records).model_dump(mode="json")
+        response = await self._client(timeout).post_call(endpoint=REPORT_ENDPOINT, headers=service_headers(headers), json=body)
+        response.raise_for_status()
+        log.info(f"Reported usage for {len(records)} app/engine pairs")
+
+    async def get_quotas(self, headers: Optional[Dict[str, Any]] = None,
+                         timeout: Optional[float] = None) -> List[QuotaWire]:
+        response = await self._client(timeout).get_call(endpoint=QUOTAS_ENDPOINT, headers=service_headers(headers))
+        response.raise_for_status()
+        # The endpoint returns a flat list of quotas
+        return [QuotaWire.model_validate(item) for item in response.json()]
@@ -1,28 +1,51 @@
 # app/agent/ms_nodes/history_node.py
 from __future__ import annotations
-from typing import Dict, List
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
+from typing import Dict, Tuple
 from langgraph.runtime import Runtime
 
-from app.agent.ms_clients.history_client import HistoryClient, to_langchain, from_langchain
+import asyncio
+import httpx
+from qgdiag_lib_arquitectura.utilities.logging_conf import CustomLogger
+
+from app.agent.deadline import budget, expired
+from app.agent.history_record import HistoryRecord
+from app.agent.ms_clients.history_client import HistoryClient
 from app.agent.state import State
+from app.settings import settings
+
+log = CustomLogger(name="history.node", log_type="Technical")
 
-async def load_history(state: State, runtime: Runtime) -> Dict[str, List[BaseMessage]]:
+async def load_history(state: State, runtime: Runtime) -> Dict[str, Tuple[HistoryRecord, ...]]:
     """
     Hydrate state with prior conversation (before this turn).
+    The history is kept apart from `messages` as compact HistoryRecord objects and
+    only becomes LangChain messages when call_model builds the prompt.
+    If the history MS does not answer within the request budget, the turn
+    continues without history instead of failing.
     """
     ctx = runtime.context
     if not ctx.conversation_id:
-        return {"messages": []}
+        return {"history": ()}
+    if expired(ctx.deadline):
+        log.warning(f"Deadline agotado antes de cargar el historial de {ctx.conversation_id}")
+        return {"history": ()}
 
+    timeout = budget(ctx.deadline, settings.HISTORY_TIMEOUT_S)
     client = HistoryClient()
-    raw_msgs = await client.get_messages(
-        conversation_id=ctx.conversation_id,
-        headers=ctx.headers
-    )
+    try:
+        records = await asyncio.wait_for(
+            client.get_records(
+                conversation_id=ctx.conversation_id,
+                headers=ctx.headers,
+                timeout=timeout,
+            ),
+            timeout=timeout,
+        )
+    except (TimeoutError, httpx.TimeoutException):
+        log.warning(f"Timeout ({timeout:.1f}s) cargando historial de {ctx.conversation_id}; se continúa sin historial")
+        return {"history": ()}
 
-    lc_msgs: List[BaseMessage] = [to_langchain(m) for m in raw_msgs]
-    return {"messages": lc_msgs}
+    return {"history": tuple(records)}
 
 async def write_user(state: State, runtime: Runtime) -> Dict:
     """
@@ -0,0 +1,222 @@
+# app/agent/resilience.py
+"""
+Invocación resiliente del chat de AI Core.
+
+- Si no llega el primer token en AICORE_TTFT_TIMEOUT_S, se reintenta la conexión
+  (o, con AICORE_HEDGE_ENABLED, se lanza una segunda petición sin cortar la primera
+  y gana la que antes produzca un token).
+- Los errores antes del primer token se reintentan; una vez emitidos tokens no se
+  reintenta para no duplicar texto en el stream.
+- Un circuit breaker por engine_id corta en seco las llamadas cuando el backend
+  acumula fallos seguidos, y deja pasar una sonda tras AICORE_BREAKER_RESET_S.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessageChunk
+from qgdiag_lib_arquitectura.utilities.logging_conf import CustomLogger
+
+from app.settings import settings, settings_provider
+
+log = CustomLogger(name="agent.resilience", log_type="Technical")
+
+
+class CircuitOpenError(RuntimeError):
+    """El breaker del engine está abierto: no se llama al backend."""
+
+    def __init__(self, engine_id: str, retry_after_s: float):
+        super().__init__(f"AI Core engine {engine_id} is unavailable (circuit open)")
+        self.engine_id = engine_id
+        self.retry_after_s = retry_after_s
+
+
+class FirstTokenTimeout(RuntimeError):
+    """Ningún intento produjo el primer token a tiempo."""
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, engine_id: str, *, failure_threshold: int, reset_timeout_s: float):
+        self.engine_id = engine_id
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def before_call(self) -> None:
+        """Lanza CircuitOpenError si no se debe llamar al backend ahora."""
+        if self.state == self.CLOSED:
+            return
+        elapsed = time.monotonic() - self.opened_at
+        if self.state == self.OPEN and elapsed >= self.reset_timeout_s:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return
+        raise CircuitOpenError(self.engine_id, max(self.reset_timeout_s - elapsed, 0.0))
+
+    def rejecting(self) -> bool:
+        """True si ahora mismo se rechazarían llamadas (abierto y sin cumplir el reset)."""
+        return self.state == self.OPEN and time.monotonic() - self.opened_at < self.reset_timeout_s
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_cancelled(self) -> None:
+        """La llamada se abandonó sin veredicto (cliente desconectado): libera la sonda."""
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                log.warning(f"Circuit breaker abierto para engine {self.engine_id} tras {self.failures} fallos")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+
+
+def breaker_for(engine_id: str) -> CircuitBreaker:
+    breaker = _BREAKERS.get(engine_id)
+    if breaker is None:
+        breaker = CircuitBreaker(
+            engine_id,
+            failure_threshold=settings.AICORE_BREAKER_FAILURES,
+            reset_timeout_s=settings.AICORE_BREAKER_RESET_S,
+        )
+        _BREAKERS[engine_id] = breaker
+    return breaker
+
+
+def _on_settings_change(old, new, changed) -> None:
+    if changed & {"AICORE_BREAKER_FAILURES", "AICORE_BREAKER_RESET_S"}:
+        for breaker in _BREAKERS.values():
+            breaker.failure_threshold = new.AICORE_BREAKER_FAILURES
+            breaker.reset_timeout_s = new.AICORE_BREAKER_RESET_S
+
+
+settings_provider.subscribe(_on_settings_change)
+
+
+class _Attempt:
+    """Un stream en curso y la tarea que espera su primer chunk."""
+
+    def __init__(self, chat: BaseChatModel, messages: List[Any], config: Any):
+        self.stream = chat.astream(messages, config=config)
+        self.first = asyncio.ensure_future(self.stream.__anext__())
+
+    async def close(self) -> None:
+        self.first.cancel()
+        try:
+            await self.stream.aclose()
+        except Exception:  # pragma: no cover - cierre best-effort
+            pass
+
+
+class ResilientChatInvoker:
+    def __init__(
+        self,
+        chat: BaseChatModel,
+        *,
+        engine_id: str,
+        ttft_timeout_s: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        hedge: Optional[bool] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.chat = chat
+        self.engine_id = engine_id
+        self.ttft_timeout_s = settings.AICORE_TTFT_TIMEOUT_S if ttft_timeout_s is None else ttft_timeout_s
+        self.max_retries = settings.AICORE_STREAM_RETRIES if max_retries is None else max_retries
+        self.hedge = settings.AICORE_HEDGE_ENABLED if hedge is None else hedge
+        self.breaker = breaker or breaker_for(engine_id)
+        self.ttft_s: Optional[float] = None  # TTFT del intento ganador
+
+    async def astream(self, messages: List[Any], config: Any = None) -> AsyncIterator[BaseMessageChunk]:
+        self.breaker.before_call()
+        started = time.monotonic()
+        attempt: Optional[_Attempt] = None
+        verdict = False
+        try:
+            attempt, first = await self._first_token(messages, config)
+            self.ttft_s = time.monotonic() - started
+            if first is not None:
+                yield first
+                async for chunk in attempt.stream:
+                    yield chunk
+            verdict = True
+            self.breaker.record_success()
+        except Exception:
+            verdict = True
+            self.breaker.record_failure()
+            raise
+        finally:
+            if not verdict:
+                self.breaker.record_cancelled()
+            if attempt is not None:
+                await attempt.close()
+
+    async def _first_token(self, messages: List[Any], config: Any) -> Tuple[_Attempt, Optional[BaseMessageChunk]]:
+        """
+        Arranca intentos hasta obtener un primer chunk. Devuelve el intento ganador
+        (los demás quedan cerrados) y su primer chunk (None si el stream vino vacío).
+        """
+        launched = 0
+        live: Set[_Attempt] = set()
+        last_error: Optional[BaseException] = None
+        try:
+            while True:
+                if not live:
+                    if launched > self.max_retries:
+                        if last_error is not None:
+                            raise last_error
+                        raise FirstTokenTimeout(
+                            f"No first token from engine {self.engine_id} after {launched} attempts"
+                        )
+                    if launched:
+                        log.warning(f"Reintentando stream de {self.engine_id} (intento {launched + 1})")
+                    live.add(_Attempt(self.chat, messages, config))
+                    launched += 1
+
+                done, _ = await asyncio.wait(
+                    {a.first for a in live}, timeout=self.ttft_timeout_s, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    if self.hedge and launched <= self.max_retries:
+                        # Hedge: segundo intento en paralelo, sin cortar el primero.
+                        log.warning(f"Sin primer token de {self.engine_id} en {self.ttft_timeout_s}s; lanzando hedge")
+                        live.add(_Attempt(self.chat, messages, config))
+                        launched += 1
+                    else:
+                        for a in live:
+                            await a.close()
+                        live.clear()
+                        last_error = None
+                    continue
+
+                for a in [a for a in live if a.first in done]:
+                    exc = a.first.exception()
+                    if exc is None:
+                        live.discard(a)
+                        return a, a.first.result()
+                    live.discard(a)
+                    await a.close()
+                    if isinstance(exc, StopAsyncIteration):
+                        return a, None
+                    last_error = exc
+                    log.warning(f"Fallo antes del primer token en {self.engine_id}: {exc!r}")
+        finally:
+            for a in live:
+                await a.close()
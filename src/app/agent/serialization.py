@@ -0,0 +1,36 @@
+# app/agent/serialization.py
+from __future__ import annotations
+import json
+from typing import Any, Dict, List, Sequence
+from langchain_core.messages import BaseMessage
+
+try:  # orjson es opcional: si no está instalado usamos el json estándar
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    """Último recurso para tipos que el encoder no sabe serializar."""
+    if isinstance(obj, BaseMessage):
+        return message_to_dict(obj)
+    return str(obj)
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Serializa a JSON (UTF-8) con orjson si está disponible.
+    Mantiene los caracteres no-ASCII tal cual, igual que json.dumps(ensure_ascii=False).
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, ensure_ascii=False, default=_default).encode("utf-8")
+
+
+def message_to_dict(msg: BaseMessage) -> Dict[str, Any]:
+    """Volcado pydantic v2 de un mensaje de LangChain (sustituye al deprecado .dict())."""
+    return msg.model_dump()
+
+
+def messages_to_dicts(msgs: Sequence[BaseMessage]) -> List[Dict[str, Any]]:
+    return [message_to_dict(m) for m in msgs]
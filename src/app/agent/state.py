@@ -1,9 +1,10 @@
 from __future__ import annotations
 from dataclasses import dataclass, field
-from typing import Sequence
+from typing import Sequence, Tuple
 from langchain_core.messages import AnyMessage
 from langgraph.graph import add_messages
 from langgraph.managed import IsLastStep
+from app.agent.history_record import HistoryRecord
 from typing_extensions import Annotated
 
 @dataclass
@@ -13,3 +14,5 @@ class InputState:
 @dataclass
 class State(InputState):
     is_last_step: IsLastStep = field(default=False)
+    # Historial previo al turno (load_history); se convierte a mensajes solo en call_model
+    history: Tuple[HistoryRecord, ...] = ()
@@ -0,0 +1,120 @@
+# app/agent/tokens.py
+"""
+Conteo local de tokens.
+
+Sirve para estimar los tokens del prompt antes de llamar al modelo (empaquetado del
+contexto, comprobaciones de presupuesto) y para contabilizar el consumo cuando el
+proveedor no devuelve usage en el stream.
+
+- Usa tiktoken con la codificación TOKENIZER_ENCODING si está disponible. Cargarla
+  cuesta (lee y parsea el fichero BPE, o lo descarga si no está en
+  TIKTOKEN_CACHE_DIR), así que se hace una sola vez en el warm-up y nunca en el
+  camino de una petición: hasta entonces, o si no se puede cargar, se usa una
+  estimación de ~4 caracteres por token.
+- Los conteos se guardan en un LRU por texto (TOKENIZER_CACHE_SIZE): el prompt de
+  sistema y los mensajes del historial se repiten en cada paso y cada turno.
+"""
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from typing import Any, Iterable, Optional
+
+from qgdiag_lib_arquitectura.utilities.logging_conf import CustomLogger
+
+from app.settings import settings
+
+log = CustomLogger(name="agent.tokens", log_type="Technical")
+
+# Formato de chat de OpenAI: ~4 tokens de envoltorio por mensaje y 3 para cebar la respuesta
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+# Textos más cortos no compensan la búsqueda en la caché
+_MIN_CACHED_CHARS = 64
+
+
+def heuristic_count(text: str) -> int:
+    """Estimación barata (~4 caracteres por token)."""
+    return (len(text) + 3) // 4 if text else 0
+
+
+class Tokenizer:
+    def __init__(self, encoding_name: str = "o200k_base", cache_size: int = 4096):
+        self.encoding_name = encoding_name
+        self.cache_size = cache_size
+        self._encoding: Any = None
+        self._load_failed = False
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+
+    @property
+    def exact(self) -> bool:
+        """True si los conteos salen de la codificación real (no de la heurística)."""
+        return self._encoding is not None
+
+    def load(self) -> bool:
+        """Carga la codificación (bloqueante, una sola vez). False si no está disponible."""
+        if self._encoding is not None or self._load_failed:
+            return self._encoding is not None
+        try:
+            import tiktoken  # diferido: no se importa al arrancar
+
+            self._encoding = tiktoken.get_encoding(self.encoding_name)
+        except Exception as e:
+            self._load_failed = True
+            log.warning(f"Tokenizer '{self.encoding_name}' no disponible, se estima por longitud: {type(e).__name__}: {e}")
+            return False
+        self._cache.clear()  # los conteos heurísticos dejan de valer
+        return True
+
+    async def aload(self) -> bool:
+        return await asyncio.to_thread(self.load)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is None:
+            return heuristic_count(text)
+        if len(text) < _MIN_CACHED_CHARS:
+            return len(self._encoding.encode_ordinary(text))
+        n = self._cache.get(text)
+        if n is not None:
+            self._cache.move_to_end(text)
+            return n
+        n = len(self._encoding.encode_ordinary(text))
+        self._cache[text] = n
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return n
+
+    def count_messages(self, messages: Iterable[Any]) -> int:
+        """Tokens de prompt de una lista de mensajes (dicts role/content o mensajes de LangChain)."""
+        total = TOKENS_PER_REPLY
+        for m in messages:
+            content = m.get("content") if isinstance(m, dict) else getattr(m, "content", "")
+            total += TOKENS_PER_MESSAGE + self.count(_content_text(content))
+        return total
+
+
+def _content_text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(c if isinstance(c, str) else (c.get("text") or "") for c in content if isinstance(c, (str, dict)))
+    return ""
+
+
+tokenizer = Tokenizer(settings.TOKENIZER_ENCODING, settings.TOKENIZER_CACHE_SIZE)
+
+
+def estimate_prompt_tokens(messages: Iterable[Any]) -> int:
+    """Estimación de los tokens de prompt antes de la llamada (sin E/S)."""
+    return tokenizer.count_messages(messages)
+
+
+def usage_from_metadata(usage_metadata: Optional[dict]) -> Optional[dict]:
+    """usage_metadata de LangChain -> {prompt_tokens, completion_tokens, total_tokens}."""
+    if not usage_metadata:
+        return None
+    prompt = int(usage_metadata.get("input_tokens") or 0)
+    completion = int(usage_metadata.get("output_tokens") or 0)
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
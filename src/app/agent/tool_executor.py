@@ -0,0 +1,211 @@
+# app/agent/tool_executor.py
+"""
+Ejecución de tools fuera del event loop.
+
+ToolNode ejecutaba las tools en el event loop: una tool síncrona o de CPU (parsear
+documentos, cálculos, SDKs bloqueantes) congelaba todos los streams del worker. Cada
+tool declara ahora su clase de ejecución con `@tool_execution(...)`:
+
+- "async": corrutina que se espera en el event loop (solo E/S asíncrona).
+- "thread": pool de TOOL_THREAD_WORKERS hilos (SDKs bloqueantes, E/S síncrona).
+- "process": pool de TOOL_PROCESS_WORKERS procesos (CPU). La función y sus argumentos
+  deben poder serializarse con pickle (función de módulo, no local ni lambda).
+
+Sin decorador, las corrutinas son "async" y el resto "thread". Cada llamada tiene un
+timeout (el de la tool o TOOL_TIMEOUT_S) que devuelve un ToolMessage de error. Al
+cancelar o agotar el timeout, las llamadas que siguen en cola se retiran del pool; las
+que ya corren en un hilo o proceso no se pueden interrumpir y terminan en segundo plano
+(su resultado se descarta).
+
+Cada llamada emite un evento custom `tool_timing` (cola, ejecución y total) que
+/react-stream añade al evento `tool_end`.
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import inspect
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Literal, Optional, Tuple
+
+from langchain_core.callbacks import adispatch_custom_event
+from langchain_core.tools import BaseTool, StructuredTool, ToolException
+
+from qgdiag_lib_arquitectura.utilities.logging_conf import CustomLogger
+
+from app.services.metrics import TOOL_LATENCY, TOOL_QUEUE_WAIT, TOOL_TIMEOUTS
+from app.settings import settings
+
+log = CustomLogger(name="agent.tool_executor", log_type="Technical")
+
+ExecutionClass = Literal["async", "thread", "process"]
+_EXECUTION_CLASSES = ("async", "thread", "process")
+
+
+@dataclass(frozen=True)
+class ToolSpec:
+    execution: ExecutionClass
+    timeout_s: Optional[float] = None  # None = TOOL_TIMEOUT_S
+
+
+def tool_execution(execution: ExecutionClass, *, timeout_s: Optional[float] = None) -> Callable[[Callable], Callable]:
+    """Declara cómo se ejecuta una tool. Devuelve la misma función (sigue siendo picklable)."""
+    if execution not in _EXECUTION_CLASSES:
+        raise ValueError(f"Unknown execution class '{execution}', expected one of {_EXECUTION_CLASSES}")
+
+    def decorator(fn: Callable) -> Callable:
+        fn.__tool_spec__ = ToolSpec(execution, timeout_s)
+        return fn
+    return decorator
+
+
+def spec_of(fn: Callable) -> ToolSpec:
+    spec = getattr(fn, "__tool_spec__", None)
+    if spec is not None:
+        return spec
+    return ToolSpec("async" if inspect.iscoroutinefunction(fn) else "thread")
+
+
+def _run_timed(fn: Callable, kwargs: Dict[str, Any]) -> Tuple[float, Any]:
+    """Se ejecuta en el worker: devuelve el instante de inicio (monotonic, común a los procesos del host)."""
+    return time.monotonic(), fn(**kwargs)
+
+
+def _noop() -> None:
+    return None
+
+
+class ToolExecutor:
+    def __init__(self, thread_workers: int = 8, process_workers: int = 2, default_timeout_s: float = 30.0):
+        self.thread_workers = max(1, thread_workers)
+        self.process_workers = max(1, process_workers)
+        self.default_timeout_s = default_timeout_s
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._pending: Dict[str, int] = {"thread": 0, "process": 0}
+        self._pending_lock = threading.Lock()  # los done-callbacks llegan desde los hilos del pool
+        self._specs: Dict[str, ToolSpec] = {}
+
+    # ---------------------------------------------------------------- pools
+
+    def _pool(self, execution: str) -> Executor:
+        # Se crean al primer uso: un worker sin tools de CPU no arranca procesos
+        if execution == "thread":
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(self.thread_workers, thread_name_prefix="tool")
+            return self._threads
+        if self._processes is None:
+            # spawn: hacer fork de un proceso con hilos y event loop no es seguro
+            self._processes = ProcessPoolExecutor(self.process_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._processes
+
+    async def start_processes(self) -> int:
+        """Arranca los procesos del pool (warm-up): el primero tarda en importar los módulos de las tools."""
+        loop = asyncio.get_running_loop()
+        pool = self._pool("process")
+        await asyncio.gather(*(loop.run_in_executor(pool, _noop) for _ in range(self.process_workers)))
+        return self.process_workers
+
+    def shutdown(self) -> None:
+        """Cierra los pools sin esperar; las llamadas en cola se cancelan."""
+        for pool in (self._threads, self._processes):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._threads = self._processes = None
+
+    # ---------------------------------------------------------------- tools
+
+    def as_tools(self, fns: Iterable[Callable]) -> List[BaseTool]:
+        return [self.as_tool(fn) for fn in fns]
+
+    def as_tool(self, fn: Callable) -> BaseTool:
+        """Envuelve una función como tool de LangChain que se ejecuta según su ToolSpec."""
+        spec = spec_of(fn)
+        if spec.execution == "process" and "<locals>" in fn.__qualname__:
+            raise ValueError(f"Process tool '{fn.__name__}' must be a module-level function (picklable)")
+        if spec.execution == "async" and not inspect.iscoroutinefunction(fn):
+            raise ValueError(f"Async tool '{fn.__name__}' must be a coroutine function")
+        name = fn.__name__
+        self._specs[name] = spec
+
+        @functools.wraps(fn)
+        async def run(**kwargs: Any) -> Any:
+            return await self.call(name, fn, spec, kwargs)
+
+        return StructuredTool.from_function(
+            coroutine=run,
+            name=name,
+            description=(fn.__doc__ or "").strip() or "No description.",
+            handle_tool_error=True,  # timeout -> ToolMessage con status="error"
+        )
+
+    def describe(self, name: str) -> Optional[Dict[str, Any]]:
+        """Clase de ejecución de una tool y llamadas en vuelo en su pool (evento tool_start)."""
+        spec = self._specs.get(name)
+        if spec is None:
+            return None
+        return {"execution": spec.execution, "pool_pending": self._pending.get(spec.execution, 0)}
+
+    async def call(self, name: str, fn: Callable, spec: ToolSpec, kwargs: Dict[str, Any]) -> Any:
+        timeout_s = spec.timeout_s if spec.timeout_s is not None else self.default_timeout_s
+        submitted = time.monotonic()
+        started: Optional[float] = None
+        timed_out = False
+        try:
+            if spec.execution == "async":
+                started = submitted
+                return await asyncio.wait_for(fn(**kwargs), timeout=timeout_s)
+            future = self._submit(spec.execution, fn, kwargs)
+            started, result = await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout_s)
+            return result
+        except TimeoutError:
+            timed_out = True
+            TOOL_TIMEOUTS.inc(name)
+            log.warning(f"Tool '{name}' ({spec.execution}) agotó su timeout de {timeout_s:g}s")
+            raise ToolException(f"Error: tool '{name}' timed out after {timeout_s:g}s.") from None
+        finally:
+            await self._report(name, spec, submitted, started, timed_out)
+
+    def _submit(self, execution: str, fn: Callable, kwargs: Dict[str, Any]):
+        future = self._pool(execution).submit(_run_timed, fn, kwargs)
+        with self._pending_lock:
+            self._pending[execution] += 1
+
+        def _done(_):
+            # Cuenta hasta que el hilo/proceso termina de verdad, aunque se haya abandonado
+            with self._pending_lock:
+                self._pending[execution] -= 1
+        future.add_done_callback(_done)
+        return future
+
+    async def _report(
+        self, name: str, spec: ToolSpec, submitted: float, started: Optional[float], timed_out: bool
+    ) -> None:
+        ended = time.monotonic()
+        TOOL_LATENCY.observe(ended - submitted, name, spec.execution)
+        if started is not None:
+            TOOL_QUEUE_WAIT.observe(started - submitted, spec.execution)
+        # Con timeout no se sabe cuánto estuvo en cola y cuánto corriendo
+        timing = {
+            "execution": spec.execution,
+            "queue_ms": round((started - submitted) * 1000, 1) if started is not None else None,
+            "run_ms": round((ended - started) * 1000, 1) if started is not None else None,
+            "latency_ms": round((ended - submitted) * 1000, 1),
+            "timed_out": timed_out,
+        }
+        try:
+            await adispatch_custom_event("tool_timing", timing)
+        except RuntimeError:
+            # Fuera de un run (p.ej. invocando la tool directamente)
+            pass
+
+
+tool_executor = ToolExecutor(
+    thread_workers=settings.TOOL_THREAD_WORKERS,
+    process_workers=settings.TOOL_PROCESS_WORKERS,
+    default_timeout_s=settings.TOOL_TIMEOUT_S,
+)
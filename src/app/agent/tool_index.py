@@ -0,0 +1,74 @@
+# app/agent/tool_index.py
+"""
+Índice local para elegir qué tools se ofrecen al modelo en cada paso.
+
+BM25 sobre el nombre, la descripción y las keywords de cada tool, sin dependencias ni
+red. Los términos se normalizan (minúsculas, sin tildes, snake_case partido) y se
+recortan a un prefijo de STEM_CHARS caracteres: un stemming barato que sirve igual en
+español y en inglés ("movimientos"/"movimiento", "searching"/"search").
+"""
+from __future__ import annotations
+
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Sequence
+
+STEM_CHARS = 6
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "the and for with from that this are you your una uno los las del por para con que como "
+    "sus esta este return returns given".split()
+)
+
+
+def terms(text: str) -> List[str]:
+    text = unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode("ascii")
+    return [w[:STEM_CHARS] for w in _WORD.findall(text.replace("_", " ")) if len(w) > 2 and w not in _STOPWORDS]
+
+
+class ToolIndex:
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._docs: Dict[str, Counter] = {}
+        self._lengths: Dict[str, int] = {}
+        self._df: Counter = Counter()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._docs
+
+    def add(self, name: str, text: str) -> None:
+        if name in self._docs:
+            self._df.subtract(self._docs[name].keys())
+        tf = Counter(terms(text))
+        self._docs[name] = tf
+        self._lengths[name] = sum(tf.values())
+        self._df.update(tf.keys())
+
+    def scores(self, query: str, candidates: Iterable[str]) -> Dict[str, float]:
+        q = set(terms(query))
+        n = len(self._docs) or 1
+        avg_len = (sum(self._lengths.values()) / n) or 1.0
+        out: Dict[str, float] = {}
+        for name in candidates:
+            tf = self._docs.get(name)
+            if tf is None:
+                out[name] = 0.0
+                continue
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[name] / avg_len)
+            score = 0.0
+            for t in q:
+                f = tf.get(t)
+                if f:
+                    idf = math.log(1 + (n - self._df[t] + 0.5) / (self._df[t] + 0.5))
+                    score += idf * f * (self.k1 + 1) / (f + norm)
+            out[name] = score
+        return out
+
+    def rank(self, query: str, candidates: Sequence[str], k: int) -> List[str]:
+        """Las `k` candidatas con más puntuación (empates: orden de `candidates`)."""
+        scores = self.scores(query, candidates)
+        order = {name: i for i, name in enumerate(candidates)}
+        return sorted(candidates, key=lambda name: (-scores[name], order[name]))[:k]
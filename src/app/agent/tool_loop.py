@@ -0,0 +1,81 @@
+# app/agent/tool_loop.py
+"""
+Detección de llamadas a tool repetidas dentro de un turno.
+
+Con el protocolo por texto el modelo a veces vuelve a emitir la misma Action /
+Action Input tras recibir el ToolMessage. Cada repetición cuesta una vuelta completa
+a call_model, así que:
+
+- run_tools responde las llamadas idénticas (misma tool y argumentos) a una anterior
+  del turno con el resultado ya obtenido, sin ejecutarlas, y se lo indica al modelo;
+- cuando el turno acumula TOOL_LOOP_MAX_REPEATS repeticiones, call_model hace un
+  último paso sin tools que solo admite Final Answer.
+
+Todo se calcula a partir de los mensajes del turno (el historial va aparte en el
+estado), sin estado adicional.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List, Mapping, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+
+MEMO_NOTE = (
+    "Note: this exact tool call was already made in this turn and this is its result. "
+    "Do not repeat it; use it to write the Final Answer."
+)
+
+FINAL_ANSWER_PROMPT = """
+            You are a precise assistant. You already called tools in this turn and their
+            results are in the conversation. Tools are no longer available.
+
+            Respond with EXACTLY:
+            Final Answer: <your answer based on the tool results above>
+
+            - NEVER output an Action. No explanations, no code fences, no commentary.
+            """
+
+LOOP_ANSWER = "No he podido completar la respuesta con las herramientas disponibles. Por favor, reformula la pregunta."
+
+
+def call_key(call: Mapping[str, Any]) -> str:
+    """Clave de una llamada: nombre + argumentos en JSON canónico."""
+    return json.dumps([call.get("name"), call.get("args") or {}], sort_keys=True, separators=(",", ":"), default=str)
+
+
+def turn_memo(messages: Sequence[BaseMessage]) -> Dict[str, Any]:
+    """
+    Resultado (contenido del ToolMessage) de cada llamada del turno que terminó sin error.
+    Se queda con el primero: los posteriores son respuestas del memo, que ya llevan MEMO_NOTE.
+    """
+    keys: Dict[str, str] = {}
+    memo: Dict[str, Any] = {}
+    for m in messages:
+        if isinstance(m, AIMessage):
+            for call in m.tool_calls:
+                keys[call["id"]] = call_key(call)
+        elif isinstance(m, ToolMessage) and m.status != "error" and m.tool_call_id in keys:
+            memo.setdefault(keys[m.tool_call_id], m.content)
+    return memo
+
+
+def repeated_calls(messages: Sequence[BaseMessage], calls: Sequence[Mapping[str, Any]] = ()) -> List[Mapping[str, Any]]:
+    """
+    Llamadas idénticas a otra anterior del turno: las de `messages` y, si se pasan,
+    las de `calls` (p.ej. las del AIMessage que se acaba de generar).
+    """
+    seen = set()
+    repeated = []
+    all_calls = [c for m in messages if isinstance(m, AIMessage) for c in m.tool_calls]
+    for call in [*all_calls, *calls]:
+        key = call_key(call)
+        if key in seen:
+            repeated.append(call)
+        seen.add(key)
+    return repeated
+
+
+def memo_message(call: Mapping[str, Any], content: Any) -> ToolMessage:
+    text = content if isinstance(content, str) else json.dumps(content, ensure_ascii=False, default=str)
+    return ToolMessage(content=f"{text}\n\n{MEMO_NOTE}", tool_call_id=call["id"], name=call["name"])
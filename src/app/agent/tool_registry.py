@@ -0,0 +1,245 @@
+# app/agent/tool_registry.py
+"""
+Registro de tools con carga diferida.
+
+Las tools se descubren sin importarlas:
+
+- TOOL_REGISTRY (config.yaml): nombre -> {target: "modulo:funcion", description,
+  execution, timeout_s}.
+- Entry points del grupo TOOL_ENTRY_POINT_GROUP de los paquetes instalados
+  (`nombre = "modulo:funcion"`). Si la misma tool aparece en config.yaml, la
+  configuración manda (p.ej. para darle descripción o timeout).
+
+El módulo de una tool (y sus SDKs) se importa la primera vez que se ejecuta, o al
+construir el prompt si no tiene `description` en la configuración. Cada feature ve
+solo sus tools (TOOL_FEATURES: feature -> nombres; las features no listadas ven
+todas): el prompt del protocolo se construye una vez por subconjunto y una tool fuera
+del subconjunto devuelve un error al modelo.
+
+Si la feature tiene más de TOOL_SELECTION_TOP_K tools, `select()` ofrece solo las k
+más relevantes para el mensaje del usuario y los últimos mensajes (índice BM25 local,
+ver app.agent.tool_index), así el prompt no crece con el catálogo.
+"""
+from __future__ import annotations
+
+import importlib
+import inspect
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from importlib.metadata import entry_points
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+from langchain_core.tools import BaseTool, StructuredTool, ToolException
+from langchain_core.tools.base import create_schema_from_function
+from langgraph.runtime import get_runtime
+from pydantic import ValidationError
+
+from qgdiag_lib_arquitectura.utilities.logging_conf import CustomLogger
+
+from app.agent.context import Context
+from app.agent.tool_index import ToolIndex
+from app.agent.tool_executor import ExecutionClass, ToolExecutor, ToolSpec, spec_of, tool_executor
+from app.agent.utils import build_forced_tool_prompt
+from app.settings import settings
+
+log = CustomLogger(name="agent.tool_registry", log_type="Technical")
+
+# Los argumentos se validan contra la firma real al importar la tool
+_ANY_ARGS = {"type": "object", "properties": {}, "additionalProperties": True}
+# Con selección por turno hay muchos subconjuntos posibles
+_MAX_CACHED_PROMPTS = 512
+
+
+@dataclass
+class ToolEntry:
+    name: str
+    target: str  # "paquete.modulo:funcion"
+    description: Optional[str] = None
+    execution: Optional[ExecutionClass] = None  # None = la del decorador / por defecto
+    timeout_s: Optional[float] = None
+    keywords: List[str] = field(default_factory=list)  # términos extra para la selección (p.ej. sinónimos)
+    source: str = "config"
+
+
+class ToolRegistry:
+    def __init__(self, entries: Mapping[str, ToolEntry], executor: Optional[ToolExecutor] = None):
+        self._entries: Dict[str, ToolEntry] = dict(entries)
+        self.executor = executor or tool_executor
+        self._loaded: Dict[str, Tuple[Callable, ToolSpec, Any]] = {}  # nombre -> (fn, spec, schema)
+        self._prompts: "OrderedDict[Tuple[str, ...], str]" = OrderedDict()
+        self.index = ToolIndex()
+
+    @classmethod
+    def discover(
+        cls, config: Mapping[str, Mapping[str, Any]], group: str = "", executor: Optional[ToolExecutor] = None
+    ) -> "ToolRegistry":
+        """Entry points de `group` + `config` (sin importar ninguna tool)."""
+        entries: Dict[str, ToolEntry] = {}
+        if group:
+            for ep in entry_points(group=group):
+                entries[ep.name] = ToolEntry(name=ep.name, target=ep.value, source="entry_point")
+        for name, cfg in config.items():
+            base = entries.get(name)
+            target = cfg.get("target") or (base.target if base else None)
+            if not target:
+                log.warning(f"Tool '{name}' sin target en TOOL_REGISTRY, se ignora")
+                continue
+            entries[name] = ToolEntry(
+                name=name,
+                target=target,
+                description=cfg.get("description"),
+                execution=cfg.get("execution"),
+                timeout_s=cfg.get("timeout_s"),
+                keywords=list(cfg.get("keywords") or []),
+                source="config",
+            )
+        return cls(entries, executor)
+
+    def names(self) -> List[str]:
+        return list(self._entries)
+
+    def loaded(self) -> List[str]:
+        return list(self._loaded)
+
+    def declares_processes(self) -> bool:
+        return any(e.execution == "process" for e in self._entries.values())
+
+    # ---------------------------------------------------------------- carga
+
+    def _load(self, name: str) -> Tuple[Callable, ToolSpec, Any]:
+        loaded = self._loaded.get(name)
+        if loaded is not None:
+            return loaded
+        entry = self._entries[name]
+        module_name, _, attr = entry.target.partition(":")
+        fn = importlib.import_module(module_name)
+        for part in attr.split("."):
+            fn = getattr(fn, part)
+        spec = spec_of(fn)
+        if entry.execution is not None or entry.timeout_s is not None:
+            spec = ToolSpec(entry.execution or spec.execution, entry.timeout_s if entry.timeout_s is not None else spec.timeout_s)
+        if spec.execution == "async" and not inspect.iscoroutinefunction(fn):
+            raise TypeError(f"Tool '{name}' is declared async but {entry.target} is not a coroutine function")
+        loaded = self._loaded[name] = (fn, spec, create_schema_from_function(name, fn))
+        log.info(f"Tool '{name}' cargada desde {entry.target} ({spec.execution})")
+        return loaded
+
+    def description(self, name: str) -> str:
+        entry = self._entries[name]
+        if entry.description is None:
+            fn, _, _ = self._load(name)
+            entry.description = (fn.__doc__ or "").strip() or "No description."
+        return entry.description
+
+    # ---------------------------------------------------------------- features
+
+    def for_feature(self, feature: Optional[str]) -> List[str]:
+        """Nombres de las tools que se ofrecen a `feature` (en el orden de TOOL_FEATURES)."""
+        selected = settings.TOOL_FEATURES.get(feature) if feature else None
+        if selected is None:
+            return self.names()
+        return [n for n in selected if n in self._entries]
+
+    def allowed(self, name: str, feature: Optional[str]) -> bool:
+        return name in self.for_feature(feature)
+
+    def forced_prompt(self, feature: Optional[str]) -> str:
+        """Prompt del protocolo de tools con todas las tools de `feature`."""
+        return self._prompt_for(tuple(self.for_feature(feature)))
+
+    def select(self, feature: Optional[str], query: str = "", *, full: bool = False) -> Tuple[List[str], str]:
+        """
+        Tools que se ofrecen en este paso y su prompt. Con más de TOOL_SELECTION_TOP_K
+        candidatas (y `full` a False) solo las k más relevantes para `query`, en el
+        orden del catálogo para que el prompt sea estable entre pasos.
+        """
+        names = self.for_feature(feature)
+        k = settings.TOOL_SELECTION_TOP_K
+        if not full and k > 0 and query and len(names) > k:
+            self._index(names)
+            chosen = set(self.index.rank(query, names, k))
+            names = [n for n in names if n in chosen]
+        return names, self._prompt_for(tuple(names))
+
+    def _index(self, names: List[str]) -> None:
+        for n in names:
+            if n not in self.index:
+                entry = self._entries[n]
+                try:
+                    description = self.description(n)
+                except Exception:
+                    description = ""  # se indexa por nombre; el prompt ya registra el error
+                self.index.add(n, " ".join([n, description, *entry.keywords]))
+
+    def _prompt_for(self, names: Tuple[str, ...]) -> str:
+        prompt = self._prompts.get(names)
+        if prompt is not None:
+            self._prompts.move_to_end(names)
+            return prompt
+        offered = []
+        for n in names:
+            try:
+                self.description(n)
+                offered.append(self._entries[n])
+            except Exception as e:
+                # No se ofrece; el prompt no se cachea para reintentarlo en la siguiente llamada
+                log.error(f"No se pudo cargar la tool '{n}': {type(e).__name__}: {e}")
+        prompt = build_forced_tool_prompt(offered)
+        if len(offered) == len(names):
+            self._prompts[names] = prompt
+            if len(self._prompts) > _MAX_CACHED_PROMPTS:
+                self._prompts.popitem(last=False)
+        return prompt
+
+    # ---------------------------------------------------------------- ejecución
+
+    def tools(self) -> List[BaseTool]:
+        """Tools para ToolNode; ninguna importa su implementación hasta que se ejecuta."""
+        return [self._lazy_tool(name) for name in self._entries]
+
+    def _lazy_tool(self, name: str) -> BaseTool:
+        async def run(**kwargs: Any) -> Any:
+            feature = _current_feature()
+            if not self.allowed(name, feature):
+                raise ToolException(f"Error: tool '{name}' is not available for this request.")
+            try:
+                fn, spec, schema = self._load(name)
+            except Exception as e:
+                log.error(f"No se pudo cargar la tool '{name}': {type(e).__name__}: {e}")
+                raise ToolException(f"Error: tool '{name}' is currently unavailable.") from None
+            try:
+                parsed = schema.model_validate(kwargs)
+            except ValidationError as e:
+                raise ToolException(f"Error: invalid arguments for tool '{name}': {e}") from None
+            args = {k: getattr(parsed, k) for k in parsed.model_dump() if k in kwargs}
+            return await self.executor.call(name, fn, spec, args)
+
+        return StructuredTool(
+            name=name,
+            description=self._entries[name].description or "",
+            args_schema=_ANY_ARGS,
+            coroutine=run,
+            handle_tool_error=True,
+        )
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            name: {
+                "target": e.target,
+                "source": e.source,
+                "loaded": name in self._loaded,
+                "execution": self._loaded[name][1].execution if name in self._loaded else e.execution,
+            }
+            for name, e in self._entries.items()
+        }
+
+
+def _current_feature() -> Optional[str]:
+    try:
+        return get_runtime(Context).context.feature
+    except Exception:
+        # Fuera de un run del grafo no hay feature: se permiten todas
+        return None
+
+
+tool_registry = ToolRegistry.discover(settings.TOOL_REGISTRY, settings.TOOL_ENTRY_POINT_GROUP)
@@ -1,17 +1,16 @@
-from typing import Any, Callable, List, Optional, cast
-from langchain_tavily import TavilySearch
-from langgraph.runtime import get_runtime
-from app.agent.context import Context
+from app.agent.tool_executor import tool_execution
 
 # async def search(query: str) -> Optional[dict[str, Any]]:
 #     """Search for general web results"""
 
+#     from langchain_tavily import TavilySearch  # import diferido: pesa en el arranque
+
 #     runtime = get_runtime(Context)
 #     wrapped = TavilySearch(max_results=runtime.context.max_search_results)
 #     return cast(dict[str, Any], await wrapped.ainvoke({"query": query}))
 
+@tool_execution("async", timeout_s=5)
 async def get_horoscope(sign: str) -> str:
     """Return a playful horoscope string for the given sign."""
     return f"{sign}: Next Tuesday you will befriend a baby otter."
 
-TOOLS: List[Callable[..., Any]] = [get_horoscope]
@@ -1,5 +1,4 @@
 from __future__ import annotations
-from langchain.chat_models import init_chat_model
 from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import BaseMessage
 from typing import Tuple
@@ -10,111 +9,175 @@ from langchain_core.messages import AIMessage
 
 from app.agent.aicore_langchain import get_openai_compatible_chat
 
-_TOOLCALL_ARRAY_RE = re.compile(r"\[{\s*\"id\".*?}\]", re.DOTALL)
+import re, json
+from uuid import uuid4
+from typing import Any, Dict, List, Optional, Tuple
+from langgraph.runtime import get_runtime
+from app.agent.context import Context
+from langchain_core.messages import AIMessage
+from dataclasses import dataclass
 
+# === Escáner lineal de JSON y del protocolo Action / Final Answer ===
+# Sin backtracking sobre el texto completo: los marcadores se localizan buscando ':'
+# con str.find y validando el literal delante, los strings JSON se consumen en un
+# solo match y cada carácter se visita O(1) veces.
 
-def get_message_text(msg: BaseMessage) -> str:
-    content = msg.content
-    if isinstance(content, str):
-        return content
-    elif isinstance(content, dict):
-        return content.get("text", "")
-    else:
-        txts = [c if isinstance(c, str) else (c.get("text") or "") for c in content]
-        return "".join(txts).strip()
+_JSON_TOKEN_RE = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*(?P<close>")?|[\[\]{}]', re.DOTALL)
+_TOOLCALL_START_RE = re.compile(r'\[{\s*"id"')
+_CLOSERS = {"]": "[", "}": "{"}
 
 
-def load_chat_model(fully_specified_name: str, *, headers=None, base_url=None) -> BaseChatModel:
+def find_json_end(text: str, start: int = 0) -> int:
     """
-    Load a chat model from a fully specified name.
-    Supports your special provider 'openai-compatible/<ENGINE_ID>' routed through AI Server.
-    Otherwise, it falls back to LangChain's init_chat_model(provider/model).
+    Índice justo después del objeto/array JSON que empieza en text[start] ('{' o '['),
+    emparejando corchetes y respetando strings y escapes. -1 si no se cierra.
+    No valida el contenido: eso lo hace json.loads sobre el trozo devuelto.
     """
-    provider, model = fully_specified_name.split("/", maxsplit=1)
-    if provider == "openai-compatible":
-        if headers is None or base_url is None:
-            raise ValueError("openai-compatible requires headers and base_url")
-        return get_openai_compatible_chat(headers=headers, base_url=base_url, engine_id=model)
-    return init_chat_model(model, model_provider=provider)
+    if start >= len(text) or text[start] not in "{[":
+        return -1
+    stack: List[str] = []
+    for tok in _JSON_TOKEN_RE.finditer(text, start):
+        ch = tok.group()
+        if ch[0] == '"':
+            if tok.group("close") is None:
+                return -1
+        elif ch in "{[":
+            stack.append(ch)
+        elif not stack or stack.pop() != _CLOSERS[ch]:
+            return -1
+        elif not stack:
+            return tok.end()
+    return -1
 
 
-def _try_extract_json_array(s: str) -> Optional[str]:
+def extract_toolcall_array(s: str) -> Optional[str]:
     """
-    Finds the first top-level JSON array substring that looks like a tool-call list.
-    Handles cases where the whole content is the stringified JSON, or content embeds it.
+    Primer array JSON con forma de lista de tool calls ('[{"id": ...}]'), con corchetes
+    emparejados. Si el primer candidato no llega a cerrarse, devuelve el candidato
+    anidado cerrado que empiece antes.
     """
     s = s.strip()
     if s.startswith("[") and s.endswith("]"):
         return s
-    m = _TOOLCALL_ARRAY_RE.search(s)
-    return m.group(0) if m else None
+    first = _TOOLCALL_START_RE.search(s)
+    if first is None:
+        return None
+    end = find_json_end(s, first.start())
+    if end != -1:
+        return s[first.start():end]
 
-def normalize_ai_toolcalls(ai: AIMessage) -> AIMessage:
+    # El primer candidato no cierra: una sola pasada más recogiendo los anidados.
+    candidates = {m.start() for m in _TOOLCALL_START_RE.finditer(s, first.end())}
+    stack: List[Tuple[str, int]] = []
+    best: Optional[Tuple[int, int]] = None
+    for tok in _JSON_TOKEN_RE.finditer(s, first.start()):
+        ch = tok.group()
+        if ch[0] == '"':
+            if tok.group("close") is None:
+                break
+        elif ch in "{[":
+            stack.append((ch, tok.start()))
+        elif stack:
+            # Cierre desemparejado: se descarta la apertura igualmente (best effort)
+            opener, opened_at = stack.pop()
+            if ch == "]" and opener == "[" and opened_at in candidates:
+                if best is None or opened_at < best[0]:
+                    best = (opened_at, tok.end())
+    return s[best[0]:best[1]] if best else None
+
+
+_FINAL_MARKER_RE = re.compile(r"Final Answer:", re.IGNORECASE)
+_ACTION_INPUT_MARKER_RE = re.compile(r"Action Input:", re.IGNORECASE)
+_ACTION_HEAD_RE = re.compile(r"Action:\s*(?P<tool>[A-Za-z0-9_\.\-\:]+)(?P<gap>\s*)", re.IGNORECASE)
+_SPACES_RE = re.compile(r"\s*")
+
+
+def _find_marker(text: str, marker_re: "re.Pattern[str]", pos: int = 0) -> int:
     """
-    If ai.content is a stringified array of OpenAI-style function calls, convert it
-    into LangChain's tool_calls structure on the message.
+    Inicio del primer marcador 'Xxx:' (sin distinguir mayúsculas) desde pos, o -1.
+    Localiza los ':' con str.find, mucho más rápido que una búsqueda IGNORECASE.
     """
-    if not isinstance(ai.content, str):
-        return ai
+    width = len(marker_re.pattern)
+    colon = text.find(":", pos + width - 1)
+    while colon != -1:
+        start = colon - width + 1
+        if marker_re.match(text, start):
+            return start
+        colon = text.find(":", colon + 1)
+    return -1
 
-    raw = _try_extract_json_array(ai.content)
-    if not raw:
-        return ai
 
-    try:
-        payload = json.loads(raw)
-        calls = []
-        for item in payload:
-            # Expected shape (from your example):
-            # { "id": "call_...", "type": "function", "name": "get_horoscope", "arguments": "{\"sign\":\"Virgo\"}" }
-            name = item.get("name")
-            if not name:
-                continue
-            args_raw = item.get("arguments", "{}")
-            args = json.loads(args_raw) if isinstance(args_raw, str) else (args_raw or {})
-            calls.append({
-                "id": item.get("id"),
-                "name": name,
-                "args": args,
-                # LangChain uses simple dicts; we don't need to carry vendor-specific fields
-            })
-        if not calls:
-            return ai
+@dataclass(frozen=True)
+class ProtocolAction:
+    tool: str
+    raw_input: str  # texto tras 'Action Input:' hasta la siguiente acción, sin espacios en los extremos
 
-        # Build a new AIMessage that ToolNode will recognize
-        return AIMessage(
-            content="",            # no human-readable content; it's a pure tool call
-            tool_calls=calls,      # <-- key bit ToolNode reads
-            additional_kwargs=ai.additional_kwargs,
-            response_metadata=ai.response_metadata,
-            id=ai.id,
-            name=ai.name
-        )
-    except Exception:
-        # If parsing fails, just return the original message
-        return ai
+    @property
+    def args(self) -> Any:
+        return _best_effort_json(self.raw_input)
 
 
-from __future__ import annotations
-from langchain.chat_models import init_chat_model
-from langchain_core.language_models import BaseChatModel
-from langchain_core.messages import BaseMessage
-from typing import Tuple
-import json
-import re
-from typing import Any, Dict, List, Tuple, Optional
-from langchain_core.messages import AIMessage
+@dataclass(frozen=True)
+class ProtocolScan:
+    final_answer: Optional[str]
+    actions: Tuple[ProtocolAction, ...] = ()
 
-from app.agent.aicore_langchain import get_openai_compatible_chat
 
-import re, json
-from uuid import uuid4
-from typing import Any, Dict, List, Optional, Tuple
-from langgraph.runtime import get_runtime
-from app.agent.context import Context
-from langchain_core.messages import AIMessage
+def find_final_answer(text: str) -> Optional[str]:
+    """Texto tras el primer 'Final Answer:' (sin espacios), o None si no hay respuesta final."""
+    start = _find_marker(text, _FINAL_MARKER_RE)
+    end = start + len(_FINAL_MARKER_RE.pattern)
+    if start == -1 or end == len(text):
+        return None
+    return text[end:].strip()
+
+
+def find_actions(text: str) -> List[ProtocolAction]:
+    """
+    Todas las acciones 'Action: <tool>' + salto de línea + 'Action Input: <args>', en orden.
+    El input de cada acción llega hasta el 'Action:' de la siguiente (o hasta el final).
+    """
+    heads: List[Tuple[int, str, int]] = []  # (inicio de 'Action:', tool, inicio del input)
+    width = len("Action:")
+    run_end = -1  # fin de la última racha de caracteres de nombre de tool analizada
+    colon = text.find(":", width - 1)
+    while colon != -1:
+        start = colon - width + 1
+        colon = text.find(":", colon + 1)
+        if start + width < run_end:
+            # Dentro de una racha ya analizada (p.ej. 'Action:Action:...'): el nombre
+            # acabaría en el mismo sitio y el resultado sería el mismo fallo.
+            continue
+        head = _ACTION_HEAD_RE.match(text, start)
+        if head is None:
+            continue
+        run_end = head.end("tool")
+        gap = head.group("gap")
+        if not gap or gap[-1] not in "\r\n":
+            continue
+        marker = _ACTION_INPUT_MARKER_RE.match(text, head.end())
+        if marker is None:
+            continue
+        input_start = _SPACES_RE.match(text, marker.end()).end()
+        heads.append((start, head.group("tool"), input_start))
+        colon = text.find(":", input_start + width - 1)
 
-_TOOLCALL_ARRAY_RE = re.compile(r"\[{\s*\"id\".*?}\]", re.DOTALL)
+    actions = []
+    for i, (_, tool, input_start) in enumerate(heads):
+        input_end = heads[i + 1][0] if i + 1 < len(heads) else len(text)
+        actions.append(ProtocolAction(tool=tool, raw_input=text[input_start:input_end].strip()))
+    return actions
+
+
+def scan_protocol(text: str) -> ProtocolScan:
+    """
+    Analiza la salida del modelo en tiempo lineal. 'Final Answer:' tiene prioridad:
+    si aparece, no se buscan acciones.
+    """
+    answer = find_final_answer(text)
+    if answer is not None:
+        return ProtocolScan(final_answer=answer)
+    return ProtocolScan(final_answer=None, actions=tuple(find_actions(text)))
 
 def get_message_text(msg: BaseMessage) -> str:
     content = msg.content
@@ -137,18 +200,10 @@ def load_chat_model(fully_specified_name: str, *, headers=None, base_url=None) -
         if headers is None or base_url is None:
             raise ValueError("openai-compatible requires headers and base_url")
         return get_openai_compatible_chat(headers=headers, base_url=base_url, engine_id=model)
-    return init_chat_model(model, model_provider=provider)
+    # Import diferido: el paquete langchain solo hace falta para proveedores genéricos
+    from langchain.chat_models import init_chat_model
 
-def _try_extract_json_array(s: str) -> Optional[str]:
-    """
-    Finds the first top-level JSON array substring that looks like a tool-call list.
-    Handles cases where the whole content is the stringified JSON, or content embeds it.
-    """
-    s = s.strip()
-    if s.startswith("[") and s.endswith("]"):
-        return s
-    m = _TOOLCALL_ARRAY_RE.search(s)
-    return m.group(0) if m else None
+    return init_chat_model(model, model_provider=provider)
 
 def normalize_ai_toolcalls(ai: AIMessage) -> AIMessage:
     """
@@ -158,7 +213,7 @@ def normalize_ai_toolcalls(ai: AIMessage) -> AIMessage:
     if not isinstance(ai.content, str):
         return ai
 
-    raw = _try_extract_json_array(ai.content)
+    raw = extract_toolcall_array(ai.content)
     if not raw:
         return ai
 
@@ -198,12 +253,6 @@ def normalize_ai_toolcalls(ai: AIMessage) -> AIMessage:
 # === Forzado de tool-calling por texto (ReAct minimalista) ===
 
  
-_ACTION_RE = re.compile(
-    r"Action:\s*(?P<tool>[A-Za-z0-9_\.\-\:]+)\s*[\r\n]+Action Input:\s*(?P<input>.*)",
-    re.DOTALL | re.IGNORECASE,
-)
-_FINAL_RE = re.compile(r"Final Answer:\s*(?P<answer>.+)", re.DOTALL | re.IGNORECASE)
- 
 def _strip_code_fences(s: str) -> str:
     s = s.strip()
     if s.startswith("```"):
@@ -216,7 +265,8 @@ def _strip_code_fences(s: str) -> str:
 def _best_effort_json(obj_text: str) -> Dict[str, Any]:
     """
     Intenta parsear un JSON 'action input'. Si falla, lo mete como {"input": "..."}.
-    Recorta a la última '}' para cortar ruido posterior si viene pegado a texto.
+    Recorta a la última '}' para cortar ruido posterior si viene pegado a texto; si
+    aun así no es JSON válido, prueba con el objeto de llaves emparejadas del inicio.
     """
     t = _strip_code_fences(obj_text).strip()
     if t.startswith("{"):
@@ -226,7 +276,16 @@ def _best_effort_json(obj_text: str) -> Dict[str, Any]:
     try:
         return json.loads(t)
     except Exception:
-        return {"input": t}
+        pass
+    if t.startswith("{") and t.rfind("}", 0, len(t) - 1) != -1:
+        # Solo merece la pena si hay otra '}' antes de la última
+        end = find_json_end(t)
+        if end != -1:
+            try:
+                return json.loads(t[:end])
+            except Exception:
+                pass
+    return {"input": t}
  
 def build_forced_tool_prompt(tools: List[Any]) -> str:
     """
@@ -238,7 +297,7 @@ def build_forced_tool_prompt(tools: List[Any]) -> str:
     tool_descs = []
     for fn in tools:
         name = getattr(fn, "__name__", None) or getattr(fn, "name", None) or "tool"
-        desc = (fn.__doc__ or "").strip() or "No description."
+        desc = (getattr(fn, "description", None) or fn.__doc__ or "").strip() or "No description."
         tool_names.append(name)
         tool_descs.append(f"- {name}: {desc}")
  
@@ -268,30 +327,24 @@ def parse_forced_tool_or_answer(full_text: str) -> AIMessage:
     """
     Devuelve un AIMessage:
       - Si detecta 'Final Answer:', content=respuesta y sin tool_calls
-      - Si detecta 'Action:' + 'Action Input:', content="" y tool_calls=[...]
+      - Si detecta 'Action:' + 'Action Input:', content="" y tool_calls=[...] (una por acción)
       - Si no detecta nada, devuelve el texto como content (fallback)
     """
     txt = full_text.strip()
+    scan = scan_protocol(txt)
  
     # 1) Final Answer
-    m_final = _FINAL_RE.search(txt)
-    if m_final:
-        answer = m_final.group("answer").strip()
-        return AIMessage(content=answer)
+    if scan.final_answer is not None:
+        return AIMessage(content=scan.final_answer)
  
-    # 2) Action + Input
-    m = _ACTION_RE.search(txt)
-    if m:
-        tool = m.group("tool").strip()
-        args_raw = m.group("input").strip()
-        args = _best_effort_json(args_raw)
+    # 2) Action + Input (una o varias)
+    if scan.actions:
         return AIMessage(
             content="",
-            tool_calls=[{
-                "id": f"call_{uuid4().hex[:8]}",
-                "name": tool,
-                "args": args
-            }]
+            tool_calls=[
+                {"id": f"call_{uuid4().hex[:8]}", "name": action.tool, "args": action.args}
+                for action in scan.actions
+            ]
         )
  
     # 3) Fallback
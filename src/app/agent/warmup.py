@@ -0,0 +1,110 @@
+# app/agent/warmup.py
+"""
+Warm-up del worker antes de declararse listo (/ready).
+
+La primera petición de un pod nuevo pagaba el handshake TLS con AI Core y los
+caminos "en frío" del grafo (primer astream_events, validadores de pydantic,
+callbacks...). Aquí se ejecutan esos pasos en el arranque, en paralelo:
+
+- `aicore_pool`: abre WARMUP_CONNECTIONS conexiones en el pool compartido de AI Core.
+- `chat_client`: construye un ChatOpenAI (sin red); el primero cuesta ~150 ms en
+  inicializar el cliente de openai y sus validadores, los siguientes < 1 ms.
+- `graph_turn`: un turno sintético completo del grafo contra un engine no-op
+  (sin red, sin historial, sin tools).
+- `tokenizer`: carga la codificación de tiktoken para el conteo local de tokens.
+- `prompts`: precarga las plantillas de PROMPTS_FEATURES del gestor de prompts.
+- `tool_processes`: arranca el pool de procesos si alguna tool declara en config.yaml
+  `execution: process` (las tools no se importan en el arranque).
+
+Cada paso es best-effort y con timeout: si falla se registra y el worker se declara
+listo igualmente (una caída de AI Core no debe dejar los pods fuera del balanceador).
+Otros módulos pueden añadir pasos con `register()` (p.ej. precargar cachés).
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Awaitable, Callable, Dict, List
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from qgdiag_lib_arquitectura.utilities.logging_conf import CustomLogger
+
+from app.agent.aicore_langchain import AICoreSession, build_chat, warm_connection_pool
+from app.agent.context import WARMUP_ENGINE_ID, Context
+from app.agent.graph import graph
+from app.agent.tokens import tokenizer
+from app.agent.tool_executor import tool_executor
+from app.agent.tool_registry import tool_registry
+from app.agent.ms_clients.prompt_client import prompt_client
+from app.agent.state import InputState
+from app.services.readiness import readiness
+from app.settings import settings
+
+log = CustomLogger(name="agent.warmup", log_type="Technical")
+
+
+WarmupStep = Callable[[], Awaitable[object]]
+_STEPS: Dict[str, WarmupStep] = {}
+
+
+def register(name: str, step: WarmupStep) -> None:
+    """Añade (o sustituye) un paso de warm-up."""
+    _STEPS[name] = step
+
+
+def step_names() -> List[str]:
+    """Nombres de los pasos tal y como aparecen en /ready."""
+    return [f"warmup:{name}" for name in _STEPS] if settings.WARMUP_ENABLED else []
+
+
+async def warm_aicore_pool() -> int:
+    return await warm_connection_pool(
+        settings.AICORE_URL, connections=settings.WARMUP_CONNECTIONS, timeout=settings.WARMUP_STEP_TIMEOUT_S
+    )
+
+
+async def build_chat_client() -> None:
+    session = AICoreSession(access_key="warmup", secret_key="warmup", cookies=None, base_url=settings.AICORE_URL)
+    await asyncio.to_thread(build_chat, session, settings.ENGINE_ID)  # síncrono y lento: fuera del loop
+
+
+async def synthetic_graph_turn() -> int:
+    """Un turno completo del grafo por astream_events (el camino de /react-stream). Devuelve nº de eventos."""
+    chat = GenericFakeChatModel(messages=iter([AIMessage(content="Final Answer: ok")]))
+    ctx = Context(engine_id=WARMUP_ENGINE_ID, chat_model=chat, conversation_id=None)
+    events = 0
+    async for _ in graph.astream_events(
+        InputState(messages=[HumanMessage(content="warm-up")]), context=ctx, recursion_limit=4
+    ):
+        events += 1
+    return events
+
+
+async def preload_prompts() -> int:
+    return await prompt_client.preload(settings.PROMPTS_FEATURES)
+
+
+async def _run_step(name: str, step: WarmupStep) -> None:
+    async with readiness.step(f"warmup:{name}"):
+        try:
+            await asyncio.wait_for(step(), settings.WARMUP_STEP_TIMEOUT_S)
+        except Exception as e:
+            log.warning(f"Warm-up '{name}' fallido, se continúa: {type(e).__name__}: {e}")
+
+
+async def run_warmup() -> None:
+    """Ejecuta en paralelo todos los pasos registrados (si WARMUP_ENABLED)."""
+    if not settings.WARMUP_ENABLED:
+        return
+    await asyncio.gather(*(_run_step(name, step) for name, step in _STEPS.items()))
+
+
+register("aicore_pool", warm_aicore_pool)
+register("chat_client", build_chat_client)
+register("tokenizer", tokenizer.aload)
+if settings.WARMUP_SYNTHETIC_TURN:
+    register("graph_turn", synthetic_graph_turn)
+if settings.PROMPTS_ENABLED and settings.PROMPTS_FEATURES:
+    register("prompts", preload_prompts)
+if tool_registry.declares_processes():
+    register("tool_processes", tool_executor.start_processes)
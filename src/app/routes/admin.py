@@ -0,0 +1,143 @@
+# app/routes/admin.py
+"""
+Endpoints de diagnóstico sobre el worker vivo (solo para IAG-App-Id en ADMIN_APP_IDS).
+
+- GET /admin/profile: perfil de muestreo (CPU del hilo del loop o pilas de tareas
+  asyncio) durante N segundos, en formato folded para flamegraph.pl / speedscope.
+- GET /admin/loop-lag: bloqueos recientes del event loop con la pila que los causó.
+- GET /admin/auth: estado del JWKS y de la caché de tokens verificados.
+- GET/POST /admin/settings: versión de la configuración y recarga inmediata.
+- GET /admin/prompts, POST /admin/prompts/invalidate: caché del gestor de prompts.
+- GET /admin/usage: consumo pendiente de envío y foto de cuotas.
+- GET /admin/tools: tools registradas, su origen y si ya se han importado.
+- GET /admin/cache: backend de la caché compartida y número de entradas.
+- GET /admin/admission: huecos y cola del control de admisión por aplicación.
+"""
+import asyncio
+from datetime import datetime, timezone
+from typing import Any, Dict, Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from qgdiag_lib_arquitectura.utilities.logging_conf import CustomLogger
+
+from app.agent.ms_clients.prompt_client import prompt_client
+from app.services.admission import admission
+from app.services.auth import authenticated_headers, token_cache
+from app.services.jwks import jwks_manager
+from app.services.profiling import ProfilerBusy, loop_monitor, sample_cpu, sample_tasks
+from app.services.usage import usage_accountant
+from app.agent.tool_registry import tool_registry
+from app.services.cache import cache_backend
+from app.settings import settings, settings_provider
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+log = CustomLogger(name="admin.endpoint", log_type="Technical")
+
+
+def require_admin(headers: Dict[str, str] = Depends(authenticated_headers)) -> Dict[str, str]:
+    """Solo las aplicaciones listadas en ADMIN_APP_IDS pueden perfilar el worker."""
+    if headers.get("IAG-App-Id") not in settings.ADMIN_APP_IDS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return headers
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile(
+    mode: Literal["cpu", "tasks"] = "cpu",
+    seconds: float = Query(default=10.0, gt=0),
+    interval_ms: float = Query(default=5.0, ge=1, le=1000),
+    all_threads: bool = False,
+    headers: Dict[str, str] = Depends(require_admin),
+) -> PlainTextResponse:
+    """
+    Perfila el worker durante `seconds` (acotado por PROFILE_MAX_SECONDS).
+    mode=cpu muestrea la pila del hilo del loop (all_threads=true incluye los hilos
+    de asyncio.to_thread); mode=tasks muestrea dónde espera cada tarea asyncio.
+    """
+    seconds = min(seconds, settings.PROFILE_MAX_SECONDS)
+    log.info(f"Perfilado mode={mode} seconds={seconds} solicitado por {headers.get('IAG-App-Id')}")
+    try:
+        if mode == "cpu":
+            folded = await sample_cpu(seconds, interval_ms / 1000, all_threads=all_threads)
+        else:
+            folded = await sample_tasks(seconds, max(interval_ms, 10.0) / 1000)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    return PlainTextResponse(
+        folded,
+        headers={"Content-Disposition": f'attachment; filename="profile-{mode}-{stamp}.folded"'},
+    )
+
+
+@router.get("/loop-lag")
+async def loop_lag(headers: Dict[str, str] = Depends(require_admin)) -> Dict[str, Any]:
+    """Lag máximo observado y últimos bloqueos del event loop, con su pila."""
+    return loop_monitor.snapshot()
+
+
+@router.get("/auth")
+async def auth_state(headers: Dict[str, str] = Depends(require_admin)) -> Dict[str, Any]:
+    """Estado del JWKS (kids, antigüedad, recarga) y de la caché de tokens verificados."""
+    return {"jwks": jwks_manager.snapshot(), "token_cache_entries": len(token_cache)}
+
+
+@router.get("/settings")
+async def settings_state(headers: Dict[str, str] = Depends(require_admin)) -> Dict[str, Any]:
+    """Versión de la configuración cargada, ficheros vigilados y último error de recarga."""
+    return settings_provider.snapshot()
+
+
+@router.post("/settings/reload")
+async def settings_reload(headers: Dict[str, str] = Depends(require_admin)) -> Dict[str, Any]:
+    """Relee config.yaml (y overrides) ya, sin esperar a la vigilancia periódica."""
+    try:
+        changed = settings_provider.reload()
+    except Exception:
+        raise HTTPException(status_code=422, detail=f"Invalid settings: {settings_provider.last_error}")
+    log.info(f"Recarga de settings solicitada por {headers.get('IAG-App-Id')}: {sorted(changed)}")
+    return {"version": settings_provider.version, "changed": sorted(changed)}
+
+
+@router.get("/prompts")
+async def prompts_state(headers: Dict[str, str] = Depends(require_admin)) -> Dict[str, Any]:
+    """Plantillas en caché con su versión, ETag y antigüedad."""
+    return prompt_client.snapshot()
+
+
+@router.post("/prompts/invalidate")
+async def prompts_invalidate(
+    feature: Optional[str] = None, headers: Dict[str, str] = Depends(require_admin)
+) -> Dict[str, Any]:
+    """Descarta las plantillas (todas o las de `feature`) y vuelve a precargar las de PROMPTS_FEATURES."""
+    await prompt_client.invalidate(feature)
+    features = [f for f in settings.PROMPTS_FEATURES if feature is None or f == feature]
+    return {"cached": await prompt_client.preload(features)}
+
+
+@router.get("/usage")
+async def usage_state(headers: Dict[str, str] = Depends(require_admin)) -> Dict[str, Any]:
+    """Consumo acumulado pendiente de envío, foto de cuotas y último error de envío."""
+    return usage_accountant.snapshot()
+
+
+@router.get("/tools")
+async def tools_state(headers: Dict[str, str] = Depends(require_admin)) -> Dict[str, Any]:
+    """Tools registradas (config.yaml y entry points) y cuáles se han cargado ya."""
+    return tool_registry.snapshot()
+
+
+@router.get("/cache")
+async def cache_state(headers: Dict[str, str] = Depends(require_admin)) -> Dict[str, Any]:
+    """Backend de la caché compartida (memoria o SQLite del nodo) y su ocupación."""
+    return await asyncio.to_thread(cache_backend.stats)  # con SQLite cuenta las filas
+
+
+@router.get("/admission")
+async def admission_state(headers: Dict[str, str] = Depends(require_admin)) -> Dict[str, Any]:
+    """
+    Estado del control de admisión: huecos activos, profundidad de cola por app,
+    tiempos de espera y rechazos.
+    """
+    return admission.snapshot()
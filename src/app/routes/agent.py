@@ -1,14 +1,14 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends
-from pydantic import BaseModel
-from typing import Any, Dict, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Literal, Optional
+from uuid import uuid4
 
 from langchain_core.messages import HumanMessage
 
 from qgdiag_lib_arquitectura.schemas.response_body import ResponseBody
 from qgdiag_lib_arquitectura.utilities.logging_conf import CustomLogger
-from qgdiag_lib_arquitectura.security.authentication import get_authenticated_headers
 from qgdiag_lib_arquitectura.exceptions.types import (
     ForbiddenException,
     InternalServerErrorException,
@@ -20,11 +20,22 @@ from app.agent.graph import graph
 from app.agent.context import Context
 from app.agent.state import State
 from app.agent.utils import get_message_text
+from app.agent.history_record import to_messages
+from app.agent.serialization import dumps, messages_to_dicts
+from app.agent.deadline import deadline_after
+from app.agent.tokens import usage_from_metadata
+from app.agent.tool_executor import tool_executor
+from app.agent.resilience import CircuitOpenError
+from app.services.admission import Ticket, admission
+from app.services.auth import authenticated_headers
+from app.services.metrics import ACTIVE_STREAMS, STREAM_BYTES, STREAM_EVENTS
+from app.services.usage import usage_accountant
 
 # streaming addtions
 
 from fastapi import Response
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from datetime import datetime, timezone
 import asyncio
 import json
@@ -35,32 +46,71 @@ from fastapi import Depends
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, Optional, AsyncIterator
-import asyncio, json, time
+import asyncio, json, math, time
 
-from qgdiag_lib_arquitectura.security.authentication import get_authenticated_headers
 from app.settings import settings
-from app.agent.aicore_langchain import get_openai_compatible_chat
+from app.agent.aicore_langchain import get_openai_compatible_chat, open_aicore_session
 
 router = APIRouter(prefix="/agent", tags=["agent"])
 log = CustomLogger(name="agent.react.endpoint", log_type="Technical")
 
+
+def request_timeout_s(x_request_timeout: Optional[float] = Header(default=None, gt=0)) -> float:
+    """Presupuesto de la petición: cabecera X-Request-Timeout (segundos) o el valor por defecto."""
+    if x_request_timeout is None:
+        return settings.REQUEST_TIMEOUT_S
+    return min(x_request_timeout, settings.REQUEST_TIMEOUT_MAX_S)
+
+
+def request_deadline(timeout_s: float = Depends(request_timeout_s)) -> float:
+    """Deadline absoluto (time.monotonic()) fijado al llegar la petición."""
+    return deadline_after(timeout_s)
+
+
+async def admission_ticket(
+    headers: Dict[str, str] = Depends(authenticated_headers),
+    deadline: float = Depends(request_deadline),
+) -> AsyncIterator[Ticket]:
+    """
+    Admisión por IAG-App-Id antes de ejecutar el grafo. Rechaza con 429/503 + Retry-After
+    si el worker está saturado, la espera no cabe en el deadline o la aplicación no
+    tiene presupuesto (foto de cuotas en memoria). El ticket se libera al salir de la
+    dependencia (también si la petición acaba en 422 sin llegar al endpoint), salvo que
+    el endpoint lo haya pasado a otro dueño con `ticket.hand_off()` (streaming).
+    """
+    usage_accountant.check_budget(headers.get("IAG-App-Id"))
+    ticket = await admission.acquire(headers.get("IAG-App-Id"), deadline=deadline)
+    try:
+        yield ticket
+    finally:
+        if not ticket.handed_off:
+            ticket.release()
+
 class ChatRequest(BaseModel):
     session_id: Optional[str] = None
     message: str
 
+# answer: solo la respuesta | turn: mensajes añadidos en este turno | full: historial completo
+ResponseMode = Literal["answer", "turn", "full"]
+
 @router.post("/react-run", response_model=ResponseBody)
 async def react_run_endpoint(
     feature: str,
     model_id: str,
     version: str,
     req: ChatRequest,
-    headers: Dict[str, str] = Depends(get_authenticated_headers),
-) -> ResponseBody:
+    response_mode: ResponseMode = "answer",
+    headers: Dict[str, str] = Depends(authenticated_headers),
+    deadline: float = Depends(request_deadline),
+    ticket: Ticket = Depends(admission_ticket),
+) -> Response:
     """
     Execute a ReAct loop using LangGraph:
     - Builds an OpenAI-compatible Chat model against AI Server (LangChain interface)
     - Runs the graph (model <-> tools) for a single user turn
-    - Returns { answer, state } in ResponseBody
+    - Returns { answer } in ResponseBody, plus { state } depending on response_mode:
+      'answer' (default) omits it, 'turn' includes only this turn's messages,
+      'full' includes the whole rehydrated history.
     """
     log.info("Inicio de ejecución de /agent/react-run")
     try:
@@ -68,14 +118,18 @@ async def react_run_endpoint(
         # 1) Build runtime context for the graph. Assuming Context has an async factory/build method.
         ctx = Context(
             engine_id=settings.ENGINE_ID,
+            feature=feature,
+            model_id=model_id,
             headers=headers,
             base_url=settings.AICORE_URL,
             base_url_history=settings.URL_HIST_CONV,
             conversation_id=req.session_id,
+            deadline=deadline,
         )
 
-        # Prepare input messages for this turn
-        input_state: State = {"messages": [HumanMessage(content=req.message)]}
+        # Prepare input messages for this turn. The explicit id lets us find where the turn starts.
+        user_msg = HumanMessage(content=req.message, id=str(uuid4()))
+        input_state: State = {"messages": [user_msg]}
 
         # Run graph with a small recursion cap (agent will stop before infinite tool loops)
         final_result = await graph.ainvoke(
@@ -91,11 +145,24 @@ async def react_run_endpoint(
         if final.messages:
             ai_text = get_message_text(final.messages[-1]) or ""
 
+        data: Dict[str, Any] = {"answer": ai_text}
+        if response_mode != "answer":
+            selected = _select_messages(final.messages, user_msg.id, response_mode, history=final.history)
+            data["state"] = {"messages": messages_to_dicts(selected)}
+
         log.info("Fin de ejecución de /agent/react-run")
-        return ResponseBody(data={"answer": ai_text, "state": {"messages": [m.dict() for m in final.messages]}})
+        body = ResponseBody(data=data)
+        return Response(content=dumps(body.model_dump()), media_type="application/json")
 
     except APIConnectionError:
         raise  # bubble up to your global handling
+    except CircuitOpenError as e:
+        log.warning(f"/agent/react-run rechazado: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after_s)))},
+        ) from e
     except ForbiddenException:
         raise
     except Exception as e:
@@ -103,6 +170,130 @@ async def react_run_endpoint(
         raise InternalServerErrorException(str(e)) from e
     
 
+class BatchRequest(BaseModel):
+    items: List[ChatRequest] = Field(..., min_length=1)
+    concurrency: Optional[int] = Field(default=None, ge=1)
+
+@router.post("/react-batch")
+async def react_batch_endpoint(
+    feature: str,
+    model_id: str,
+    version: str,
+    req: BatchRequest,
+    headers: Dict[str, str] = Depends(authenticated_headers),
+    item_timeout_s: float = Depends(request_timeout_s),
+) -> StreamingResponse:
+    """
+    Run many independent agent turns in one request (offline / back-office jobs).
+    - Credentials and the AI Core login are resolved once and shared by every item
+    - Items run through the graph with at most `concurrency` turns in flight, each
+      one admitted individually by the admission controller
+    - X-Request-Timeout applies to each item, counted from the moment it starts
+    - Results are streamed as NDJSON in completion order; a failing item emits an
+      'item_error' line and does not abort the rest of the batch
+    """
+    log.info("Inicio de ejecución de /agent/react-batch")
+    if len(req.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(req.items)} items (max {settings.BATCH_MAX_ITEMS})",
+        )
+    usage_accountant.check_budget(headers.get("IAG-App-Id"))
+    try:
+        session = await open_aicore_session(headers=headers, base_url=settings.AICORE_URL)
+    except ForbiddenException:
+        raise
+    except Exception as e:
+        log.exception("Error abriendo sesión de AI Core para /agent/react-batch")
+        raise InternalServerErrorException(str(e)) from e
+
+    limit = min(req.concurrency or settings.BATCH_MAX_CONCURRENCY, settings.BATCH_MAX_CONCURRENCY)
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run_item(index: int, item: ChatRequest) -> Dict[str, Any]:
+        async with semaphore:
+            started = time.perf_counter()
+            deadline = deadline_after(item_timeout_s)
+            ctx = Context(
+                engine_id=settings.ENGINE_ID,
+                feature=feature,
+                model_id=model_id,
+                headers=headers,
+                base_url=settings.AICORE_URL,
+                base_url_history=settings.URL_HIST_CONV,
+                conversation_id=item.session_id,
+                aicore_session=session,
+                deadline=deadline,
+            )
+            try:
+                async with await admission.acquire(headers.get("IAG-App-Id"), deadline=deadline):
+                    result = await graph.ainvoke(
+                        {"messages": [HumanMessage(content=item.message)]},
+                        context=ctx,
+                        recursion_limit=4,
+                    )
+                msgs = result.get("messages") or []
+                answer = (get_message_text(msgs[-1]) or "") if msgs else ""
+                return {
+                    "type": "item_result",
+                    "ts": _now_iso(),
+                    "data": {
+                        "index": index,
+                        "session_id": item.session_id,
+                        "answer": answer,
+                        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+                    },
+                }
+            except Exception as e:
+                log.exception(f"Error en el elemento {index} de /agent/react-batch")
+                return {
+                    "type": "item_error",
+                    "ts": _now_iso(),
+                    "data": {"index": index, "session_id": item.session_id, "message": str(e)},
+                }
+
+    async def batch_generator() -> AsyncIterator[bytes]:
+        tasks = [asyncio.create_task(run_item(i, item)) for i, item in enumerate(req.items)]
+        ok = errors = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                line = await next_done
+                if line["type"] == "item_result":
+                    ok += 1
+                else:
+                    errors += 1
+                yield dumps(line) + b"\n"
+            yield dumps({"type": "batch_end", "ts": _now_iso(), "data": {"ok": ok, "errors": errors}}) + b"\n"
+            log.info("Fin de ejecución de /agent/react-batch")
+        finally:
+            # Si el cliente corta la conexión, no dejamos turnos huérfanos en el loop.
+            for t in tasks:
+                t.cancel()
+
+    headers_out = {
+        "Content-Type": "application/x-ndjson; charset=utf-8",
+        "Cache-Control": "no-cache, no-store, must-revalidate",
+        "X-Accel-Buffering": "no",
+    }
+    return StreamingResponse(_metered(batch_generator()), headers=headers_out)
+
+
+def _select_messages(messages, turn_start_id: str, response_mode: ResponseMode, history=()):
+    """Devuelve los mensajes a incluir en la respuesta según response_mode ('full' antepone el historial)."""
+    if response_mode == "full":
+        return [*to_messages(history, metadata=True), *messages]
+    for idx, m in enumerate(messages):
+        if getattr(m, "id", None) == turn_start_id:
+            return list(messages[idx:])
+    # Sin el id del mensaje del usuario (p. ej. un nodo lo reescribió), el turno empieza
+    # en el último HumanMessage; nunca se devuelve el hilo completo en modo 'turn'.
+    log.warning(f"Mensaje de inicio de turno {turn_start_id} no encontrado; se recorta desde el último HumanMessage")
+    for idx in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[idx], HumanMessage):
+            return list(messages[idx:])
+    return list(messages[-1:])
+
+
 # --- helpers para serializar valores de eventos ---
 from langchain_core.messages import BaseMessage
 
@@ -164,12 +355,81 @@ def _as_text(content) -> str:
     except Exception:
         return str(content)
 
+def _as_dict(obj: Any) -> Dict[str, Any]:
+    """Vista dict de un chunk/mensaje (dict tal cual, modelos pydantic vía model_dump)."""
+    if obj is None:
+        return {}
+    if isinstance(obj, dict):
+        return obj
+    if hasattr(obj, "model_dump"):
+        try:
+            return obj.model_dump()
+        except Exception:
+            return {}
+    return {}
+
+_TOOL_CALL_KEYS = ("tool_calls", "tool_call_chunks")
+_NESTED_KEYS = ("chunk", "output", "message", "additional_kwargs", "delta")
+
+def _collect_tool_call_payloads(obj: Any, _depth: int = 0) -> List[Any]:
+    """
+    Recoge (sin duplicados) las llamadas a tools que traiga un chunk o un evento,
+    en cualquiera de los sitios donde las ponen los proveedores.
+    """
+    found: List[Any] = []
+    d = _as_dict(obj)
+    if not d or _depth > 3:
+        return found
+    for key in _TOOL_CALL_KEYS:
+        for item in d.get(key) or []:
+            item = _sanitize_for_json(item)
+            if item not in found:
+                found.append(item)
+    for key in _NESTED_KEYS:
+        for item in _collect_tool_call_payloads(d.get(key), _depth + 1):
+            if item not in found:
+                found.append(item)
+    return found
+
+def _store_if_meaningful(target: Dict[str, Any], key: str, value: Any) -> None:
+    if value not in (None, "", [], {}):
+        target[key] = _sanitize_for_json(value)
+
+def _sanitize_for_json(x: Any) -> Any:
+    """Como _msg_to_text pero conservando la estructura de los mensajes (model_dump)."""
+    if x is None or isinstance(x, (str, int, float, bool)):
+        return x
+    if isinstance(x, dict):
+        return {str(k): _sanitize_for_json(v) for k, v in x.items()}
+    if isinstance(x, (list, tuple)):
+        return [_sanitize_for_json(v) for v in x]
+    if hasattr(x, "model_dump"):
+        try:
+            return _sanitize_for_json(x.model_dump())
+        except Exception:
+            pass
+    return str(x)
+
 def _now_iso():
     return datetime.now(timezone.utc).isoformat()
 
 def _json_line(obj: dict) -> str:
     return json.dumps(obj, ensure_ascii=False) + "\n"
 
+async def _metered(lines: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Cuenta streams abiertos, bytes y líneas NDJSON enviadas por petición."""
+    n_bytes = n_events = 0
+    ACTIVE_STREAMS.inc()
+    try:
+        async for line in lines:
+            n_bytes += len(line)
+            n_events += 1
+            yield line
+    finally:
+        ACTIVE_STREAMS.dec()
+        STREAM_BYTES.observe(n_bytes)
+        STREAM_EVENTS.observe(n_events)
+
 def _event_to_wire(ev: dict) -> dict:
     """
     Map LangGraph event to our NDJSON envelope.
@@ -227,8 +487,13 @@ def _event_to_wire(ev: dict) -> dict:
             if isinstance(c, str):
                 delta = c
 
+        payload: Dict[str, Any] = {"delta": delta, "accumulated": False}
+        chunk_dict = _as_dict(chunk)
+
         debug_info: Dict[str, Any] = {}
         chunk_tool_payloads = _collect_tool_call_payloads(chunk_dict)
+        if chunk_tool_payloads:
+            payload["tool_calls_delta"] = chunk_tool_payloads
         if chunk_tool_payloads:
             debug_info["chunk_tool_calls"] = chunk_tool_payloads
 
@@ -267,7 +532,7 @@ def _event_to_wire(ev: dict) -> dict:
             "ts": ts,
             "run_id": run_id,
             "node": node_name,
-            "data": {"delta": delta, "accumulated": False},
+            "data": payload,
         }
 
     if ev_type == "on_chat_model_end":
@@ -280,13 +545,69 @@ def _event_to_wire(ev: dict) -> dict:
 
         if not payload["tool_calls"]:
             payload.pop("tool_calls")
+        output = data_dict.get("output")
+        usage = usage_from_metadata(
+            getattr(output, "usage_metadata", None) or _as_dict(output).get("usage_metadata")
+        )
+        if usage:
+            payload["usage"] = usage
 
         return {
             "type": "chat_model_end",
             "ts": ts,
             "run_id": run_id,
             "node": node_name,
-            "data": {"delta": delta, "accumulated": False},
+            "data": payload,
+        }
+
+    # Decisión del router de engines (emitida por call_model)
+    if ev_type == "on_custom_event" and node_name == "engine_route":
+        return {
+            "type": "routing",
+            "ts": ts,
+            "run_id": run_id,
+            "node": "call_model",
+            "data": data,
+        }
+
+    # Consumo de tokens de un paso del modelo (emitido por call_model)
+    if ev_type == "on_custom_event" and node_name == "usage":
+        return {
+            "type": "usage",
+            "ts": ts,
+            "run_id": run_id,
+            "node": "call_model",
+            "data": data,
+        }
+
+    # El modelo repite llamadas a tool (final_answer: se fuerza el último paso sin tools)
+    if ev_type == "on_custom_event" and node_name == "tool_loop":
+        return {
+            "type": "tool_loop",
+            "ts": ts,
+            "run_id": run_id,
+            "node": "call_model",
+            "data": data,
+        }
+
+    # Tiempos de una llamada a tool (cola/ejecución); se adjuntan a su tool_end
+    if ev_type == "on_custom_event" and node_name == "tool_timing":
+        return {
+            "type": "tool_timing",
+            "ts": ts,
+            "run_id": run_id,
+            "node": node_name,
+            "data": data,
+        }
+
+    # Un guardrail ha bloqueado el turno: el cliente debe descartar lo recibido hasta ahora
+    if ev_type == "on_custom_event" and node_name == "guardrail":
+        return {
+            "type": "guardrail",
+            "ts": ts,
+            "run_id": run_id,
+            "node": "call_model",
+            "data": data,
         }
 
     # Tool lifecycle
@@ -299,6 +620,7 @@ def _event_to_wire(ev: dict) -> dict:
             "data": {
                 "tool_name": data.get("name") or node_name or "unknown_tool",
                 "input": _msg_to_text(data.get("input")),   # <-- aquí
+                "executor": tool_executor.describe(node_name),
             },
         }
 
@@ -399,6 +721,30 @@ def _event_to_wire(ev: dict) -> dict:
         "data": {"raw_event": ev_type},
     }
 
+class StreamUsage:
+    """Suma de los eventos `usage` de un stream (se añade al evento graph_end)."""
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.steps = 0
+        self.estimated_steps = 0
+
+    def add(self, step: Dict[str, Any]) -> None:
+        self.prompt_tokens += step.get("prompt_tokens") or 0
+        self.completion_tokens += step.get("completion_tokens") or 0
+        self.steps += 1
+        self.estimated_steps += step.get("source") != "provider"
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.prompt_tokens + self.completion_tokens,
+            "steps": self.steps,
+            "estimated_steps": self.estimated_steps,
+        }
+
 class ChatStreamRequest(BaseModel):
     session_id: Optional[str] = None
     message: str
@@ -409,7 +755,9 @@ async def react_stream_endpoint(
     model_id: str,
     version: str,
     req: ChatStreamRequest,
-    headers: Dict[str, str] = Depends(get_authenticated_headers),
+    headers: Dict[str, str] = Depends(authenticated_headers),
+    deadline: float = Depends(request_deadline),
+    ticket: Ticket = Depends(admission_ticket),
 ) -> StreamingResponse:
     """
     Stream LangGraph events as NDJSON lines (no SSE).
@@ -418,10 +766,13 @@ async def react_stream_endpoint(
     try:
         ctx = Context(
             engine_id=settings.ENGINE_ID,
+            feature=feature,
+            model_id=model_id,
             headers=headers,
             base_url=settings.AICORE_URL,
             base_url_history=settings.URL_HIST_CONV,
             conversation_id=req.session_id,
+            deadline=deadline,
         )
         input_state: State = {"messages": [HumanMessage(content=req.message)]}
 
@@ -433,6 +784,8 @@ async def react_stream_endpoint(
                 "data": {"status": "stream_started"}
             }).encode("utf-8")
 
+            usage_total = StreamUsage()
+            tool_timings: Dict[str, Dict[str, Any]] = {}  # run_id de la tool -> tiempos
             try:
                 async for ev in graph.astream_events(
                     input_state,
@@ -444,6 +797,15 @@ async def react_stream_endpoint(
                     wire = _event_to_wire(ev)
                     if wire is None:
                         continue
+                    if wire["type"] == "tool_timing":
+                        tool_timings[wire["run_id"]] = wire["data"]
+                        continue
+                    if wire["type"] == "tool_end":
+                        wire["data"]["timing"] = tool_timings.pop(wire["run_id"], None)
+                    elif wire["type"] == "usage":
+                        usage_total.add(wire["data"])
+                    elif wire["type"] == "graph_end":
+                        wire["data"]["usage"] = usage_total.as_dict()
                     yield _json_line(wire).encode("utf-8")
 
             except Exception as e:
@@ -454,6 +816,8 @@ async def react_stream_endpoint(
                     "data": {"message": str(e)}
                 }).encode("utf-8")
                 return
+            finally:
+                ticket.release()
 
         # Headers that play nice with gateways
         headers_out = {
@@ -464,7 +828,13 @@ async def react_stream_endpoint(
             # Some gateways buffer without this:
             "X-Accel-Buffering": "no",
         }
-        return StreamingResponse(event_generator(), headers=headers_out)
+        # A partir de aquí el ticket lo libera el stream; la background task cubre a los
+        # clientes que se desconectan antes de que empiece.
+        response = StreamingResponse(
+            _metered(event_generator()), headers=headers_out, background=BackgroundTask(ticket.release)
+        )
+        ticket.hand_off()
+        return response
     except ForbiddenException:
         raise
     except Exception as e:
@@ -484,7 +854,7 @@ async def debug_openai_stream_direct(
     model_id: str,
     version: str,
     req: StreamProbeRequest,
-    headers: Dict[str, str] = Depends(get_authenticated_headers),
+    headers: Dict[str, str] = Depends(authenticated_headers),
 ) -> StreamingResponse:
 
     async def gen() -> AsyncIterator[bytes]:
@@ -0,0 +1,20 @@
+# app/schemas/guardrails_schema.py
+from __future__ import annotations
+from typing import List, Literal, Optional
+from pydantic import BaseModel, Field
+
+GuardrailStage = Literal["input", "output"]
+
+
+class GuardrailCheck(BaseModel):
+    """Petición al MS de guardrails."""
+    stage: GuardrailStage
+    text: str
+    feature: Optional[str] = None
+    conversation_id: Optional[str] = None
+
+
+class GuardrailVerdict(BaseModel):
+    allowed: bool
+    reason: Optional[str] = None
+    categories: List[str] = Field(default_factory=list)
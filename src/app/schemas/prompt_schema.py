@@ -0,0 +1,12 @@
+# app/schemas/prompt_schema.py
+from __future__ import annotations
+from typing import Optional
+from pydantic import BaseModel, Field
+
+
+class PromptWire(BaseModel):
+    """Plantilla tal y como la devuelve el MS gestor de prompts."""
+    feature: str = Field(..., min_length=1)
+    name: str = Field(..., min_length=1)
+    prompt_text: str
+    version: Optional[str] = None
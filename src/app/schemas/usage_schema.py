@@ -0,0 +1,31 @@
+# app/schemas/usage_schema.py
+from __future__ import annotations
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel, Field, RootModel
+
+
+class UsageRecord(BaseModel):
+    """Consumo agregado de una aplicación en un engine durante una ventana de envío."""
+    app_id: str = Field(..., min_length=1)
+    engine_id: str = Field(..., min_length=1)
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    calls: int = 0
+    estimated_calls: int = 0  # llamadas sin usage del proveedor (tokens estimados)
+    window_start: datetime
+    window_end: datetime
+
+
+class UsageReport(BaseModel):
+    records: List[UsageRecord]
+
+
+class QuotaWire(BaseModel):
+    app_id: str = Field(..., min_length=1)
+    remaining_tokens: Optional[int] = None  # None = sin límite
+    blocked: bool = False
+
+
+class QuotaWireList(RootModel[List[QuotaWire]]):
+    pass
@@ -0,0 +1,312 @@
+# app/services/admission.py
+"""
+Control de admisión para los endpoints del agente.
+
+Limita las ejecuciones concurrentes del grafo por worker (tope global y tope por
+IAG-App-Id), mantiene una cola de espera acotada y reparte los huecos libres entre
+aplicaciones con un reparto justo ponderado (start-time fair queuing). Las peticiones
+que no caben en la cola o que no van a ser atendidas a tiempo se rechazan rápido
+con 429/503 y cabecera Retry-After, en lugar de acumularse en el loop.
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Optional
+
+from fastapi import HTTPException
+
+from app.services.metrics import REGISTRY
+from app.settings import settings, settings_provider
+
+DEFAULT_TENANT = "anonymous"
+
+
+class AdmissionRejected(HTTPException):
+    """Rechazo rápido del controlador de admisión (429 cola llena / 503 sin tiempo)."""
+
+    def __init__(self, status_code: int, detail: str, retry_after_s: float):
+        super().__init__(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after_s)))},
+        )
+
+
+@dataclass
+class _Waiter:
+    future: asyncio.Future
+    enqueued_at: float
+
+
+@dataclass
+class _Tenant:
+    weight: float
+    active: int = 0
+    finish_tag: float = 0.0
+    waiters: Deque[_Waiter] = field(default_factory=deque)
+
+
+class Ticket:
+    """Hueco concedido por el controlador. release() es idempotente."""
+
+    def __init__(self, controller: "AdmissionController", tenant: str, wait_s: float):
+        self._controller = controller
+        self.tenant = tenant
+        self.wait_s = wait_s
+        self._acquired_at = time.monotonic()
+        self._released = False
+        self.handed_off = False
+
+    def hand_off(self) -> "Ticket":
+        """
+        Pasa la liberación a otro dueño (p.ej. el StreamingResponse, que la hace al
+        terminar el stream): quien lo adquirió ya no debe liberarlo al salir.
+        """
+        self.handed_off = True
+        return self
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._controller._release(self.tenant, time.monotonic() - self._acquired_at)
+
+    async def __aenter__(self) -> "Ticket":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.release()
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        *,
+        max_concurrency: int,
+        max_per_tenant: int,
+        max_queue: int,
+        max_wait_s: float,
+        weights: Optional[Dict[str, float]] = None,
+        default_weight: float = 1.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_per_tenant = max_per_tenant
+        self.max_queue = max_queue
+        self.max_wait_s = max_wait_s
+        self.weights = dict(weights or {})
+        self.default_weight = default_weight
+
+        self._tenants: Dict[str, _Tenant] = {}
+        self._active = 0
+        self._queued = 0
+        self._virtual_time = 0.0
+        # EWMA de la duración de cada ejecución, para estimar esperas y Retry-After
+        self._service_time_s = 1.0
+
+        # Métricas
+        self.admitted_total = 0
+        self.rejected_queue_full = 0
+        self.rejected_deadline = 0
+        self.wait_count = 0
+        self.wait_sum_s = 0.0
+        self.wait_max_s = 0.0
+
+    @classmethod
+    def from_settings(cls, cfg=settings) -> "AdmissionController":
+        return cls(**_limits_from(cfg))
+
+    def configure(
+        self,
+        *,
+        max_concurrency: int,
+        max_per_tenant: int,
+        max_queue: int,
+        max_wait_s: float,
+        weights: Optional[Dict[str, float]] = None,
+    ) -> None:
+        """Cambia los límites en caliente; las peticiones ya admitidas no se ven afectadas."""
+        self.max_concurrency = max_concurrency
+        self.max_per_tenant = max_per_tenant
+        self.max_queue = max_queue
+        self.max_wait_s = max_wait_s
+        self.weights = dict(weights or {})
+        for name, state in self._tenants.items():
+            state.weight = self.weights.get(name, self.default_weight)
+        self._dispatch()  # si han subido los topes, entran los que esperaban
+
+    # ------------------------------------------------------------------ API
+
+    async def acquire(self, tenant: Optional[str], deadline: Optional[float] = None) -> Ticket:
+        """
+        Espera un hueco para `tenant`. `deadline` es un instante de time.monotonic();
+        si no se va a poder atender antes, se rechaza sin encolar.
+        """
+        tenant = tenant or DEFAULT_TENANT
+        state = self._tenant(tenant)
+        now = time.monotonic()
+
+        # Si hay hueco global, los que esperan están bloqueados por su propio tope por app,
+        # así que este tenant puede pasar directo sin saltarse a nadie.
+        if not state.waiters and self._has_room(state):
+            self._admit(tenant, state)
+            return self._ticket(tenant, 0.0)
+
+        if self._queued >= self.max_queue:
+            self.rejected_queue_full += 1
+            ADMISSION_REJECTED.inc("queue_full")
+            raise AdmissionRejected(429, "Too many queued requests", self._estimated_wait_s(self._queued))
+
+        budget = self.max_wait_s
+        if deadline is not None:
+            budget = min(budget, deadline - now)
+        if self._estimated_wait_s(self._queued + 1) > budget:
+            self.rejected_deadline += 1
+            ADMISSION_REJECTED.inc("deadline")
+            raise AdmissionRejected(503, "Service saturated, request would miss its deadline", self._estimated_wait_s(self._queued + 1))
+
+        waiter = _Waiter(future=asyncio.get_running_loop().create_future(), enqueued_at=now)
+        state.waiters.append(waiter)
+        self._queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=max(budget, 0.0))
+        except asyncio.TimeoutError:
+            if not waiter.future.done():
+                self._drop_waiter(state, waiter)
+                self.rejected_deadline += 1
+                ADMISSION_REJECTED.inc("deadline")
+                raise AdmissionRejected(503, "Timed out waiting for an execution slot", self._estimated_wait_s(self._queued))
+        except asyncio.CancelledError:
+            # El cliente se fue: si ya se le había concedido el hueco, lo devolvemos.
+            if waiter.future.done():
+                self._release(tenant, 0.0)
+            else:
+                self._drop_waiter(state, waiter)
+            raise
+        return self._ticket(tenant, time.monotonic() - waiter.enqueued_at)
+
+    def snapshot(self) -> Dict[str, object]:
+        avg_wait = self.wait_sum_s / self.wait_count if self.wait_count else 0.0
+        return {
+            "active": self._active,
+            "queued": self._queued,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted_total": self.admitted_total,
+            "rejected": {"queue_full": self.rejected_queue_full, "deadline": self.rejected_deadline},
+            "wait_ms": {
+                "count": self.wait_count,
+                "avg": round(avg_wait * 1000, 2),
+                "max": round(self.wait_max_s * 1000, 2),
+            },
+            "tenants": {
+                name: {"active": t.active, "queued": len(t.waiters), "weight": t.weight}
+                for name, t in self._tenants.items()
+                if t.active or t.waiters
+            },
+        }
+
+    # ------------------------------------------------------------ internos
+
+    def _tenant(self, tenant: str) -> _Tenant:
+        state = self._tenants.get(tenant)
+        if state is None:
+            state = _Tenant(weight=self.weights.get(tenant, self.default_weight))
+            self._tenants[tenant] = state
+        return state
+
+    def _has_room(self, state: _Tenant) -> bool:
+        return self._active < self.max_concurrency and state.active < self.max_per_tenant
+
+    def _admit(self, tenant: str, state: _Tenant) -> None:
+        # SFQ: la etiqueta de inicio es max(reloj virtual, fin del último servicio del tenant)
+        start = max(self._virtual_time, state.finish_tag)
+        state.finish_tag = start + 1.0 / state.weight
+        self._virtual_time = start
+        state.active += 1
+        self._active += 1
+        self.admitted_total += 1
+
+    def _ticket(self, tenant: str, wait_s: float) -> Ticket:
+        self.wait_count += 1
+        self.wait_sum_s += wait_s
+        self.wait_max_s = max(self.wait_max_s, wait_s)
+        ADMISSION_WAIT.observe(wait_s)
+        return Ticket(self, tenant, wait_s)
+
+    def _release(self, tenant: str, held_s: float) -> None:
+        state = self._tenants[tenant]
+        state.active -= 1
+        self._active -= 1
+        if held_s > 0:
+            self._service_time_s = 0.8 * self._service_time_s + 0.2 * held_s
+        self._dispatch()
+        if not state.active and not state.waiters and state.finish_tag <= self._virtual_time:
+            # Tenant inactivo: no guarda crédito, así que podemos olvidarlo.
+            del self._tenants[tenant]
+
+    def _dispatch(self) -> None:
+        while self._active < self.max_concurrency:
+            candidates = [
+                (max(self._virtual_time, t.finish_tag), name, t)
+                for name, t in self._tenants.items()
+                if t.waiters and t.active < self.max_per_tenant
+            ]
+            if not candidates:
+                return
+            _, name, state = min(candidates, key=lambda c: (c[0], -c[2].weight))
+            waiter = state.waiters.popleft()
+            self._queued -= 1
+            if waiter.future.done():
+                continue
+            self._admit(name, state)
+            waiter.future.set_result(True)
+
+    def _drop_waiter(self, state: _Tenant, waiter: _Waiter) -> None:
+        try:
+            state.waiters.remove(waiter)
+            self._queued -= 1
+        except ValueError:
+            pass
+
+    def _estimated_wait_s(self, position: int) -> float:
+        return position * self._service_time_s / max(self.max_concurrency, 1)
+
+
+def _limits_from(cfg) -> Dict[str, object]:
+    return dict(
+        max_concurrency=cfg.ADMISSION_MAX_CONCURRENCY,
+        max_per_tenant=cfg.ADMISSION_MAX_PER_TENANT,
+        max_queue=cfg.ADMISSION_MAX_QUEUE,
+        max_wait_s=cfg.ADMISSION_MAX_WAIT_S,
+        weights=parse_weights(cfg.ADMISSION_TENANT_WEIGHTS),
+    )
+
+
+def parse_weights(raw: str) -> Dict[str, float]:
+    """'app-a=2,app-b=0.5' -> {'app-a': 2.0, 'app-b': 0.5}"""
+    weights: Dict[str, float] = {}
+    for item in (raw or "").split(","):
+        name, sep, value = item.partition("=")
+        if sep and name.strip():
+            weights[name.strip()] = float(value)
+    return weights
+
+
+admission = AdmissionController.from_settings()
+
+
+def _on_settings_change(old, new, changed) -> None:
+    if any(name.startswith("ADMISSION_") for name in changed):
+        admission.configure(**_limits_from(new))
+
+
+settings_provider.subscribe(_on_settings_change)
+
+ADMISSION_WAIT = REGISTRY.histogram("agent_admission_wait_seconds", "Espera en cola hasta obtener hueco")
+ADMISSION_REJECTED = REGISTRY.counter("agent_admission_rejected_total", "Peticiones rechazadas por admisión", ("reason",))
+REGISTRY.gauge("agent_admission_active", "Ejecuciones del grafo en curso", fn=lambda: admission._active)
+REGISTRY.gauge("agent_admission_queued", "Peticiones esperando hueco", fn=lambda: admission._queued)
@@ -0,0 +1,162 @@
+# app/services/auth.py
+"""
+Dependencia de autenticación de los endpoints con caché de tokens verificados.
+
+`authenticated_headers` delega en get_authenticated_headers de la librería, pero:
+- si el token trae un `kid` que no está en el JWKS, antes de verificar fuerza la
+  recarga (single-flight, ver app.services.jwks) en lugar de rechazarlo por una
+  rotación de claves reciente;
+- guarda el resultado de cada verificación correcta hasta que el token expira (con
+  margen y tope AUTH_CACHE_MAX_TTL_S), así las peticiones siguientes de la misma
+  sesión no repiten la verificación de firma. Las entradas cuyo kid desaparece del
+  JWKS en una recarga se descartan.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import inspect
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from fastapi import Request
+from qgdiag_lib_arquitectura.security.authentication import get_authenticated_headers
+
+from app.services.jwks import jwks_manager
+from app.services.metrics import REGISTRY
+from app.settings import settings, settings_provider
+
+AUTH_CACHE = REGISTRY.counter("agent_auth_cache_total", "Consultas a la caché de tokens verificados", ("result",))
+
+
+def peek_jwt(token: str) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """(cabecera, claims) de un JWT SIN verificar la firma; None si no tiene forma de JWT."""
+    parts = token.split(".")
+    if len(parts) != 3:
+        return None
+    try:
+        header, claims = (json.loads(base64.urlsafe_b64decode(p + "=" * (-len(p) % 4))) for p in parts[:2])
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(header, dict) or not isinstance(claims, dict):
+        return None
+    return header, claims
+
+
+def request_token(request: Request) -> Optional[str]:
+    auth = request.headers.get("Authorization", "")
+    if auth[:7].lower() == "bearer ":
+        return auth[7:].strip() or None
+    return request.headers.get("Token") or None
+
+
+class TokenCache:
+    """LRU token -> cabeceras autenticadas, con expiración por entrada."""
+
+    def __init__(self, *, max_entries: int = 10000, max_ttl_s: float = 300.0, leeway_s: float = 5.0):
+        self.max_entries = max_entries
+        self.max_ttl_s = max_ttl_s
+        self.leeway_s = leeway_s
+        self._entries: "OrderedDict[str, Tuple[float, Optional[str], Dict[str, str]]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Dict[str, str]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[2]
+
+    def put(self, key: str, value: Dict[str, str], *, exp: Any, kid: Optional[str]) -> None:
+        """Guarda hasta `exp` (epoch, claim del JWT) menos el margen. Sin exp no se guarda."""
+        if not isinstance(exp, (int, float)):
+            return
+        ttl = min(exp - time.time() - self.leeway_s, self.max_ttl_s)
+        if ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, kid, dict(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def retain_kids(self, kids: Iterable[str]) -> int:
+        """Descarta las entradas firmadas con claves que ya no se publican. Devuelve cuántas."""
+        keep = set(kids)
+        stale = [k for k, (_, kid, _) in self._entries.items() if kid is not None and kid not in keep]
+        for k in stale:
+            del self._entries[k]
+        return len(stale)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+token_cache = TokenCache(
+    max_entries=settings.AUTH_CACHE_MAX_ENTRIES,
+    max_ttl_s=settings.AUTH_CACHE_MAX_TTL_S,
+    leeway_s=settings.AUTH_CACHE_LEEWAY_S,
+)
+jwks_manager.subscribe(lambda jwks, keys: token_cache.retain_kids(keys))
+
+
+def _on_settings_change(old, new, changed) -> None:
+    # Las entradas ya guardadas conservan su caducidad
+    if changed & {"AUTH_CACHE_MAX_ENTRIES", "AUTH_CACHE_MAX_TTL_S", "AUTH_CACHE_LEEWAY_S"}:
+        token_cache.max_entries = new.AUTH_CACHE_MAX_ENTRIES
+        token_cache.max_ttl_s = new.AUTH_CACHE_MAX_TTL_S
+        token_cache.leeway_s = new.AUTH_CACHE_LEEWAY_S
+
+
+settings_provider.subscribe(_on_settings_change)
+
+
+def service_headers(headers: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Cabeceras para llamar a otros MS sin una petición detrás (tareas en segundo plano):
+    credenciales de servicio SERVICE_TOKEN / SERVICE_APP_ID más `headers`, que prevalecen.
+    """
+    service = {"Token": settings.SERVICE_TOKEN, "IAG-App-Id": settings.SERVICE_APP_ID}
+    return {**{k: v for k, v in service.items() if v}, **(headers or {})}
+
+
+def _cache_key(token: str, request: Request) -> str:
+    # El resultado también depende de la aplicación llamante
+    raw = f"{token}\0{request.headers.get('IAG-App-Id', '')}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+async def _verify(request: Request) -> Dict[str, str]:
+    result = get_authenticated_headers(request)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+async def authenticated_headers(request: Request) -> Dict[str, str]:
+    """Cabeceras autenticadas de la petición (ver docstring del módulo)."""
+    token = request_token(request)
+    peeked = peek_jwt(token) if token and settings.AUTH_CACHE_ENABLED else None
+    if peeked is None:
+        return await _verify(request)
+
+    header, claims = peeked
+    key = _cache_key(token, request)
+    cached = token_cache.get(key)
+    if cached is not None:
+        AUTH_CACHE.inc("hit")
+        return dict(cached)
+    AUTH_CACHE.inc("miss")
+
+    kid = header.get("kid")
+    if isinstance(kid, str) and jwks_manager.keys and not jwks_manager.has_kid(kid):
+        await jwks_manager.ensure_kid(kid)
+    result = await _verify(request)
+    token_cache.put(key, result, exp=claims.get("exp"), kid=kid if isinstance(kid, str) else None)
+    return dict(result)
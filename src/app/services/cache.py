@@ -0,0 +1,388 @@
+# app/services/cache.py
+"""
+Caché compartida por los clientes del agente (sesiones de AI Core, historial, prompts).
+
+Con varios workers de uvicorn por pod, una caché en memoria está duplicada y fría en
+cada proceso. Los clientes usan un `CacheNamespace` sobre un backend intercambiable
+(CACHE_BACKEND):
+
+- "memory": LRU con TTL en el propio proceso (por defecto; nada sale a disco).
+- "sqlite": fichero SQLite en modo WAL (CACHE_SQLITE_PATH, por defecto en /dev/shm)
+  compartido por los workers del mismo nodo: lo que calienta uno lo aprovechan los
+  demás. Delante va un LRU en memoria de vida corta (CACHE_L1_TTL_S) para no tocar
+  SQLite en las claves más calientes.
+
+Los errores del backend (SQLite/E/S) no se propagan: cuentan como fallo de caché y
+se registran en métricas. Con SQLite una operación puede esperar hasta
+CACHE_SQLITE_BUSY_TIMEOUT_MS si otro worker tiene el fichero bloqueado, así que desde
+el event loop se usan las variantes aget/aset/adelete, que hacen esa E/S en un hilo
+(el L1 en memoria se sigue consultando sin salir del loop). Los valores se guardan
+como JSON y no deben incluir secretos; aun así el fichero se crea con permisos 0600.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from qgdiag_lib_arquitectura.utilities.logging_conf import CustomLogger
+
+from app.services.metrics import REGISTRY
+from app.settings import settings
+
+log = CustomLogger(name="services.cache", log_type="Technical")
+
+CACHE_LOOKUPS = REGISTRY.counter("agent_cache_lookups_total", "Consultas a la caché compartida", ("namespace", "result"))
+CACHE_ERRORS = REGISTRY.counter("agent_cache_errors_total", "Errores del backend de caché", ("backend", "op"))
+
+
+class CacheBackend(ABC):
+    """Almacén clave -> bytes con TTL. Las implementaciones no deben lanzar excepciones."""
+
+    name = "abstract"
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]: ...
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl_s: float) -> None: ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None: ...
+
+    # Variantes para el event loop; los backends con E/S bloqueante las sobrescriben
+    async def aget(self, key: str) -> Optional[bytes]:
+        return self.get(key)
+
+    async def aset(self, key: str, value: bytes, ttl_s: float) -> None:
+        self.set(key, value, ttl_s)
+
+    async def adelete(self, key: str) -> None:
+        self.delete(key)
+
+    def clear(self) -> None:
+        """Vacía la caché (tests y /admin)."""
+
+    def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class MemoryCache(CacheBackend):
+    """LRU con TTL por entrada, solo para este proceso."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()  # también se usa desde hilos (p.ej. asyncio.to_thread)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl_s: float) -> None:
+        if ttl_s <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl_s, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "entries": len(self._entries), "max_entries": self.max_entries}
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_entries_expires ON cache_entries (expires_at);
+"""
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Caché en un fichero SQLite (WAL) compartido entre procesos del mismo nodo. Los
+    lectores no se bloquean entre sí ni con el escritor; entre escritores se espera
+    como mucho `busy_timeout_ms` y, si no, la escritura se descarta.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, *, max_entries: int = 100000, busy_timeout_ms: int = 50, prune_every: int = 500):
+        self.path = path
+        self.max_entries = max_entries
+        self.busy_timeout_ms = busy_timeout_ms
+        self.prune_every = prune_every
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._writes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # Una conexión por proceso: tras un fork no se reutiliza la del padre
+        if self._conn is None or self._pid != os.getpid():
+            if not os.path.exists(self.path):
+                os.close(os.open(self.path, os.O_CREAT | os.O_RDWR, 0o600))
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, isolation_level=None, check_same_thread=False)
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # es una caché: no hace falta fsync por escritura
+            conn.executescript(_SCHEMA)
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with self._lock:
+                row = self._connection().execute(
+                    "SELECT value FROM cache_entries WHERE key = ? AND expires_at > ?", (key, time.time())
+                ).fetchone()
+        except (sqlite3.Error, OSError) as e:
+            self._error("get", e)
+            return None
+        return row[0] if row is not None else None
+
+    async def aget(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: bytes, ttl_s: float) -> None:
+        await asyncio.to_thread(self.set, key, value, ttl_s)
+
+    async def adelete(self, key: str) -> None:
+        await asyncio.to_thread(self.delete, key)
+
+    def set(self, key: str, value: bytes, ttl_s: float) -> None:
+        if ttl_s <= 0:
+            return
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, time.time() + ttl_s),
+                )
+                self._writes += 1
+                if self._writes % self.prune_every == 0:
+                    self._prune(conn)
+        except (sqlite3.Error, OSError) as e:
+            self._error("set", e)
+
+    def _prune(self, conn: sqlite3.Connection) -> None:
+        conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),))
+        (count,) = conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM cache_entries WHERE key IN (SELECT key FROM cache_entries ORDER BY expires_at LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def delete(self, key: str) -> None:
+        try:
+            with self._lock:
+                self._connection().execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+        except (sqlite3.Error, OSError) as e:
+            self._error("delete", e)
+
+    def clear(self) -> None:
+        try:
+            with self._lock:
+                self._connection().execute("DELETE FROM cache_entries")
+        except (sqlite3.Error, OSError) as e:
+            self._error("clear", e)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+    def _error(self, op: str, e: Exception) -> None:
+        CACHE_ERRORS.inc(self.name, op)
+        log.warning(f"Caché SQLite ({op}) no disponible: {type(e).__name__}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            with self._lock:
+                (count,) = self._connection().execute("SELECT COUNT(*) FROM cache_entries").fetchone()
+        except (sqlite3.Error, OSError):
+            count = None
+        return {"backend": self.name, "path": self.path, "entries": count, "max_entries": self.max_entries}
+
+
+class TieredCache(CacheBackend):
+    """LRU local de vida corta delante de un backend compartido."""
+
+    def __init__(self, local: MemoryCache, shared: CacheBackend, *, local_ttl_s: float = 5.0):
+        self.local = local
+        self.shared = shared
+        self.local_ttl_s = local_ttl_s
+        self.name = f"tiered+{shared.name}"
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self.local.get(key)
+        if value is None:
+            value = self.shared.get(key)
+            if value is not None:
+                # Sin TTL restante del compartido: el local nunca vive más de local_ttl_s
+                self.local.set(key, value, self.local_ttl_s)
+        return value
+
+    def set(self, key: str, value: bytes, ttl_s: float) -> None:
+        self.shared.set(key, value, ttl_s)
+        self.local.set(key, value, min(ttl_s, self.local_ttl_s))
+
+    def delete(self, key: str) -> None:
+        self.local.delete(key)
+        self.shared.delete(key)
+
+    async def aget(self, key: str) -> Optional[bytes]:
+        value = self.local.get(key)
+        if value is None:
+            value = await self.shared.aget(key)
+            if value is not None:
+                self.local.set(key, value, self.local_ttl_s)
+        return value
+
+    async def aset(self, key: str, value: bytes, ttl_s: float) -> None:
+        await self.shared.aset(key, value, ttl_s)
+        self.local.set(key, value, min(ttl_s, self.local_ttl_s))
+
+    async def adelete(self, key: str) -> None:
+        self.local.delete(key)
+        await self.shared.adelete(key)
+
+    def clear(self) -> None:
+        self.local.clear()
+        self.shared.clear()
+
+    def close(self) -> None:
+        self.shared.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.shared.stats(), "backend": self.name, "local": self.local.stats()}
+
+
+class CacheNamespace:
+    """Vista de un backend para un cliente: prefijo de claves, TTL por defecto y JSON."""
+
+    def __init__(self, name: str, ttl_s: float, backend: Optional[CacheBackend] = None):
+        self.name = name
+        self.ttl_s = ttl_s
+        self._backend = backend
+
+    @property
+    def backend(self) -> CacheBackend:
+        return self._backend if self._backend is not None else cache_backend
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_s > 0
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        return self._decode(self.backend.get(f"{self.name}:{key}"))
+
+    def set(self, key: str, value: Any, ttl_s: Optional[float] = None) -> None:
+        if not self.enabled:
+            return
+        self.backend.set(f"{self.name}:{key}", _encode(value), self.ttl_s if ttl_s is None else ttl_s)
+
+    def delete(self, key: str) -> None:
+        self.backend.delete(f"{self.name}:{key}")
+
+    async def aget(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        return self._decode(await self.backend.aget(f"{self.name}:{key}"))
+
+    async def aset(self, key: str, value: Any, ttl_s: Optional[float] = None) -> None:
+        if not self.enabled:
+            return
+        await self.backend.aset(f"{self.name}:{key}", _encode(value), self.ttl_s if ttl_s is None else ttl_s)
+
+    async def adelete(self, key: str) -> None:
+        await self.backend.adelete(f"{self.name}:{key}")
+
+    def _decode(self, raw: Optional[bytes]) -> Optional[Any]:
+        if raw is None:
+            CACHE_LOOKUPS.inc(self.name, "miss")
+            return None
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            CACHE_LOOKUPS.inc(self.name, "corrupt")
+            return None
+        CACHE_LOOKUPS.inc(self.name, "hit")
+        return value
+
+
+def _encode(value: Any) -> bytes:
+    return json.dumps(value, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def fingerprint(*parts: Any) -> str:
+    """Clave estable (sha256) para datos que no deben quedar en claro (cabeceras, tokens)."""
+    raw = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def default_sqlite_path() -> str:
+    # tmpfs si existe: compartido por los workers del pod y nunca en disco persistente
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, f"{settings.PROJECT_NAME}-cache.sqlite")
+
+
+def build_cache_backend(kind: str) -> CacheBackend:
+    local = MemoryCache(settings.CACHE_MAX_ENTRIES)
+    if kind == "memory":
+        return local
+    if kind == "sqlite":
+        shared = SQLiteCache(
+            settings.CACHE_SQLITE_PATH or default_sqlite_path(),
+            max_entries=settings.CACHE_SQLITE_MAX_ENTRIES,
+            busy_timeout_ms=settings.CACHE_SQLITE_BUSY_TIMEOUT_MS,
+        )
+        if settings.CACHE_L1_TTL_S <= 0:
+            return shared
+        local.max_entries = min(local.max_entries, settings.CACHE_L1_MAX_ENTRIES)
+        return TieredCache(local, shared, local_ttl_s=settings.CACHE_L1_TTL_S)
+    raise ValueError(f"Unknown CACHE_BACKEND '{kind}' (expected 'memory' or 'sqlite')")
+
+
+cache_backend = build_cache_backend(settings.CACHE_BACKEND)
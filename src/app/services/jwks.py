@@ -0,0 +1,199 @@
+# app/services/jwks.py
+"""
+Gestión de las claves JWKS con las que se verifican los tokens.
+
+- Índice kid -> claves, reconstruido en cada recarga; los suscriptores (p.ej. el
+  Authenticator de app.state) se actualizan de forma atómica.
+- Recarga en segundo plano cada JWKS_REFRESH_S con jitter (±JWKS_REFRESH_JITTER),
+  para que los pods no vayan todos a la vez al proveedor de identidad.
+- Un kid desconocido fuerza una recarga con single-flight (todas las peticiones
+  esperan la misma descarga), limitada a una cada JWKS_MIN_REFRESH_INTERVAL_S, y el
+  kid que siga sin aparecer queda en caché negativa JWKS_NEGATIVE_TTL_S.
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from qgdiag_lib_arquitectura.security import authentication
+from qgdiag_lib_arquitectura.utilities.logging_conf import CustomLogger
+
+from app.services.metrics import REGISTRY
+from app.settings import settings, settings_provider
+
+log = CustomLogger(name="services.jwks", log_type="Technical")
+
+JWKS_REFRESHES = REGISTRY.counter(
+    "agent_jwks_refreshes_total", "Recargas del JWKS por motivo y resultado", ("reason", "result")
+)
+
+KeyIndex = Dict[str, List[Dict[str, Any]]]
+Listener = Callable[[Any, KeyIndex], None]
+
+
+def index_jwks(jwks: Any) -> KeyIndex:
+    """
+    Índice kid -> claves. Acepta el formato de la librería ({kid: [jwk, ...]}) y el
+    estándar RFC 7517 ({"keys": [{"kid": ...}, ...]}).
+    """
+    if not isinstance(jwks, dict):
+        return {}
+    if isinstance(jwks.get("keys"), list):
+        index: KeyIndex = {}
+        for key in jwks["keys"]:
+            if isinstance(key, dict):
+                index.setdefault(str(key.get("kid", "")), []).append(key)
+        return index
+    return {str(kid): list(keys) if isinstance(keys, list) else [keys] for kid, keys in jwks.items()}
+
+
+class JwksManager:
+    def __init__(
+        self,
+        fetch: Optional[Callable[[], Awaitable[Any]]] = None,
+        *,
+        refresh_s: float = 3600.0,
+        jitter: float = 0.1,
+        min_refresh_interval_s: float = 10.0,
+        negative_ttl_s: float = 60.0,
+        max_negative: int = 1024,
+    ):
+        self._fetch = fetch or (lambda: authentication.fetch_jwks(channel=settings.JWKS_CHANNEL))
+        self.refresh_s = refresh_s
+        self.jitter = jitter
+        self.min_refresh_interval_s = min_refresh_interval_s
+        self.negative_ttl_s = negative_ttl_s
+        self.max_negative = max_negative
+        self.jwks: Any = None
+        self.keys: KeyIndex = {}
+        self.version = 0
+        self.updated_at: Optional[float] = None
+        self._listeners: List[Listener] = []
+        self._inflight: Optional[asyncio.Task] = None
+        self._last_forced = float("-inf")
+        self._negative: Dict[str, float] = {}  # kid -> hasta cuándo (monotonic) se da por desconocido
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, listener: Listener) -> None:
+        """`listener(jwks, keys)` se llama en cada actualización (y ya, si hay claves)."""
+        self._listeners.append(listener)
+        if self.jwks is not None:
+            listener(self.jwks, self.keys)
+
+    def set_jwks(self, jwks: Any) -> None:
+        self.jwks = jwks
+        self.keys = index_jwks(jwks)
+        self.version += 1
+        self.updated_at = time.monotonic()
+        for kid in self.keys:
+            self._negative.pop(kid, None)
+        for listener in self._listeners:
+            listener(jwks, self.keys)
+
+    def has_kid(self, kid: str) -> bool:
+        return kid in self.keys
+
+    async def refresh(self, reason: str = "manual") -> None:
+        """Descarga el JWKS; las llamadas concurrentes comparten la misma descarga."""
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.get_running_loop().create_task(self._do_refresh(reason))
+        # shield: si una petición se cancela, la descarga compartida sigue para las demás
+        await asyncio.shield(self._inflight)
+
+    async def _do_refresh(self, reason: str) -> None:
+        try:
+            jwks = await self._fetch()
+        except Exception:
+            JWKS_REFRESHES.inc(reason, "error")
+            raise
+        JWKS_REFRESHES.inc(reason, "ok")
+        self.set_jwks(jwks)
+
+    async def ensure_kid(self, kid: str) -> bool:
+        """True si `kid` está (o aparece tras recargar) en el JWKS."""
+        if kid in self.keys:
+            return True
+        now = time.monotonic()
+        if self._negative.get(kid, 0.0) > now:
+            return False
+        joining = self._inflight is not None and not self._inflight.done()
+        if not joining:
+            if now - self._last_forced < self.min_refresh_interval_s:
+                return False
+            self._last_forced = now
+        try:
+            await self.refresh("unknown_kid")
+        except Exception as e:
+            log.warning(f"No se pudo recargar el JWKS por kid desconocido: {type(e).__name__}: {e}")
+            return False
+        if kid in self.keys:
+            return True
+        if len(self._negative) >= self.max_negative:
+            self._negative.pop(next(iter(self._negative)))
+        self._negative[kid] = time.monotonic() + self.negative_ttl_s
+        return False
+
+    def next_delay(self) -> float:
+        return self.refresh_s * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def start(self) -> None:
+        """Arranca la recarga periódica; debe llamarse desde el event loop."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._refresh_loop(), name="jwks-refresh")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh_loop(self) -> None:
+        failures = 0
+        delay = self.next_delay()
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self.refresh("scheduled")
+                failures = 0
+                delay = self.next_delay()
+            except Exception as e:
+                failures += 1
+                # Se conservan las claves actuales; reintento con backoff hasta el periodo normal
+                delay = min(self.min_refresh_interval_s * 2 ** failures, self.next_delay())
+                log.warning(f"Recarga del JWKS fallida ({failures}), reintento en {delay:.0f}s: {type(e).__name__}: {e}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "kids": sorted(self.keys),
+            "age_s": round(time.monotonic() - self.updated_at, 1) if self.updated_at is not None else None,
+            "refreshing": self._task is not None and not self._task.done(),
+            "negative_kids": len(self._negative),
+        }
+
+
+def _timings_from(cfg) -> Dict[str, float]:
+    return dict(
+        refresh_s=cfg.JWKS_REFRESH_S,
+        jitter=cfg.JWKS_REFRESH_JITTER,
+        min_refresh_interval_s=cfg.JWKS_MIN_REFRESH_INTERVAL_S,
+        negative_ttl_s=cfg.JWKS_NEGATIVE_TTL_S,
+    )
+
+
+jwks_manager = JwksManager(**_timings_from(settings))
+
+
+def _on_settings_change(old, new, changed) -> None:
+    # Se aplican en la siguiente espera del refresco periódico
+    if any(name.startswith("JWKS_") for name in changed):
+        for name, value in _timings_from(new).items():
+            setattr(jwks_manager, name, value)
+
+
+settings_provider.subscribe(_on_settings_change)
@@ -0,0 +1,223 @@
+# app/services/metrics.py
+"""
+Métricas en formato Prometheus (texto de exposición 0.0.4), sin dependencias.
+
+Pensado para el hot path: observar es una búsqueda binaria en los buckets y un par
+de sumas sobre listas/dicts (< 1 µs por observación en CPython), sin locks: el
+servicio corre en un único event loop y las escrituras son atómicas bajo el GIL.
+El texto solo se genera al hacer scrape de /metrics.
+"""
+from __future__ import annotations
+
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+# Buckets por defecto (segundos), de 5 ms a 60 s
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+RATE_BUCKETS = (1, 5, 10, 20, 40, 80, 160, 320)
+
+
+def _fmt(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    if float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+
+    def _labels(self, values: LabelValues, extra: str = "") -> str:
+        pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        return self.header() + [f"{self.name}{self._labels(k)} {_fmt(v)}" for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._fn = fn  # gauge calculado en el scrape (p.ej. profundidad de cola)
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) - amount
+
+    def value(self, *labels: str) -> float:
+        if self._fn is not None and not labels:
+            return float(self._fn())
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        if self._fn is not None:
+            lines.append(f"{self.name} {_fmt(self._fn())}")
+        lines += [f"{self.name}{self._labels(k)} {_fmt(v)}" for k, v in self._values.items()]
+        return lines
+
+
+class _HistogramSeries:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self, n: int):
+        self.counts = [0] * (n + 1)  # último = +Inf
+        self.total = 0.0
+        self.count = 0
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelValues, _HistogramSeries] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = _HistogramSeries(len(self.buckets))
+        series.counts[bisect_left(self.buckets, value)] += 1
+        series.total += value
+        series.count += 1
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return series.count if series else 0
+
+    def sum(self, *labels: str) -> float:
+        series = self._series.get(labels)
+        return series.total if series else 0.0
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), series.counts):
+                cumulative += c
+                le = 'le="' + _fmt(bound) + '"'
+                lines.append(f"{self.name}_bucket{self._labels(labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(labels)} {_fmt(series.total)}")
+            lines.append(f"{self.name}_count{self._labels(labels)} {series.count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = (), fn: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._register(Gauge(name, help_text, labelnames, fn))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ----------------------------------------------------------- métricas del agente
+
+NODE_LATENCY = REGISTRY.histogram(
+    "agent_node_duration_seconds", "Duración de cada nodo del grafo", ("node",)
+)
+MODEL_TTFT = REGISTRY.histogram(
+    "agent_model_ttft_seconds", "Tiempo hasta el primer token en cada paso de call_model", ("engine_id",)
+)
+MODEL_TOKENS_PER_S = REGISTRY.histogram(
+    "agent_model_tokens_per_second", "Chunks de salida por segundo tras el primer token", ("engine_id",), RATE_BUCKETS
+)
+HISTORY_LATENCY = REGISTRY.histogram("agent_history_fetch_seconds", "Latencia de la lectura de historial")
+HISTORY_BYTES = REGISTRY.histogram(
+    "agent_history_payload_bytes", "Tamaño de la respuesta del MS de historial", buckets=SIZE_BUCKETS
+)
+CREDENTIALS_LATENCY = REGISTRY.histogram(
+    "agent_credentials_seconds", "Latencia de obtención de credenciales de AI Core"
+)
+LOGIN_LATENCY = REGISTRY.histogram("agent_aicore_login_seconds", "Latencia del login en AI Server")
+STREAM_BYTES = REGISTRY.histogram(
+    "agent_stream_bytes", "Bytes enviados por petición de streaming", buckets=SIZE_BUCKETS
+)
+STREAM_EVENTS = REGISTRY.histogram(
+    "agent_stream_events", "Eventos NDJSON enviados por petición de streaming", buckets=(1, 10, 50, 100, 250, 500, 1000, 5000)
+)
+ACTIVE_STREAMS = REGISTRY.gauge("agent_active_streams", "Streams NDJSON abiertos ahora mismo")
+GUARDRAIL_LATENCY = REGISTRY.histogram(
+    "agent_guardrail_check_seconds", "Latencia de las comprobaciones del MS de guardrails", ("stage",)
+)
+GUARDRAIL_CHECKS = REGISTRY.counter(
+    "agent_guardrail_checks_total", "Comprobaciones de guardrails por etapa y resultado", ("stage", "result")
+)
+TOOL_LATENCY = REGISTRY.histogram(
+    "agent_tool_duration_seconds", "Duración de cada llamada a tool (cola incluida)", ("tool", "execution")
+)
+TOOL_QUEUE_WAIT = REGISTRY.histogram(
+    "agent_tool_queue_seconds", "Espera en cola del pool de hilos/procesos de tools", ("execution",)
+)
+TOOL_TIMEOUTS = REGISTRY.counter("agent_tool_timeouts_total", "Llamadas a tool que agotaron su timeout", ("tool",))
+TOOL_MEMO_HITS = REGISTRY.counter(
+    "agent_tool_memo_hits_total", "Llamadas a tool repetidas en el turno respondidas sin ejecutar", ("tool",)
+)
+TOOL_CALL_REPEATS = REGISTRY.counter(
+    "agent_tool_call_repeats_total", "Llamadas a tool idénticas a otra anterior del mismo turno", ("engine",)
+)
+TOOL_LOOP_FINALS = REGISTRY.counter(
+    "agent_tool_loop_final_answers_total", "Pasos del modelo forzados a Final Answer por bucle de tools", ("engine",)
+)
@@ -0,0 +1,245 @@
+# app/services/profiling.py
+"""
+Perfilado bajo demanda de un worker en producción, sin dependencias externas.
+
+- `sample_cpu`: profiler de muestreo. Un hilo aparte lee cada `interval_s` la pila
+  del hilo del event loop (sys._current_frames) y acumula pilas "folded"
+  (`a;b;c N`), el formato que consumen flamegraph.pl, speedscope o inferno.
+- `sample_tasks`: lo mismo sobre las pilas `await` de las tareas asyncio vivas,
+  útil para ver dónde están esperando las peticiones (off-CPU).
+- `LoopLagMonitor`: latido en el loop + hilo watchdog. Si el loop no late en
+  `threshold_s`, el watchdog captura la pila del hilo del loop (p.ej. un login
+  síncrono) y el bloqueo queda registrado con su duración.
+"""
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import Counter as _Counter
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from types import FrameType
+from typing import Any, Deque, Dict, List, Optional
+
+from qgdiag_lib_arquitectura.utilities.logging_conf import CustomLogger
+
+from app.services.metrics import LATENCY_BUCKETS, REGISTRY
+from app.settings import settings, settings_provider
+
+log = CustomLogger(name="services.profiling", log_type="Technical")
+
+LOOP_LAG = REGISTRY.histogram(
+    "agent_event_loop_lag_seconds", "Retraso del latido del event loop respecto a lo programado",
+    buckets=(0.001,) + LATENCY_BUCKETS,
+)
+LOOP_STALLS = REGISTRY.counter("agent_event_loop_stalls_total", "Bloqueos del event loop por encima del umbral")
+
+MAX_STACK_DEPTH = 128
+
+
+class ProfilerBusy(RuntimeError):
+    """Ya hay un perfilado en curso en este worker."""
+
+
+_profile_lock = threading.Lock()
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", code.co_filename)
+    return f"{module}:{code.co_name}:{frame.f_lineno}"
+
+
+def _fold(frame: Optional[FrameType]) -> str:
+    """Pila de la raíz a la hoja separada por ';' (formato folded)."""
+    labels: List[str] = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+def render_folded(samples: Dict[str, int]) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(samples.items(), key=lambda kv: -kv[1]))
+
+
+def _run_exclusive(fn, *args) -> Any:
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running on this worker")
+    try:
+        return fn(*args)
+    finally:
+        _profile_lock.release()
+
+
+def _sample_threads(thread_ids: Optional[List[int]], duration_s: float, interval_s: float) -> Dict[str, int]:
+    samples: _Counter = _Counter()
+    me = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    end = time.monotonic() + duration_s
+    while time.monotonic() < end:
+        for tid, frame in sys._current_frames().items():
+            if tid == me or (thread_ids is not None and tid not in thread_ids):
+                continue
+            samples[f"{names.get(tid, tid)};{_fold(frame)}"] += 1
+        time.sleep(interval_s)
+    return dict(samples)
+
+
+async def sample_cpu(duration_s: float, interval_s: float = 0.005, all_threads: bool = False) -> str:
+    """
+    Muestrea durante `duration_s` la pila del hilo del loop (o de todos los hilos,
+    incluidos los de asyncio.to_thread) y devuelve el perfil en formato folded.
+    """
+    targets = None if all_threads else [threading.get_ident()]
+    samples = await asyncio.to_thread(_run_exclusive, _sample_threads, targets, duration_s, interval_s)
+    return render_folded(samples)
+
+
+def _task_stack(task: asyncio.Task) -> str:
+    frames = task.get_stack(limit=MAX_STACK_DEPTH)
+    # get_stack devuelve la corrutina exterior primero: ya está en orden raíz -> hoja
+    labels = [_frame_label(f) for f in frames]
+    return ";".join([f"task:{task.get_name()}"] + labels) if labels else f"task:{task.get_name()}"
+
+
+async def sample_tasks(duration_s: float, interval_s: float = 0.05) -> str:
+    """Pilas await de todas las tareas vivas, muestreadas desde el propio loop."""
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running on this worker")
+    try:
+        samples: _Counter = _Counter()
+        me = asyncio.current_task()
+        end = time.monotonic() + duration_s
+        while time.monotonic() < end:
+            for task in asyncio.all_tasks():
+                if task is not me and not task.done():
+                    samples[_task_stack(task)] += 1
+            await asyncio.sleep(interval_s)
+        return render_folded(dict(samples))
+    finally:
+        _profile_lock.release()
+
+
+# ------------------------------------------------------------ event loop lag
+
+
+@dataclass
+class Stall:
+    started_at: str
+    lag_s: float
+    stack: List[str] = field(default_factory=list)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"started_at": self.started_at, "lag_ms": round(self.lag_s * 1000, 1), "stack": self.stack}
+
+
+class LoopLagMonitor:
+    def __init__(self, *, interval_s: float = 0.05, threshold_s: float = 0.1, max_stalls: int = 50):
+        self.interval_s = interval_s
+        self.threshold_s = threshold_s
+        self.stalls: Deque[Stall] = deque(maxlen=max_stalls)
+        self.max_lag_s = 0.0
+        self._beat = time.monotonic()
+        self._pending: Optional[Stall] = None
+        self._lock = threading.Lock()
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """Arranca el monitor; debe llamarse desde el event loop a vigilar."""
+        if self.running:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat(), name="loop-lag-monitor")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join, 1.0)
+            self._watchdog = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "threshold_ms": self.threshold_s * 1000,
+            "max_lag_ms": round(self.max_lag_s * 1000, 1),
+            "stalls": [s.as_dict() for s in reversed(self.stalls)],
+        }
+
+    async def _heartbeat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval_s
+            await asyncio.sleep(self.interval_s)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._beat = now
+            LOOP_LAG.observe(lag)
+            self.max_lag_s = max(self.max_lag_s, lag)
+            if lag < self.threshold_s:
+                continue
+            with self._lock:
+                stall, self._pending = self._pending, None
+            if stall is None:
+                # El watchdog no llegó a verlo (bloqueo corto): sin pila
+                stall = Stall(started_at=_iso_ago(lag), lag_s=lag)
+            stall.lag_s = lag
+            self.stalls.append(stall)
+            LOOP_STALLS.inc()
+            where = stall.stack[-1] if stall.stack else "unknown"
+            log.warning(f"Event loop bloqueado {lag * 1000:.0f} ms (en {where})")
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            blocked_for = time.monotonic() - self._beat - self.interval_s
+            if blocked_for < self.threshold_s:
+                continue
+            with self._lock:
+                if self._pending is not None:
+                    continue
+                frame = sys._current_frames().get(self._loop_thread)
+                stack = traceback.format_list(traceback.extract_stack(frame)) if frame is not None else []
+                self._pending = Stall(
+                    started_at=_iso_ago(blocked_for),
+                    lag_s=blocked_for,
+                    stack=[line.rstrip() for line in stack],
+                )
+
+
+def _iso_ago(seconds: float) -> str:
+    return datetime.fromtimestamp(time.time() - seconds, tz=timezone.utc).isoformat()
+
+
+loop_monitor = LoopLagMonitor(
+    interval_s=settings.LOOP_LAG_INTERVAL_S, threshold_s=settings.LOOP_LAG_THRESHOLD_S
+)
+
+
+def _on_settings_change(old, new, changed) -> None:
+    if changed & {"LOOP_LAG_INTERVAL_S", "LOOP_LAG_THRESHOLD_S"}:
+        loop_monitor.interval_s = new.LOOP_LAG_INTERVAL_S
+        loop_monitor.threshold_s = new.LOOP_LAG_THRESHOLD_S
+
+
+settings_provider.subscribe(_on_settings_change)
@@ -0,0 +1,91 @@
+# app/services/readiness.py
+"""
+Estado de arranque del worker: separa "vivo" (/health, liveness) de "listo para
+recibir tráfico" (/ready, readiness).
+
+Cada paso del arranque (JWKS, precalentamientos...) se declara con `expect()` y se
+ejecuta dentro de `step()`, que mide su duración y lo marca como hecho o fallido.
+El worker está listo cuando no queda ningún paso pendiente ni fallido.
+"""
+from __future__ import annotations
+
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
+
+from qgdiag_lib_arquitectura.utilities.logging_conf import CustomLogger
+
+from app.services.metrics import REGISTRY
+
+log = CustomLogger(name="services.readiness", log_type="Technical")
+
+STARTUP_STEP_SECONDS = REGISTRY.histogram(
+    "agent_startup_step_seconds", "Duración de cada paso del arranque del worker", ("step",)
+)
+
+
+class Readiness:
+    def __init__(self):
+        self.created_at = time.monotonic()
+        self.ready_at: float | None = None
+        self._pending: Dict[str, float] = {}  # paso -> inicio (monotonic)
+        self._done: Dict[str, float] = {}  # paso -> duración (s)
+        self._failed: Dict[str, str] = {}  # paso -> error
+
+    @property
+    def ready(self) -> bool:
+        return not self._pending and not self._failed
+
+    def expect(self, *steps: str) -> None:
+        """Registra pasos que deben completarse antes de declararse listo."""
+        now = time.monotonic()
+        for name in steps:
+            if name not in self._done:
+                self._pending.setdefault(name, now)
+                self._failed.pop(name, None)
+        self.ready_at = None
+
+    def mark_done(self, name: str, duration_s: float | None = None) -> None:
+        started = self._pending.pop(name, None)
+        if duration_s is None:
+            duration_s = time.monotonic() - started if started is not None else 0.0
+        self._done[name] = duration_s
+        self._failed.pop(name, None)
+        STARTUP_STEP_SECONDS.observe(duration_s, name)
+        if self.ready and self.ready_at is None:
+            self.ready_at = time.monotonic()
+            log.info(f"Worker listo en {self.ready_at - self.created_at:.2f}s")
+
+    def mark_failed(self, name: str, error: str) -> None:
+        self._pending.pop(name, None)
+        self._failed[name] = error
+        log.error(f"Paso de arranque '{name}' fallido: {error}")
+
+    @asynccontextmanager
+    async def step(self, name: str) -> AsyncIterator[None]:
+        """Ejecuta un paso de arranque midiendo su duración; los errores se propagan."""
+        self.expect(name)
+        started = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            self.mark_failed(name, f"{type(e).__name__}: {e}")
+            raise
+        self.mark_done(name, time.monotonic() - started)
+
+    def reset(self) -> None:
+        self.__init__()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "uptime_s": round(time.monotonic() - self.created_at, 3),
+            "ready_after_s": round(self.ready_at - self.created_at, 3) if self.ready_at is not None else None,
+            "pending": sorted(self._pending),
+            "done": {k: round(v, 4) for k, v in self._done.items()},
+            "failed": dict(self._failed),
+        }
+
+
+readiness = Readiness()
+REGISTRY.gauge("agent_ready", "1 si el worker ha completado el arranque", fn=lambda: 1.0 if readiness.ready else 0.0)
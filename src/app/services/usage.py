@@ -0,0 +1,272 @@
+# app/services/usage.py
+"""
+Contabilidad de tokens consumidos y envío por lotes al MS de control de gastos.
+
+- call_model registra en cada paso los tokens de prompt y de respuesta (usage del
+  proveedor si viene en el stream; si no, el conteo local de app.agent.tokens) con
+  `record()`, que solo suma en memoria por (IAG-App-Id, engine).
+- Cada USAGE_FLUSH_INTERVAL_S, y al apagar el worker, los acumulados se envían en una
+  sola petición. Si el envío falla se vuelven a sumar para el siguiente intento (hasta
+  USAGE_MAX_PENDING_KEYS pares app/engine; lo que exceda se descarta y se cuenta). Los
+  envíos llevan las credenciales de servicio SERVICE_TOKEN / SERVICE_APP_ID;
+  un 401/403 se registra como error y en agent_usage_flushes_total{result="unauthorized"}.
+- Opcionalmente (USAGE_BUDGET_CHECK_ENABLED) las peticiones de aplicaciones sin
+  presupuesto se rechazan con 429 antes de ejecutar el grafo. Se consulta una foto de
+  las cuotas que se recarga cada USAGE_QUOTA_REFRESH_S, descontando lo consumido
+  localmente desde entonces; nunca hay una llamada al MS en el camino de la petición.
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from qgdiag_lib_arquitectura.utilities.logging_conf import CustomLogger
+
+from app.agent.ms_clients.spend_client import SpendClient
+from app.schemas.usage_schema import QuotaWire, UsageRecord
+from app.services.metrics import REGISTRY
+from app.settings import settings, settings_provider
+
+log = CustomLogger(name="services.usage", log_type="Technical")
+
+USAGE_TOKENS = REGISTRY.counter(
+    "agent_usage_tokens_total", "Tokens consumidos por engine y tipo (prompt/completion)", ("engine_id", "kind")
+)
+USAGE_FLUSHES = REGISTRY.counter("agent_usage_flushes_total", "Envíos al MS de control de gastos", ("result",))
+USAGE_DROPPED = REGISTRY.counter("agent_usage_dropped_records_total", "Agregados descartados por no poder enviarse")
+BUDGET_REJECTED = REGISTRY.counter("agent_budget_rejected_total", "Peticiones rechazadas por falta de presupuesto")
+
+DEFAULT_APP = "anonymous"
+Key = Tuple[str, str]  # (app_id, engine_id)
+
+
+class BudgetExceeded(HTTPException):
+    """La aplicación ha agotado su presupuesto según la última foto de cuotas."""
+
+    def __init__(self, app_id: str, retry_after_s: float):
+        super().__init__(
+            status_code=429,
+            detail=f"Budget exceeded for application '{app_id}'",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after_s)))},
+        )
+
+
+@dataclass
+class _Totals:
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    calls: int = 0
+    estimated_calls: int = 0
+
+    def add(self, other: "_Totals") -> None:
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.calls += other.calls
+        self.estimated_calls += other.estimated_calls
+
+
+def _status_code(e: Exception) -> Optional[int]:
+    status = getattr(e, "status_code", None)
+    if status is None:
+        status = getattr(getattr(e, "response", None), "status_code", None)
+    return status
+
+
+class UsageAccountant:
+    def __init__(
+        self,
+        report: Optional[Callable[[List[UsageRecord]], Awaitable[Any]]] = None,
+        fetch_quotas: Optional[Callable[[], Awaitable[List[QuotaWire]]]] = None,
+        *,
+        flush_interval_s: float = 10.0,
+        quota_refresh_s: float = 60.0,
+        max_pending_keys: int = 10000,
+    ):
+        client = SpendClient()
+        self._report = report or client.report
+        self._fetch_quotas = fetch_quotas or client.get_quotas
+        self.flush_interval_s = flush_interval_s
+        self.quota_refresh_s = quota_refresh_s
+        self.max_pending_keys = max_pending_keys
+        self._pending: Dict[Key, _Totals] = {}
+        self._window_start = datetime.now(timezone.utc)
+        self._quotas: Dict[str, QuotaWire] = {}
+        self._spent_since_quotas: Dict[str, int] = {}
+        self._quotas_at: Optional[float] = None
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.last_error: Optional[str] = None
+
+    def record(
+        self,
+        app_id: Optional[str],
+        engine_id: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        *,
+        estimated: bool = False,
+    ) -> None:
+        """Suma el consumo de un paso del modelo (sin E/S)."""
+        app = app_id or DEFAULT_APP
+        totals = self._pending.get((app, engine_id))
+        if totals is None:
+            if len(self._pending) >= self.max_pending_keys:
+                USAGE_DROPPED.inc()
+                return
+            totals = self._pending[(app, engine_id)] = _Totals()
+        totals.prompt_tokens += prompt_tokens
+        totals.completion_tokens += completion_tokens
+        totals.calls += 1
+        totals.estimated_calls += int(estimated)
+        self._spent_since_quotas[app] = self._spent_since_quotas.get(app, 0) + prompt_tokens + completion_tokens
+        USAGE_TOKENS.inc(engine_id, "prompt", amount=prompt_tokens)
+        USAGE_TOKENS.inc(engine_id, "completion", amount=completion_tokens)
+
+    async def flush(self) -> int:
+        """Envía lo acumulado en una sola petición. Devuelve cuántos agregados se enviaron."""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            window_start, window_end = self._window_start, datetime.now(timezone.utc)
+            self._window_start = window_end
+            records = [
+                UsageRecord(
+                    app_id=app, engine_id=engine, window_start=window_start, window_end=window_end,
+                    prompt_tokens=t.prompt_tokens, completion_tokens=t.completion_tokens,
+                    calls=t.calls, estimated_calls=t.estimated_calls,
+                )
+                for (app, engine), t in batch.items()
+            ]
+            try:
+                await self._report(records)
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                if _status_code(e) in (401, 403):
+                    # No se arregla reintentando: que se vea en logs y métricas
+                    USAGE_FLUSHES.inc("unauthorized")
+                    log.error(
+                        f"El MS de control de gastos rechaza las credenciales ({self.last_error}); "
+                        "revisa SERVICE_TOKEN / SERVICE_APP_ID"
+                    )
+                else:
+                    USAGE_FLUSHES.inc("error")
+                self._restore(batch, window_start)
+                raise
+            USAGE_FLUSHES.inc("ok")
+            self.last_error = None
+            return len(records)
+
+    def _restore(self, batch: Dict[Key, _Totals], window_start: datetime) -> None:
+        """Devuelve a pendientes un lote no enviado (se reintenta en el siguiente flush)."""
+        self._window_start = window_start
+        for key, totals in batch.items():
+            current = self._pending.get(key)
+            if current is not None:
+                current.add(totals)
+            elif len(self._pending) < self.max_pending_keys:
+                self._pending[key] = totals
+            else:
+                USAGE_DROPPED.inc()
+
+    async def refresh_quotas(self) -> None:
+        quotas = await self._fetch_quotas()
+        self._quotas = {q.app_id: q for q in quotas}
+        self._spent_since_quotas = {}
+        self._quotas_at = time.monotonic()
+
+    def over_budget(self, app_id: Optional[str]) -> bool:
+        """True si la última foto de cuotas (menos lo gastado desde entonces) no deja margen."""
+        quota = self._quotas.get(app_id or DEFAULT_APP)
+        if quota is None:
+            return False
+        if quota.blocked:
+            return True
+        if quota.remaining_tokens is None:
+            return False
+        return quota.remaining_tokens - self._spent_since_quotas.get(quota.app_id, 0) <= 0
+
+    def check_budget(self, app_id: Optional[str]) -> None:
+        """Pre-check de presupuesto (sin red). Lanza BudgetExceeded si la app no tiene margen."""
+        if settings.USAGE_BUDGET_CHECK_ENABLED and self.over_budget(app_id):
+            BUDGET_REJECTED.inc()
+            raise BudgetExceeded(app_id or DEFAULT_APP, retry_after_s=self.quota_refresh_s)
+
+    def start(self) -> None:
+        """Arranca el envío periódico (y la recarga de cuotas); debe llamarse desde el event loop."""
+        if not settings.SERVICE_TOKEN:
+            log.warning("SERVICE_TOKEN vacío: el MS de control de gastos puede rechazar los envíos")
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._loop(), name="usage-flush")
+
+    async def stop(self) -> None:
+        """Para el envío periódico y envía lo pendiente (apagado del worker)."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            log.warning(f"No se pudo enviar el consumo pendiente al apagar: {type(e).__name__}: {e}")
+
+    async def _loop(self) -> None:
+        while True:
+            if settings.USAGE_BUDGET_CHECK_ENABLED and (
+                self._quotas_at is None or time.monotonic() - self._quotas_at >= self.quota_refresh_s
+            ):
+                try:
+                    await self.refresh_quotas()
+                except Exception as e:
+                    # Se mantiene la foto anterior
+                    log.warning(f"No se pudieron recargar las cuotas: {type(e).__name__}: {e}")
+            await asyncio.sleep(self.flush_interval_s)
+            try:
+                await self.flush()
+            except Exception as e:
+                log.warning(f"Envío de consumo fallido, se reintentará: {type(e).__name__}: {e}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "pending": [
+                {"app_id": app, "engine_id": engine, **vars(t)} for (app, engine), t in self._pending.items()
+            ],
+            "quotas": {
+                app: {
+                    "remaining_tokens": q.remaining_tokens,
+                    "blocked": q.blocked,
+                    "spent_since_snapshot": self._spent_since_quotas.get(app, 0),
+                }
+                for app, q in self._quotas.items()
+            },
+            "quotas_age_s": round(time.monotonic() - self._quotas_at, 1) if self._quotas_at is not None else None,
+            "last_error": self.last_error,
+        }
+
+
+def _intervals_from(cfg) -> Dict[str, Any]:
+    return dict(
+        flush_interval_s=cfg.USAGE_FLUSH_INTERVAL_S,
+        quota_refresh_s=cfg.USAGE_QUOTA_REFRESH_S,
+        max_pending_keys=cfg.USAGE_MAX_PENDING_KEYS,
+    )
+
+
+usage_accountant = UsageAccountant(**_intervals_from(settings))
+
+
+def _on_settings_change(old, new, changed) -> None:
+    if changed & {"USAGE_FLUSH_INTERVAL_S", "USAGE_QUOTA_REFRESH_S", "USAGE_MAX_PENDING_KEYS"}:
+        for name, value in _intervals_from(new).items():
+            setattr(usage_accountant, name, value)
+
+
+settings_provider.subscribe(_on_settings_change)
@@ -7,18 +7,40 @@ de entorno que configuran diversos aspectos de la aplicación, como URLs y puert
 El método classmethod load_from_yaml() calcula dinámicamente la ruta al archivo de configuración,
 asegurando que al estar settings.py en src/app y config.yaml en src se pueda localizar el archivo correctamente.
 Además, se incluyen métodos para determinar si el entorno es local y para obtener claves JWKS configuradas.
+
+La configuración se puede recargar en caliente: SettingsProvider vigila config.yaml (y
+el fichero opcional SETTINGS_OVERRIDES_FILE) y sustituye la instantánea de forma
+atómica. `settings` es un proxy de solo lectura hacia la instantánea vigente; cada
+petición HTTP fija la suya (PinnedSettingsMiddleware) y la conserva hasta terminar
+aunque haya recarga. Las instantáneas son inmutables: para cambiar valores (p.ej. en
+tests) se publica una nueva con SettingsProvider.swap().
+
+Los objetos de larga vida que copian valores al construirse (router de engines,
+admisión, pools de AI Core, cachés de sesión/historial/prompts, JWKS, caché de tokens,
+circuit breakers, monitor del event loop, envío de consumo) se suscriben a los cambios. Los campos de
+RESTART_ONLY solo se leen al arrancar: una recarga los registra pero no los aplica
+(aparecen en GET /admin/settings).
 """
+import asyncio
+import contextvars
 import os
+from contextlib import contextmanager
 from dotenv import load_dotenv
-from pydantic_settings import BaseSettings
-from typing import Optional, Dict, Any
+from pydantic import field_validator
+from pydantic_settings import BaseSettings, NoDecode, SettingsConfigDict
+from typing import Annotated, Optional, Dict, Any, Callable, Iterator, List, Set
 import yaml
+from qgdiag_lib_arquitectura.utilities.logging_conf import CustomLogger
 
 
 load_dotenv()
+log = CustomLogger(name="app.settings", log_type="Technical")
 
 class Settings(BaseSettings):
     """Configuración de la aplicación."""
+    # Instantánea inmutable: los cambios se publican con SettingsProvider.swap()/reload()
+    model_config = SettingsConfigDict(frozen=True)
+
     PROJECT_NAME: str = os.getenv("PROJECT_NAME", "qgdiag-esqueleto-orquestador-python")
     ENVIRONMENT: str = os.getenv("ENVIRONMENT", "development")
 
@@ -35,30 +57,166 @@ class Settings(BaseSettings):
 
     URL_CONTROL_GASTOS: str = os.getenv("URL_CONTROL_GASTOS", URL_LOCALHOST)
     CONTROL_GASTOS_PORT: str = os.getenv("CONTROL_GASTOS_PORT", "8004")
+    # Consumo de tokens: agregado en memoria y enviado por lotes al MS de control de gastos
+    USAGE_ENABLED: bool = os.getenv("USAGE_ENABLED", "false").lower() == "true"
+    USAGE_FLUSH_INTERVAL_S: float = float(os.getenv("USAGE_FLUSH_INTERVAL_S", "10"))
+    USAGE_MAX_PENDING_KEYS: int = int(os.getenv("USAGE_MAX_PENDING_KEYS", "10000"))
+    USAGE_TIMEOUT_S: float = float(os.getenv("USAGE_TIMEOUT_S", "5"))
+    USAGE_BUDGET_CHECK_ENABLED: bool = os.getenv("USAGE_BUDGET_CHECK_ENABLED", "false").lower() == "true"
+    USAGE_QUOTA_REFRESH_S: float = float(os.getenv("USAGE_QUOTA_REFRESH_S", "60"))
+    # Credenciales de servicio para las llamadas a otros MS fuera de una petición
+    # (envío de consumo, gestor de prompts): no hay cabeceras del llamante que reenviar
+    SERVICE_TOKEN: str = os.getenv("SERVICE_TOKEN", "")
+    SERVICE_APP_ID: str = os.getenv("SERVICE_APP_ID", "")
 
     GESTOR_PROMPT_URL: str = os.getenv("URL_GESTOR_PROMPTS", URL_LOCALHOST)
     GESTOR_PROMPT_PORT: str = os.getenv("GESTOR_PROMPTS_PORT", "")
+    # Plantillas del gestor de prompts: caché local con revalidación en segundo plano
+    PROMPTS_ENABLED: bool = os.getenv("PROMPTS_ENABLED", "false").lower() == "true"
+    # Features con plantilla (se precargan y son las únicas que se piden en segundo plano)
+    PROMPTS_FEATURES: Annotated[List[str], NoDecode] = [x for x in os.getenv("PROMPTS_FEATURES", "").split(",") if x]
+    PROMPTS_DEFAULT_NAME: str = os.getenv("PROMPTS_DEFAULT_NAME", "system")
+    PROMPTS_TTL_S: float = float(os.getenv("PROMPTS_TTL_S", "300"))
+    PROMPTS_TIMEOUT_S: float = float(os.getenv("PROMPTS_TIMEOUT_S", "5"))
+    PROMPTS_MISS_TTL_S: float = float(os.getenv("PROMPTS_MISS_TTL_S", "30"))  # plantilla inexistente / MS caído
 
     GUARDRAILS_URL: str = os.getenv("GUARDRAILS_URL", URL_LOCALHOST)
     GUARDRAILS_PORT: str = os.getenv("GUARDRAILS_PORT", "8007")
+    # Guardrails concurrentes: la entrada se comprueba mientras se carga el historial y se
+    # genera; la salida por ventanas de texto a medida que llega el streaming
+    GUARDRAILS_ENABLED: bool = os.getenv("GUARDRAILS_ENABLED", "false").lower() == "true"
+    GUARDRAILS_TIMEOUT_S: float = float(os.getenv("GUARDRAILS_TIMEOUT_S", "5"))
+    GUARDRAILS_FAIL_OPEN: bool = os.getenv("GUARDRAILS_FAIL_OPEN", "false").lower() == "true"
+    GUARDRAILS_OUTPUT_WINDOW_CHARS: int = int(os.getenv("GUARDRAILS_OUTPUT_WINDOW_CHARS", "400"))
+    GUARDRAILS_OUTPUT_OVERLAP_CHARS: int = int(os.getenv("GUARDRAILS_OUTPUT_OVERLAP_CHARS", "80"))
+
+    # Presupuesto de tiempo por petición (cabecera X-Request-Timeout, acotada por el máximo)
+    REQUEST_TIMEOUT_S: float = float(os.getenv("REQUEST_TIMEOUT_S", "120"))
+    REQUEST_TIMEOUT_MAX_S: float = float(os.getenv("REQUEST_TIMEOUT_MAX_S", "600"))
+    HISTORY_TIMEOUT_S: float = float(os.getenv("HISTORY_TIMEOUT_S", "30"))
+
+    # Enrutado multi-engine: pools por "feature/model_id", "model_id" o "feature" (ver config.yaml)
+    ENGINE_POOLS: Dict[str, List[str]] = {}
+    SUMMARY_ENGINE_POOL: List[str] = []  # engines baratos para resumir resultados de tools
+    ENGINE_EWMA_ALPHA: float = float(os.getenv("ENGINE_EWMA_ALPHA", "0.2"))
+
+    # Resiliencia de las llamadas de streaming a AI Core
+    AICORE_TTFT_TIMEOUT_S: float = float(os.getenv("AICORE_TTFT_TIMEOUT_S", "15"))
+    AICORE_STREAM_RETRIES: int = int(os.getenv("AICORE_STREAM_RETRIES", "1"))
+    AICORE_HEDGE_ENABLED: bool = os.getenv("AICORE_HEDGE_ENABLED", "false").lower() == "true"
+    AICORE_BREAKER_FAILURES: int = int(os.getenv("AICORE_BREAKER_FAILURES", "5"))
+    AICORE_BREAKER_RESET_S: float = float(os.getenv("AICORE_BREAKER_RESET_S", "30"))
+    # Pide a AI Core el usage de tokens al final del stream (stream_options.include_usage)
+    AICORE_STREAM_USAGE: bool = os.getenv("AICORE_STREAM_USAGE", "true").lower() == "true"
+    # Conteo local de tokens (tiktoken) cuando el proveedor no informa usage y para estimar prompts
+    TOKENIZER_ENCODING: str = os.getenv("TOKENIZER_ENCODING", "o200k_base")
+    TOKENIZER_CACHE_SIZE: int = int(os.getenv("TOKENIZER_CACHE_SIZE", "4096"))
+
+    # Registro de tools (ver config.yaml): nombre -> {target, description, execution, timeout_s},
+    # más las de los entry points del grupo indicado; TOOL_FEATURES: feature -> tools visibles
+    TOOL_REGISTRY: Dict[str, Dict[str, Any]] = {}
+    TOOL_ENTRY_POINT_GROUP: str = os.getenv("TOOL_ENTRY_POINT_GROUP", "qgdiag_agent.tools")
+    TOOL_FEATURES: Dict[str, List[str]] = {}
+    # Selección por turno: solo las k tools más relevantes en el prompt (0 = todas)
+    TOOL_SELECTION_TOP_K: int = int(os.getenv("TOOL_SELECTION_TOP_K", "8"))
+    TOOL_SELECTION_HISTORY_MESSAGES: int = int(os.getenv("TOOL_SELECTION_HISTORY_MESSAGES", "4"))
+    # Ejecución de tools: pools de hilos (bloqueantes) y procesos (CPU), timeout por defecto
+    TOOL_THREAD_WORKERS: int = int(os.getenv("TOOL_THREAD_WORKERS", "8"))
+    TOOL_PROCESS_WORKERS: int = int(os.getenv("TOOL_PROCESS_WORKERS", "2"))
+    TOOL_TIMEOUT_S: float = float(os.getenv("TOOL_TIMEOUT_S", "30"))
+    # Llamadas repetidas (misma tool y argumentos) en un turno antes de forzar Final Answer (0 = nunca)
+    TOOL_LOOP_MAX_REPEATS: int = int(os.getenv("TOOL_LOOP_MAX_REPEATS", "2"))
 
+    # Caché compartida por los clientes (ver app/services/cache.py): "memory" o "sqlite"
+    CACHE_BACKEND: str = os.getenv("CACHE_BACKEND", "memory")
+    CACHE_MAX_ENTRIES: int = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+    CACHE_SQLITE_PATH: str = os.getenv("CACHE_SQLITE_PATH", "")  # vacío = /dev/shm/<PROJECT_NAME>-cache.sqlite
+    CACHE_SQLITE_MAX_ENTRIES: int = int(os.getenv("CACHE_SQLITE_MAX_ENTRIES", "100000"))
+    CACHE_SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("CACHE_SQLITE_BUSY_TIMEOUT_MS", "50"))
+    CACHE_L1_TTL_S: float = float(os.getenv("CACHE_L1_TTL_S", "5"))  # LRU local delante de SQLite
+    CACHE_L1_MAX_ENTRIES: int = int(os.getenv("CACHE_L1_MAX_ENTRIES", "2000"))
+    # Sesión de AI Core (access key + cookies de login; la secret key solo en memoria) por aplicación/token; 0 = sin caché
+    AICORE_SESSION_CACHE_TTL_S: float = float(os.getenv("AICORE_SESSION_CACHE_TTL_S", "240"))
+    # Historial por conversación; 0 = sin caché (cambia en cada turno)
+    HISTORY_CACHE_TTL_S: float = float(os.getenv("HISTORY_CACHE_TTL_S", "0"))
+
+    # Lotes (/agent/react-batch)
+    BATCH_MAX_CONCURRENCY: int = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+    BATCH_MAX_ITEMS: int = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+
+    # Control de admisión de /agent (por worker)
+    ADMISSION_MAX_CONCURRENCY: int = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "64"))
+    ADMISSION_MAX_PER_TENANT: int = int(os.getenv("ADMISSION_MAX_PER_TENANT", "16"))
+    ADMISSION_MAX_QUEUE: int = int(os.getenv("ADMISSION_MAX_QUEUE", "128"))
+    ADMISSION_MAX_WAIT_S: float = float(os.getenv("ADMISSION_MAX_WAIT_S", "10"))
+    ADMISSION_TENANT_WEIGHTS: str = os.getenv("ADMISSION_TENANT_WEIGHTS", "")  # "app-a=2,app-b=0.5"
+
+    # Perfilado bajo demanda (/admin) y monitor de bloqueos del event loop
+    # Lista separada por comas ("app1,app2"); NoDecode evita que pydantic-settings la lea como JSON
+    ADMIN_APP_IDS: Annotated[List[str], NoDecode] = [x for x in os.getenv("ADMIN_APP_IDS", "").split(",") if x]
+    PROFILE_MAX_SECONDS: float = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+    LOOP_LAG_MONITOR_ENABLED: bool = os.getenv("LOOP_LAG_MONITOR_ENABLED", "true").lower() == "true"
+    LOOP_LAG_INTERVAL_S: float = float(os.getenv("LOOP_LAG_INTERVAL_S", "0.05"))
+    LOOP_LAG_THRESHOLD_S: float = float(os.getenv("LOOP_LAG_THRESHOLD_S", "0.1"))
+
+    # Arranque: backoff máximo entre reintentos de los pasos de arranque (JWKS...)
+    STARTUP_RETRY_MAX_S: float = float(os.getenv("STARTUP_RETRY_MAX_S", "30"))
+    # Warm-up antes de declararse listo (/ready): pool de AI Core y un turno sintético del grafo
+    WARMUP_ENABLED: bool = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+    WARMUP_CONNECTIONS: int = int(os.getenv("WARMUP_CONNECTIONS", "2"))
+    WARMUP_SYNTHETIC_TURN: bool = os.getenv("WARMUP_SYNTHETIC_TURN", "true").lower() == "true"
+    WARMUP_STEP_TIMEOUT_S: float = float(os.getenv("WARMUP_STEP_TIMEOUT_S", "10"))
+
+    # JWKS: recarga periódica con jitter, recarga por kid desconocido y caché de tokens verificados
+    JWKS_CHANNEL: str = os.getenv("JWKS_CHANNEL", "1")
+    JWKS_REFRESH_S: float = float(os.getenv("JWKS_REFRESH_S", "3600"))
+    JWKS_REFRESH_JITTER: float = float(os.getenv("JWKS_REFRESH_JITTER", "0.1"))
+    JWKS_MIN_REFRESH_INTERVAL_S: float = float(os.getenv("JWKS_MIN_REFRESH_INTERVAL_S", "10"))
+    JWKS_NEGATIVE_TTL_S: float = float(os.getenv("JWKS_NEGATIVE_TTL_S", "60"))
+    AUTH_CACHE_ENABLED: bool = os.getenv("AUTH_CACHE_ENABLED", "true").lower() == "true"
+    AUTH_CACHE_MAX_ENTRIES: int = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+    AUTH_CACHE_MAX_TTL_S: float = float(os.getenv("AUTH_CACHE_MAX_TTL_S", "300"))
+    AUTH_CACHE_LEEWAY_S: float = float(os.getenv("AUTH_CACHE_LEEWAY_S", "5"))
 
     JWKS_LOCAL: Optional[Dict[str, Any]] = None
 
+    # Recarga en caliente de config.yaml (+ overrides opcionales)
+    SETTINGS_OVERRIDES_FILE: str = os.getenv("SETTINGS_OVERRIDES_FILE", "")
+    SETTINGS_WATCH_ENABLED: bool = os.getenv("SETTINGS_WATCH_ENABLED", "true").lower() == "true"
+    SETTINGS_WATCH_INTERVAL_S: float = float(os.getenv("SETTINGS_WATCH_INTERVAL_S", "5"))
+
+    @field_validator("ADMIN_APP_IDS", "PROMPTS_FEATURES", mode="before")
     @classmethod
-    def load_from_yaml(cls, path: str = "config.yaml"):
+    def _split_csv(cls, value: Any) -> Any:
+        if isinstance(value, str):
+            return [x.strip() for x in value.split(",") if x.strip()]
+        return value
+
+    @staticmethod
+    def config_path(path: str = "config.yaml") -> str:
+        """Ruta absoluta de `path` relativa a src (settings.py está en src/app)."""
+        if os.path.isabs(path):
+            return path
+        current_dir = os.path.dirname(os.path.abspath(__file__))
+        return os.path.normpath(os.path.join(current_dir, "..", path))
+
+    @classmethod
+    def load_from_yaml(cls, path: str = "config.yaml", overrides_path: Optional[str] = None):
         """
         Carga la configuración desde un archivo YAML.
 
         En este caso, dado que settings.py está en src/app y config.yaml en src,
-        se calcula la ruta subiendo un nivel desde el directorio actual.
+        se calcula la ruta subiendo un nivel desde el directorio actual. Si se indica
+        `overrides_path` y existe, sus claves sustituyen a las de config.yaml.
         """
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        config_path = os.path.join(current_dir, "..", path)
+        config_path = cls.config_path(path)
         if not os.path.exists(config_path):
             raise FileNotFoundError(f"Config file not found at {config_path}")
         with open(config_path, "r") as f:
-            data = yaml.safe_load(f)
+            data = yaml.safe_load(f) or {}
+        if overrides_path and os.path.exists(cls.config_path(overrides_path)):
+            with open(cls.config_path(overrides_path), "r") as f:
+                data.update(yaml.safe_load(f) or {})
         return cls(**data)
 
     def is_local(self) -> bool:
@@ -71,4 +229,170 @@ class Settings(BaseSettings):
             return self.JWKS_LOCAL
         return None
 
-settings = Settings.load_from_yaml()
+
+SettingsListener = Callable[[Settings, Settings, Set[str]], None]
+# Se leen al arrancar el worker (backend de caché, tokenizer, catálogo y pools de tools, warm-up...)
+RESTART_ONLY = frozenset({
+    "PROJECT_NAME",
+    "TOKENIZER_ENCODING", "TOKENIZER_CACHE_SIZE",
+    "TOOL_REGISTRY", "TOOL_ENTRY_POINT_GROUP", "TOOL_THREAD_WORKERS", "TOOL_PROCESS_WORKERS", "TOOL_TIMEOUT_S",
+    "CACHE_BACKEND", "CACHE_MAX_ENTRIES", "CACHE_SQLITE_PATH", "CACHE_SQLITE_MAX_ENTRIES",
+    "CACHE_SQLITE_BUSY_TIMEOUT_MS", "CACHE_L1_TTL_S", "CACHE_L1_MAX_ENTRIES",
+    "WARMUP_ENABLED", "WARMUP_CONNECTIONS", "WARMUP_SYNTHETIC_TURN", "WARMUP_STEP_TIMEOUT_S",
+    "SETTINGS_OVERRIDES_FILE", "SETTINGS_WATCH_ENABLED", "SETTINGS_WATCH_INTERVAL_S",
+})
+_PINNED: contextvars.ContextVar[Optional[Settings]] = contextvars.ContextVar("pinned_settings", default=None)
+
+
+class SettingsProvider:
+    """
+    Instantánea vigente de Settings y su recarga. Las recargas que fallan (YAML o
+    validación) conservan la instantánea anterior. Los suscriptores reciben
+    (anterior, nueva, campos cambiados) para reconstruir solo lo que dependa de ellos.
+    """
+
+    def __init__(self, path: str = "config.yaml", overrides_path: Optional[str] = None):
+        self.path = path
+        self.overrides_path = overrides_path
+        self.version = 1
+        self.last_error: Optional[str] = None
+        self._current = Settings.load_from_yaml(path, overrides_path)
+        self._initial = self._current  # la que leyeron los campos de RESTART_ONLY
+        self._mtimes = self._stat()
+        self._listeners: List[SettingsListener] = []
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def current(self) -> Settings:
+        return self._current
+
+    def effective(self) -> Settings:
+        """La instantánea fijada por la petición en curso o, fuera de una petición, la vigente."""
+        pinned = _PINNED.get()
+        return pinned if pinned is not None else self._current
+
+    def subscribe(self, listener: SettingsListener) -> None:
+        self._listeners.append(listener)
+
+    @contextmanager
+    def pinned(self) -> Iterator[Settings]:
+        token = _PINNED.set(self._current)
+        try:
+            yield self._current
+        finally:
+            _PINNED.reset(token)
+
+    def _stat(self) -> Dict[str, float]:
+        mtimes = {}
+        for p in (self.path, self.overrides_path):
+            if p:
+                try:
+                    mtimes[p] = os.stat(Settings.config_path(p)).st_mtime
+                except OSError:
+                    mtimes[p] = 0.0
+        return mtimes
+
+    def reload(self) -> Set[str]:
+        """Relee los ficheros y sustituye la instantánea. Devuelve los campos cambiados."""
+        self._mtimes = self._stat()
+        try:
+            new = Settings.load_from_yaml(self.path, self.overrides_path)
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            raise
+        self.last_error = None
+        return self.swap(new)
+
+    def swap(self, new: Settings) -> Set[str]:
+        """
+        Publica `new` como instantánea vigente y avisa a los suscriptores. Devuelve los
+        campos cambiados. La siguiente recarga desde ficheros la sustituye.
+        """
+        old = self._current
+        changed = {name for name in Settings.model_fields if getattr(old, name) != getattr(new, name)}
+        if not changed:
+            return changed
+        self._current = new
+        self.version += 1
+        if changed & RESTART_ONLY:
+            log.warning(f"Campos que requieren reiniciar el worker: {', '.join(sorted(changed & RESTART_ONLY))}")
+        for listener in self._listeners:
+            listener(old, new, changed)
+        return changed
+
+    def changed_on_disk(self) -> bool:
+        return self._stat() != self._mtimes
+
+    def start(self, interval_s: float) -> None:
+        """Vigila los ficheros (por mtime) desde el event loop actual."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._watch(interval_s), name="settings-watch")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _watch(self, interval_s: float) -> None:
+        while True:
+            await asyncio.sleep(interval_s)
+            if not self.changed_on_disk():
+                continue
+            try:
+                changed = self.reload()
+            except Exception:
+                log.error(f"Recarga de settings fallida, se mantiene v{self.version}: {self.last_error}")
+                continue
+            if changed:
+                log.info(f"Settings recargados (v{self.version}): {', '.join(sorted(changed))}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "files": list(self._mtimes),
+            "watching": self._task is not None and not self._task.done(),
+            "last_error": self.last_error,
+            # Cambiados desde el arranque pero sin efecto hasta reiniciar
+            "pending_restart": sorted(
+                name for name in RESTART_ONLY if getattr(self._initial, name) != getattr(self._current, name)
+            ),
+        }
+
+
+class _SettingsProxy:
+    """`settings` para el resto de módulos: lee de la instantánea efectiva (solo lectura)."""
+
+    __slots__ = ("_provider",)
+
+    def __init__(self, provider: SettingsProvider):
+        object.__setattr__(self, "_provider", provider)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._provider.effective(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"settings es de solo lectura ({name}); usa settings_provider.swap()")
+
+    def __repr__(self) -> str:
+        return f"<settings v{self._provider.version} {self._provider.effective()!r}>"
+
+
+class PinnedSettingsMiddleware:
+    """Middleware ASGI: fija la instantánea de settings durante toda la petición (streaming incluido)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        with settings_provider.pinned():
+            await self.app(scope, receive, send)
+
+
+settings_provider = SettingsProvider("config.yaml", os.getenv("SETTINGS_OVERRIDES_FILE") or None)
+settings: Settings = _SettingsProxy(settings_provider)  # type: ignore[assignment]
@@ -6,9 +6,17 @@ Clases:
     Ninguna
 Funciones:
     health() -> dict:
-        Endpoint para verificar el estado de salud de la aplicación.
+        Endpoint para verificar el estado de salud de la aplicación (liveness).
+    ready() -> JSONResponse:
+        Readiness: 200 cuando el arranque ha terminado, 503 mientras tanto.
+    metrics() -> Response:
+        Métricas en formato de exposición de Prometheus.
     on_startup() -> None:
         Evento que se ejecuta al iniciar la aplicación.
+    load_jwks() -> None:
+        Paso de arranque en segundo plano que carga las claves JWKS y arranca su recarga.
+    startup_steps() -> None:
+        JWKS y warm-up (pool de AI Core, turno sintético del grafo) en paralelo.
     on_shutdown() -> None:
         Evento que se ejecuta al apagar la aplicación.
 Atributos:
@@ -16,16 +24,32 @@ Atributos:
     con el nombre del proyecto y el prefijo de ruta raíz.
 """
 
-from app.settings import settings 
-from fastapi import FastAPI
+import asyncio
+
+from app.settings import PinnedSettingsMiddleware, settings, settings_provider
+from fastapi import FastAPI, Response
+from fastapi.responses import JSONResponse
 from app.routes.agent import router as route
+from app.routes.admin import router as admin_route
+from app.agent import warmup
+from app.services.jwks import jwks_manager
+from app.services.metrics import CONTENT_TYPE, REGISTRY
+from app.services.profiling import loop_monitor
+from app.services.readiness import readiness
+from app.services.usage import usage_accountant
+from app.agent.tool_executor import tool_executor
+from app.services.cache import cache_backend
 from qgdiag_lib_arquitectura import LoggingMiddleware, init_error_handlers
 from qgdiag_lib_arquitectura.security import authentication
 
 app = FastAPI(title=settings.PROJECT_NAME, root_path="/qgdiag-microservicio-python-test")
 app.add_middleware(LoggingMiddleware)
+app.add_middleware(PinnedSettingsMiddleware)  # cada petición conserva sus settings aunque se recarguen
 app.include_router(route)
+app.include_router(admin_route)
 init_error_handlers(app, context_name=settings.PROJECT_NAME)
+# Cada recarga del JWKS sustituye el Authenticator de forma atómica
+jwks_manager.subscribe(lambda jwks, keys: setattr(app.state, "jwks_store", authentication.Authenticator(jwks)))
 
 
 @app.get("/health")
@@ -36,20 +60,81 @@ async def health():
     return {"message": "Fast API Skeleton is up!"}
 
 
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe: 503 hasta que terminen los pasos de arranque (JWKS, warm-up), para que
+    el balanceador no envíe tráfico a un worker que aún no puede atenderlo.
+    """
+    snapshot = readiness.snapshot()
+    return JSONResponse(snapshot, status_code=200 if snapshot["ready"] else 503)
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Latencias por nodo, TTFT y tokens/s por engine, historial, credenciales/login,
+    streams y admisión, en formato texto de Prometheus.
+    """
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
 @app.on_event("startup")
 async def on_startup():
 
     """
     Evento que se ejecuta al iniciar la aplicación.
-    Obtiene claves JWKS
+    Arranca el monitor de bloqueos del event loop, la vigilancia de config.yaml y el
+    envío de consumo al MS de control de gastos, y lanza en segundo plano los pasos de
+    arranque (JWKS y warm-up): el worker acepta conexiones (liveness) enseguida y
+    /ready responde 200 cuando terminan.
     """  
-    jwks = settings.get_jwks()    
-    if not jwks:        
-        jwks = await authentication.fetch_jwks(channel="1")    
-    app.state.jwks_store = authentication.Authenticator(jwks)
+    readiness.expect("jwks", *warmup.step_names())
+    local_jwks = settings.get_jwks()  # error de configuración en local: falla el arranque
+    if settings.LOOP_LAG_MONITOR_ENABLED:
+        loop_monitor.start()
+    if settings.SETTINGS_WATCH_ENABLED:
+        settings_provider.start(settings.SETTINGS_WATCH_INTERVAL_S)
+    if settings.USAGE_ENABLED:
+        usage_accountant.start()
+    app.state.startup_task = asyncio.create_task(startup_steps(local_jwks), name="startup")
+
+
+async def startup_steps(local_jwks=None):
+    await asyncio.gather(load_jwks(local_jwks), warmup.run_warmup())
+
+
+async def load_jwks(jwks=None):
+    """
+    Obtiene las claves JWKS (si no vienen de config), reintentando con backoff, y
+    arranca su recarga periódica.
+    """
+    delay = 1.0
+    while True:
+        try:
+            async with readiness.step("jwks"):
+                if jwks:
+                    jwks_manager.set_jwks(jwks)
+                else:
+                    await jwks_manager.refresh("startup")
+            break
+        except Exception:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, settings.STARTUP_RETRY_MAX_S)
+    if not jwks:
+        jwks_manager.start()
 
 
 @app.on_event("shutdown")
 async def on_shutdown():
     """Evento que se ejecuta al apagar la aplicación."""
+    startup_task = getattr(app.state, "startup_task", None)
+    if startup_task is not None and not startup_task.done():
+        startup_task.cancel()
+    await usage_accountant.stop()  # envía el consumo pendiente
+    await jwks_manager.stop()
+    await settings_provider.stop()
+    await loop_monitor.stop()
+    tool_executor.shutdown()
+    cache_backend.close()
     print(f"Shutting down {settings.PROJECT_NAME}...")
@@ -0,0 +1,101 @@
+"""Tests de la propagación del deadline por los nodos del grafo."""
+
+import asyncio
+import time
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+pytest.importorskip("langgraph")
+pytest.importorskip("qgdiag_lib_arquitectura")
+
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langgraph.runtime import Runtime
+
+from app.agent import graph as graph_module
+from app.agent.context import Context
+from app.agent.deadline import DEADLINE_ANSWER, budget, deadline_after, remaining
+from app.agent.ms_nodes import history_node
+from app.agent.state import State
+
+
+class _SlowChat:
+    """Chat falso que emite unos tokens y luego se queda colgado."""
+
+    def __init__(self, tokens, hang_s=10):
+        self.tokens = tokens
+        self.hang_s = hang_s
+
+    async def astream(self, messages, config=None):
+        for t in self.tokens:
+            yield AIMessageChunk(content=t)
+        await asyncio.sleep(self.hang_s)
+
+
+def _runtime(timeout_s, **kwargs):
+    return Runtime(context=Context(deadline=deadline_after(timeout_s), **kwargs))
+
+
+def test_budget_helpers():
+    assert remaining(None) is None
+    assert budget(None, 5) == 5
+    assert budget(deadline_after(100), 5) == 5
+    assert budget(deadline_after(1), 5) <= 1
+    assert remaining(time.monotonic() - 10) == 0.0
+
+
+@pytest.mark.asyncio
+async def test_call_model_skips_model_when_deadline_expired():
+    state = State(messages=[HumanMessage(content="hola")])
+    with patch.object(graph_module, "get_openai_compatible_chat", AsyncMock()) as mock_chat:
+        out = await graph_module.call_model(state, {}, _runtime(-1))
+    mock_chat.assert_not_called()
+    assert out["messages"][0].content == DEADLINE_ANSWER
+
+
+@pytest.mark.asyncio
+async def test_call_model_returns_partial_final_answer_on_timeout():
+    state = State(messages=[HumanMessage(content="hola")])
+    chat = _SlowChat(["Final Answer: ", "respuesta ", "parcial"])
+    with patch.object(graph_module, "get_openai_compatible_chat", AsyncMock(return_value=chat)):
+        out = await graph_module.call_model(state, {}, _runtime(0.2))
+    msg = out["messages"][0]
+    assert msg.content == "respuesta parcial"
+    assert msg.response_metadata["finish_reason"] == "deadline"
+
+
+@pytest.mark.asyncio
+async def test_call_model_does_not_emit_half_tool_call_on_timeout():
+    state = State(messages=[HumanMessage(content="hola")])
+    chat = _SlowChat(["Action: get_horoscope\nAction Input: {\"sign\": "])
+    with patch.object(graph_module, "get_openai_compatible_chat", AsyncMock(return_value=chat)):
+        out = await graph_module.call_model(state, {}, _runtime(0.2))
+    msg = out["messages"][0]
+    assert not msg.tool_calls
+    assert msg.content == DEADLINE_ANSWER
+
+
+@pytest.mark.asyncio
+async def test_run_tools_cancels_when_budget_runs_out():
+    call = {"id": "call_1", "name": "get_horoscope", "args": {"sign": "Leo"}}
+    state = State(messages=[AIMessage(content="", tool_calls=[call])])
+
+    async def _hang(*args, **kwargs):
+        await asyncio.sleep(10)
+
+    with patch.object(graph_module._tool_node, "ainvoke", side_effect=_hang):
+        out = await graph_module.run_tools(state, {}, _runtime(0.1))
+    (tool_msg,) = out["messages"]
+    assert tool_msg.tool_call_id == "call_1"
+    assert tool_msg.status == "error"
+
+
+@pytest.mark.asyncio
+async def test_load_history_continues_without_history_on_timeout():
+    async def _slow_history(*args, **kwargs):
+        await asyncio.sleep(10)
+
+    state = State(messages=[HumanMessage(content="hola")])
+    with patch.object(history_node.HistoryClient, "get_messages", side_effect=_slow_history):
+        out = await history_node.load_history(state, _runtime(0.1, conversation_id="conv-1"))
+    assert out == {"history": ()}
@@ -0,0 +1,85 @@
+"""Tests del enrutado multi-engine."""
+
+import random
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+pytest.importorskip("langgraph")
+pytest.importorskip("qgdiag_lib_arquitectura")
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import HumanMessage
+
+from app.agent import graph as graph_module
+from app.agent.context import Context
+from app.agent.engine_router import EngineRouter
+
+
+def _router(**kwargs):
+    cfg = dict(
+        default_engine="default",
+        pools={"chat": ["e1", "e2"], "chat/gpt-big": ["big"], "gpt-small": ["small"]},
+        rng=random.Random(0),
+    )
+    cfg.update(kwargs)
+    return EngineRouter(**cfg)
+
+
+def test_pool_resolution_order():
+    router = _router()
+    assert router.pool_for("chat", "gpt-big") == ["big"]
+    assert router.pool_for("chat", "gpt-small") == ["small"]
+    assert router.pool_for("chat", "unknown") == ["e1", "e2"]
+    assert router.pool_for("other", "unknown") == ["default"]
+    assert router.pool_for("other", None, default_engine="ctx-engine") == ["ctx-engine"]
+
+
+def test_prefers_unexplored_then_fastest_engine():
+    router = _router()
+    router.record("e1", ttft_s=0.8)
+    assert router.choose("chat", None).engine_id == "e2"  # e2 sin muestras: se explora
+
+    router.record("e2", ttft_s=0.2)
+    decision = router.choose("chat", None)
+    assert decision.engine_id == "e2"
+    assert decision.reason == "pool"
+    assert decision.scores["e1"] > decision.scores["e2"]
+
+
+def test_error_rate_penalises_fast_engine():
+    router = _router()
+    router.record("e1", ttft_s=0.5)
+    router.record("e2", ttft_s=0.2)
+    for _ in range(5):
+        router.record("e2", ok=False)
+    assert router.choose("chat", None).engine_id == "e1"
+
+
+def test_simple_turns_go_to_summary_pool():
+    router = _router(summary_pool=["cheap"])
+    assert router.choose("chat", None, simple_turn=True).engine_id == "cheap"
+    assert router.choose("chat", None, simple_turn=True).reason == "summary"
+    assert router.choose("chat", None, simple_turn=False).engine_id in ("e1", "e2")
+
+
+@pytest.mark.asyncio
+async def test_routing_decisions_are_streamed_as_events():
+    chat = FakeListChatModel(responses=['Action: get_horoscope\nAction Input: {"sign": "Leo"}', "Final Answer: ok"])
+    router = _router(summary_pool=["cheap"])
+    ctx = Context(feature="chat", model_id="gpt-small")
+
+    with patch.object(graph_module, "engine_router", router), patch.object(
+        graph_module, "get_openai_compatible_chat", AsyncMock(return_value=chat)
+    ) as mock_chat:
+        events = [
+            ev
+            async for ev in graph_module.graph.astream_events(
+                {"messages": [HumanMessage(content="horóscopo de Leo")]}, context=ctx, recursion_limit=10
+            )
+        ]
+
+    routes = [ev["data"] for ev in events if ev["event"] == "on_custom_event" and ev["name"] == "engine_route"]
+    assert [r["engine_id"] for r in routes] == ["small", "cheap"]
+    assert [c.kwargs["engine_id"] for c in mock_chat.await_args_list] == ["small", "cheap"]
+    assert router.stats["small"].samples == 1
@@ -0,0 +1,110 @@
+"""Guardrails concurrentes con la generación, contra el MS de guardrails falso."""
+
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("langgraph")
+pytest.importorskip("qgdiag_lib_arquitectura")
+
+from langchain_core.messages import AIMessageChunk, HumanMessage
+
+from app.agent.context import Context
+from app.agent.deadline import deadline_after
+from app.agent.graph import graph
+from app.agent.guardrails import GUARDRAIL_ANSWER
+
+
+class _ScriptedChat:
+    """Chat falso: emite los tokens con `delay_s` entre ellos y luego se queda colgado `hang_s`."""
+
+    def __init__(self, tokens, delay_s=0.0, hang_s=0.0):
+        self.tokens = tokens
+        self.delay_s = delay_s
+        self.hang_s = hang_s
+        self.finished = False
+
+    async def astream(self, messages, config=None):
+        for t in self.tokens:
+            await asyncio.sleep(self.delay_s)
+            yield AIMessageChunk(content=t)
+        await asyncio.sleep(self.hang_s)
+        self.finished = True
+
+
+@pytest.fixture
+def guardrails_ms(fake_guardrails, override_settings):
+    def _start(**config):
+        fake, srv = fake_guardrails(**config)
+        override_settings(GUARDRAILS_ENABLED=True, GUARDRAILS_URL="http://127.0.0.1", GUARDRAILS_PORT=str(srv.port))
+        return fake
+    return _start
+
+
+async def _turn(message, chat, timeout_s=10):
+    ctx = Context(engine_id="engine-test", chat_model=chat, deadline=deadline_after(timeout_s))
+    result = await graph.ainvoke({"messages": [HumanMessage(content=message)]}, context=ctx, recursion_limit=4)
+    return result["messages"][-1]
+
+
+@pytest.mark.asyncio
+async def test_input_check_overlaps_with_generation(guardrails_ms):
+    fake = guardrails_ms(latency_s=0.6)
+    chat = _ScriptedChat(["Final Answer: ", "ho", "la"], delay_s=0.2)
+
+    started = time.perf_counter()
+    msg = await _turn("hola", chat)
+    elapsed = time.perf_counter() - started
+
+    assert msg.content == "hola"
+    assert ("input", "hola") in fake.checks
+    # generación (0.6 s) + comprobación de la última ventana de salida (0.6 s);
+    # con la entrada en serie serían >= 1.8 s
+    assert elapsed < 1.6
+
+
+@pytest.mark.asyncio
+async def test_blocked_input_cancels_the_generation(guardrails_ms):
+    guardrails_ms(latency_s=0.1)
+    chat = _ScriptedChat(["Final Answer: ", "bla"], hang_s=10)
+
+    started = time.perf_counter()
+    msg = await _turn("algo prohibido", chat)
+
+    assert msg.content == GUARDRAIL_ANSWER
+    assert msg.response_metadata["finish_reason"] == "guardrail"
+    assert not chat.finished and time.perf_counter() - started < 2
+
+
+@pytest.mark.asyncio
+async def test_output_is_checked_in_overlapping_windows_while_streaming(guardrails_ms, override_settings):
+    override_settings(GUARDRAILS_OUTPUT_WINDOW_CHARS=20, GUARDRAILS_OUTPUT_OVERLAP_CHARS=5)
+    fake = guardrails_ms()
+    tokens = ["Final Answer: ", "texto normal ", "y luego algo prohibido ", "y bastante más texto detrás"]
+    chat = _ScriptedChat(tokens, delay_s=0.05, hang_s=10)
+
+    msg = await _turn("hola", chat)
+
+    assert msg.content == GUARDRAIL_ANSWER and not chat.finished
+    outputs = [text for stage, text in fake.checks if stage == "output"]
+    assert len(outputs) >= 2 and all(len(t) <= 25 for t in outputs)
+    assert outputs[1].startswith(outputs[0][-5:])  # solape entre ventanas
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fail_open", [False, True])
+async def test_unavailable_guardrails_honour_fail_open(guardrails_ms, override_settings, fail_open):
+    override_settings(GUARDRAILS_FAIL_OPEN=fail_open)
+    guardrails_ms(status_code=503)
+
+    msg = await _turn("hola", _ScriptedChat(["Final Answer: ok"]))
+
+    assert msg.content == ("ok" if fail_open else GUARDRAIL_ANSWER)
+
+
+@pytest.mark.asyncio
+async def test_disabled_guardrails_do_not_call_the_service(fake_guardrails):
+    fake, _ = fake_guardrails()
+    msg = await _turn("algo prohibido", _ScriptedChat(["Final Answer: ok"]))
+    assert msg.content == "ok" and fake.checks == []
@@ -0,0 +1,71 @@
+"""HistoryClient contra el MS de historial falso (sin red)."""
+
+import pytest
+
+pytest.importorskip("qgdiag_lib_arquitectura")
+
+from app.agent.history_record import HistoryRecord
+from app.agent.ms_clients import history_client
+from app.agent.ms_clients.history_client import HistoryClient, to_langchain
+from app.services.cache import CacheNamespace, MemoryCache
+from langchain_core.messages import AIMessage, HumanMessage
+
+
+@pytest.mark.asyncio
+async def test_get_messages_from_fake_history(fake_history, override_settings):
+    fake, srv = fake_history(messages=4, message_chars=50)
+    override_settings(URL_HIST_CONV="http://127.0.0.1", HIST_CONV_PORT=str(srv.port))
+
+    wires = await HistoryClient().get_messages("conv-1", headers={})
+
+    assert fake.requests == 1
+    assert [w.message_id for w in wires] == ["conv-1-0", "conv-1-1", "conv-1-2", "conv-1-3"]
+    msgs = [to_langchain(w) for w in wires]
+    assert isinstance(msgs[0], HumanMessage) and isinstance(msgs[1], AIMessage)
+    assert len(msgs[0].content) == 50
+
+
+@pytest.mark.asyncio
+async def test_records_are_compact_and_cached(fake_history, override_settings, monkeypatch):
+    fake, srv = fake_history(messages=2, message_chars=20)
+    override_settings(URL_HIST_CONV="http://127.0.0.1", HIST_CONV_PORT=str(srv.port))
+    monkeypatch.setattr(history_client, "_HISTORY", CacheNamespace("history", 60, MemoryCache()))
+
+    first = await HistoryClient().get_records("conv-1", headers={})
+    second = await HistoryClient().get_records("conv-1", headers={})
+
+    assert fake.requests == 1 and first == second
+    assert [r.role for r in first] == ["human", "ai"] and not hasattr(first[0], "__dict__")
+    msg = first[1].to_message(metadata=True)
+    assert isinstance(msg, AIMessage) and msg.response_metadata["message_id"] == "conv-1-1"
+    assert msg.response_metadata["date_created"].startswith("2024-01-01T00:00:01")
+    assert first[0].to_message().response_metadata == {}
+    assert HistoryRecord("ai", "sin fecha").to_message(metadata=True).response_metadata["date_created"] is None
+
+
+@pytest.mark.asyncio
+async def test_history_reaches_the_model_before_the_current_turn(monkeypatch):
+    pytest.importorskip("langgraph")
+    from langchain_core.messages import AIMessageChunk
+
+    from app.agent import graph as graph_module
+    from app.agent.context import Context
+    from app.agent.history_record import HistoryRecord
+
+    async def get_records(self, conversation_id, headers, timeout=None):
+        return [HistoryRecord("human", "antes", "h1", 1.0), HistoryRecord("ai", "vale", "h2", 2.0)]
+
+    class _Chat:
+        async def astream(self, messages, config=None):
+            self.messages = messages
+            yield AIMessageChunk(content="Final Answer: ok")
+
+    monkeypatch.setattr(HistoryClient, "get_records", get_records)
+    chat = _Chat()
+    result = await graph_module.graph.ainvoke(
+        {"messages": [HumanMessage(content="y ahora?")]},
+        context=Context(engine_id="engine-test", chat_model=chat, conversation_id="conv-1"),
+    )
+
+    assert [m.content for m in chat.messages[1:]] == ["antes", "vale", "y ahora?"]
+    assert len(result["messages"]) == 2 and len(result["history"]) == 2
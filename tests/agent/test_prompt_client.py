@@ -0,0 +1,149 @@
+"""PromptClient: caché de plantillas con ETag y stale-while-revalidate (fetch inyectado, sin red)."""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("qgdiag_lib_arquitectura")
+
+from app.agent.ms_clients import prompt_client
+from app.agent.ms_clients.prompt_client import CompiledPrompt, PromptClient, fetch_prompt
+from app.schemas.prompt_schema import PromptWire
+
+
+class FakePromptMS:
+    def __init__(self, text="Eres el asistente de {feature}. Hora: {system_time}", version="v1"):
+        self.text = text
+        self.version = version
+        self.calls = []
+        self.fail = False
+
+    async def __call__(self, feature, name, etag):
+        self.calls.append((feature, name, etag))
+        await asyncio.sleep(0)
+        if self.fail:
+            raise ConnectionError("gestor de prompts caído")
+        if etag == self.version:
+            return None, etag
+        return PromptWire(feature=feature, name=name, prompt_text=self.text, version=self.version), self.version
+
+
+def test_compiled_prompt_renders_known_fields_and_keeps_the_rest():
+    p = CompiledPrompt("Hola {user}, {missing} {{literal}} {x:>3} {}")
+    assert p.fields == {"user", "missing"}
+    assert p.render(user="Ana", x=1) == "Hola Ana, {missing} {literal} {x:>3} {}"
+    assert CompiledPrompt("llave { sin cerrar").render(a=1) == "llave { sin cerrar"
+
+
+@pytest.mark.asyncio
+async def test_preload_then_get_is_served_from_memory():
+    ms = FakePromptMS()
+    client = PromptClient(ms, ttl_s=60)
+
+    assert await client.preload(["chat", "rag"]) == 2
+    prompt = client.get("chat")
+
+    assert prompt.version == "v1" and prompt.render(feature="chat").startswith("Eres el asistente de chat")
+    assert len(ms.calls) == 2  # get() no sale a red
+
+
+@pytest.mark.asyncio
+async def test_miss_returns_none_and_fetches_in_background():
+    ms = FakePromptMS()
+    client = PromptClient(ms, ttl_s=60)
+
+    assert client.get("chat") is None
+    assert client.get("chat") is None  # single-flight: una sola descarga en curso
+    await asyncio.sleep(0.01)
+
+    assert client.get("chat").version == "v1" and len(ms.calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_stale_entry_is_served_while_revalidating_with_etag():
+    ms = FakePromptMS()
+    client = PromptClient(ms, ttl_s=0)
+    await client.refresh("chat")
+
+    assert client.get("chat").version == "v1"  # caducada: se sirve y se revalida
+    await asyncio.sleep(0.01)
+    assert ms.calls[-1] == ("chat", "system", "v1")  # If-None-Match -> 304
+    assert client.get("chat").version == "v1"
+
+    ms.text, ms.version = "Nueva versión", "v2"
+    await asyncio.sleep(0.01)
+    assert client.get("chat").template == "Nueva versión"
+
+
+@pytest.mark.asyncio
+async def test_failed_revalidation_keeps_previous_version():
+    ms = FakePromptMS()
+    client = PromptClient(ms, ttl_s=0)
+    await client.refresh("chat")
+    ms.fail = True
+
+    client.get("chat")
+    await asyncio.sleep(0.01)
+
+    assert client.get("chat").version == "v1"
+    assert await client.preload(["otra"]) == 0  # la precarga fallida no lanza
+
+
+@pytest.mark.asyncio
+async def test_unknown_features_do_not_grow_state_or_hammer_the_ms():
+    ms = FakePromptMS()
+    ms.fail = True  # p.ej. 404: la plantilla no existe
+    client = PromptClient(ms, ttl_s=60, allowed=lambda f: f in {"chat"}, miss_ttl_s=60)
+
+    for i in range(50):
+        assert client.get(f"random-{i}") is None
+    assert client.get("chat") is None
+    await asyncio.sleep(0.01)
+    assert client.get("chat") is None  # el fallo se recuerda: no se vuelve a pedir
+
+    assert ms.calls == [("chat", "system", None)]
+    assert client._inflight == {} and list(client._misses) == [("chat", "system")]
+
+    await client.invalidate("chat")
+    ms.fail = False
+    client.get("chat")
+    await asyncio.sleep(0.01)
+    assert client.get("chat").version == "v1" and client._misses == {}
+
+
+def test_prompts_features_env_var_is_a_comma_separated_list():
+    import os
+    import subprocess
+    import sys
+
+    env = {**os.environ, "PROMPTS_FEATURES": "chat,rag", "PYTHONPATH": os.pathsep.join(sys.path)}
+    out = subprocess.run(
+        [sys.executable, "-c", "from app.settings import settings; print(settings.PROMPTS_FEATURES)"],
+        env=env, capture_output=True, text=True, timeout=60,
+    )
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.strip().splitlines()[-1] == "['chat', 'rag']"
+
+
+class _Response:
+    status_code = 304
+    headers = {}
+
+
+@pytest.mark.asyncio
+async def test_fetch_prompt_sends_service_credentials(monkeypatch, override_settings):
+    sent = []
+
+    class FakeRestClient:
+        def __init__(self, **kwargs):
+            pass
+
+        async def get_call(self, endpoint, headers=None, params=None):
+            sent.append(headers)
+            return _Response()
+
+    monkeypatch.setattr(prompt_client, "RestClient", FakeRestClient)
+    override_settings(SERVICE_TOKEN="svc-token", SERVICE_APP_ID="agent")
+
+    assert await fetch_prompt("chat", "system", "v1") == (None, "v1")
+    assert sent == [{"Token": "svc-token", "IAG-App-Id": "agent", "If-None-Match": "v1"}]
@@ -0,0 +1,136 @@
+"""Tests de ResilientChatInvoker contra un AI Core falso local (latencia y errores inyectados)."""
+
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("langchain_openai")
+pytest.importorskip("qgdiag_lib_arquitectura")
+
+from langchain_core.messages import AIMessageChunk
+from langchain_openai import ChatOpenAI
+
+from app.agent.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    FirstTokenTimeout,
+    ResilientChatInvoker,
+)
+
+MESSAGES = [{"role": "user", "content": "hola"}]
+
+
+def _chat(base_url):
+    return ChatOpenAI(api_key="k:s", model="engine-1", base_url=f"{base_url}/model/openai", max_retries=0, streaming=True)
+
+
+def _breaker(failures=3, reset_s=30.0):
+    return CircuitBreaker("engine-1", failure_threshold=failures, reset_timeout_s=reset_s)
+
+
+async def _collect(invoker):
+    return "".join([c.content async for c in invoker.astream(MESSAGES)])
+
+
+@pytest.mark.asyncio
+async def test_streams_through_on_healthy_backend(fake_aicore):
+    fake, url = fake_aicore(script=["Final Answer: todo bien"])
+    invoker = ResilientChatInvoker(_chat(url), engine_id="engine-1", ttft_timeout_s=5, max_retries=1, breaker=_breaker())
+
+    assert await _collect(invoker) == "Final Answer: todo bien"
+    assert fake.requests == 1
+    assert invoker.ttft_s is not None
+
+
+@pytest.mark.asyncio
+async def test_retries_when_first_token_is_late(fake_aicore):
+    fake, url = fake_aicore(script=["Final Answer: ok"], stall_first=1)
+    invoker = ResilientChatInvoker(_chat(url), engine_id="engine-1", ttft_timeout_s=0.3, max_retries=1, breaker=_breaker())
+
+    started = time.monotonic()
+    assert await _collect(invoker) == "Final Answer: ok"
+    assert fake.requests == 2
+    assert time.monotonic() - started < 5
+
+
+@pytest.mark.asyncio
+async def test_retries_errors_before_first_token(fake_aicore):
+    fake, url = fake_aicore(script=["Final Answer: ok"], fail_first=1, error_status=503)
+    breaker = _breaker()
+    invoker = ResilientChatInvoker(_chat(url), engine_id="engine-1", ttft_timeout_s=5, max_retries=1, breaker=breaker)
+
+    assert await _collect(invoker) == "Final Answer: ok"
+    assert fake.requests == 2
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+class _GatedChat:
+    """Chat falso: cada intento espera a que el test abra su compuerta antes del primer token."""
+
+    def __init__(self):
+        self.gates = []
+
+    def astream(self, messages, config=None):
+        self.gates.append(asyncio.Event())
+        return self._stream(len(self.gates), self.gates[-1])
+
+    async def _stream(self, n, gate):
+        await gate.wait()
+        yield AIMessageChunk(content=f"Final Answer: intento {n}")
+
+
+@pytest.mark.asyncio
+async def test_hedge_keeps_first_request_alive():
+    chat = _GatedChat()
+    invoker = ResilientChatInvoker(chat, engine_id="engine-1", ttft_timeout_s=1.0, max_retries=1, hedge=True, breaker=_breaker())
+    turn = asyncio.create_task(_collect(invoker))
+
+    while len(chat.gates) < 2:  # el hedge sale tras ttft_timeout_s sin primer token
+        await asyncio.sleep(0.01)
+    chat.gates[0].set()  # responde el primer intento; el hedge sigue sin token
+
+    assert await asyncio.wait_for(turn, 10) == "Final Answer: intento 1"
+    assert not chat.gates[1].is_set()
+
+
+@pytest.mark.asyncio
+async def test_gives_up_after_retries_and_opens_breaker(fake_aicore):
+    fake, url = fake_aicore(stall_first=10)
+    breaker = _breaker(failures=1)
+    invoker = ResilientChatInvoker(_chat(url), engine_id="engine-1", ttft_timeout_s=0.2, max_retries=1, breaker=breaker)
+
+    with pytest.raises(FirstTokenTimeout):
+        await _collect(invoker)
+    assert fake.requests == 2
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # Con el breaker abierto se falla en seco, sin tocar el backend.
+    with pytest.raises(CircuitOpenError):
+        await _collect(ResilientChatInvoker(_chat(url), engine_id="engine-1", breaker=breaker))
+    assert fake.requests == 2
+
+
+@pytest.mark.asyncio
+async def test_breaker_half_open_probe_closes_on_success(fake_aicore):
+    fake, url = fake_aicore(script=["Final Answer: ok"], fail_first=1)
+    breaker = _breaker(failures=1, reset_s=0.1)
+    invoker = ResilientChatInvoker(_chat(url), engine_id="engine-1", ttft_timeout_s=5, max_retries=0, breaker=breaker)
+
+    with pytest.raises(Exception):
+        await _collect(invoker)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    await asyncio.sleep(0.15)
+    assert await _collect(invoker) == "Final Answer: ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_allows_single_probe_when_half_open():
+    breaker = _breaker(failures=1, reset_s=0.0)
+    breaker.record_failure()
+    breaker.before_call()  # sonda
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_cancelled()
+    breaker.before_call()
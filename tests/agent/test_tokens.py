@@ -0,0 +1,114 @@
+"""Conteo local de tokens y evento `usage` por paso del modelo."""
+
+import pytest
+
+pytest.importorskip("langgraph")
+pytest.importorskip("qgdiag_lib_arquitectura")
+
+from langchain_core.messages import AIMessageChunk, HumanMessage
+
+from app.agent.context import Context
+from app.agent.deadline import deadline_after
+from app.agent.graph import graph
+from app.agent.tokens import TOKENS_PER_MESSAGE, TOKENS_PER_REPLY, Tokenizer, heuristic_count, tokenizer
+from app.routes.agent import StreamUsage, _event_to_wire
+
+
+class _WordEncoding:
+    """Codificación falsa: un token por palabra; cuenta cuántas veces se codifica."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode_ordinary(self, text):
+        self.calls += 1
+        return text.split()
+
+
+class _UsageChat:
+    def __init__(self, tokens, usage=None):
+        self.tokens = tokens
+        self.usage = usage
+
+    async def astream(self, messages, config=None):
+        for t in self.tokens:
+            yield AIMessageChunk(content=t)
+        if self.usage:
+            yield AIMessageChunk(content="", usage_metadata=self.usage)
+
+
+def _loaded(cache_size=4096):
+    tk = Tokenizer(cache_size=cache_size)
+    tk._encoding = _WordEncoding()
+    return tk
+
+
+def test_falls_back_to_heuristic_until_loaded():
+    tk = Tokenizer()
+    assert not tk.exact
+    assert tk.count("abcdefgh") == heuristic_count("abcdefgh") == 2
+    assert tk.count("") == 0
+
+
+def test_counts_are_cached_per_text_with_lru_eviction():
+    tk = _loaded(cache_size=2)
+    long_a, long_b, long_c = ("a " * 40), ("b " * 40), ("c " * 40)
+
+    assert tk.count(long_a) == 40
+    assert tk.count(long_a) == 40
+    assert tk._encoding.calls == 1
+
+    tk.count(long_b)
+    tk.count(long_c)  # expulsa long_a
+    tk.count(long_a)
+    assert tk._encoding.calls == 4
+
+    # los textos cortos no pasan por la caché
+    tk.count("hola mundo")
+    assert len(tk._cache) == 2
+
+
+def test_count_messages_adds_chat_overhead():
+    tk = _loaded()
+    messages = [{"role": "system", "content": "eres útil"}, HumanMessage(content=[{"type": "text", "text": "hola"}])]
+    assert tk.count_messages(messages) == TOKENS_PER_REPLY + 2 * TOKENS_PER_MESSAGE + 2 + 1
+
+
+async def _usage_events(chat):
+    ctx = Context(engine_id="engine-test", chat_model=chat, deadline=deadline_after(10))
+    events = []
+    async for ev in graph.astream_events(
+        {"messages": [HumanMessage(content="hola")]}, context=ctx, recursion_limit=4
+    ):
+        wire = _event_to_wire(ev)
+        if wire is not None and wire["type"] == "usage":
+            events.append(wire["data"])
+    return events
+
+
+@pytest.mark.asyncio
+async def test_usage_event_prefers_provider_usage():
+    chat = _UsageChat(["Final Answer: ", "hola"], usage={"input_tokens": 120, "output_tokens": 7, "total_tokens": 127})
+
+    (step,) = await _usage_events(chat)
+
+    assert step["source"] == "provider"
+    assert (step["prompt_tokens"], step["completion_tokens"], step["total_tokens"]) == (120, 7, 127)
+    assert step["prompt_tokens_estimate"] > 0
+
+
+@pytest.mark.asyncio
+async def test_usage_event_falls_back_to_local_count():
+    chat = _UsageChat(["Final Answer: ", "hola"])
+
+    (step,) = await _usage_events(chat)
+
+    assert step["source"] == ("tokenizer" if tokenizer.exact else "estimate")
+    assert step["prompt_tokens"] == step["prompt_tokens_estimate"]
+    assert step["completion_tokens"] == tokenizer.count("Final Answer: hola")
+
+    total = StreamUsage()
+    total.add(step)
+    total.add(step)
+    assert total.as_dict()["total_tokens"] == 2 * step["total_tokens"]
+    assert total.as_dict()["estimated_steps"] == 2
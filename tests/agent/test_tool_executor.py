@@ -0,0 +1,142 @@
+"""Ejecución de tools en pools de hilos/procesos, timeouts y tiempos en los eventos."""
+
+import asyncio
+import os
+import time
+
+import pytest
+
+pytest.importorskip("langgraph")
+pytest.importorskip("qgdiag_lib_arquitectura")
+
+from langchain_core.messages import AIMessage
+from langgraph.graph import MessagesState, StateGraph
+from langgraph.prebuilt import ToolNode
+
+from app.agent.tool_executor import ToolExecutor, spec_of, tool_execution
+from app.routes import agent as agent_routes
+
+
+@tool_execution("thread", timeout_s=2)
+def blocking_sleep(seconds: float) -> str:
+    """Blocks the calling thread."""
+    time.sleep(seconds)
+    return "slept"
+
+
+@tool_execution("process")
+def worker_pid() -> int:
+    """Returns the pid of the process running the tool."""
+    return os.getpid()
+
+
+def _graph(executor, fns):
+    g = StateGraph(MessagesState)
+    g.add_node("tools", ToolNode(executor.as_tools(fns)))
+    g.add_edge("__start__", "tools")
+    return g.compile()
+
+
+def _calls(*calls):
+    return {
+        "messages": [
+            AIMessage(content="", tool_calls=[{"name": n, "args": a, "id": f"call-{i}"} for i, (n, a) in enumerate(calls)])
+        ]
+    }
+
+
+def test_default_execution_class_follows_the_function_kind():
+    async def coro():
+        pass
+
+    def sync():
+        pass
+
+    assert spec_of(coro).execution == "async"
+    assert spec_of(sync).execution == "thread"
+    with pytest.raises(ValueError):
+        tool_execution("gpu")
+
+
+@pytest.mark.asyncio
+async def test_blocking_tool_does_not_stall_the_event_loop():
+    executor = ToolExecutor(thread_workers=2)
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    try:
+        result = await _graph(executor, [blocking_sleep]).ainvoke(
+            _calls(("blocking_sleep", {"seconds": 0.3}), ("blocking_sleep", {"seconds": 0.3}))
+        )
+    finally:
+        task.cancel()
+        executor.shutdown()
+
+    assert [m.content for m in result["messages"][1:]] == ["slept", "slept"]
+    assert ticks >= 15  # el loop siguió atendiendo mientras las tools dormían
+
+
+@pytest.mark.asyncio
+async def test_process_tool_runs_in_a_worker_process():
+    executor = ToolExecutor(process_workers=1)
+    try:
+        result = await _graph(executor, [worker_pid]).ainvoke(_calls(("worker_pid", {})))
+    finally:
+        executor.shutdown()
+
+    pid = int(result["messages"][-1].content)
+    assert pid != os.getpid()
+
+
+@pytest.mark.asyncio
+async def test_timeout_returns_an_error_and_cancels_queued_calls():
+    executor = ToolExecutor(thread_workers=1, default_timeout_s=0.2)
+    ran = []
+
+    def record(tag: str) -> str:
+        """Records that it ran."""
+        ran.append(tag)
+        time.sleep(0.5)
+        return tag
+
+    try:
+        result = await _graph(executor, [record]).ainvoke(_calls(("record", {"tag": "a"}), ("record", {"tag": "b"})))
+        await asyncio.sleep(0.5)
+    finally:
+        executor.shutdown()
+
+    first, second = result["messages"][1:]
+    assert first.status == second.status == "error"
+    assert "timed out after 0.2s" in first.content
+    assert ran == ["a"]  # "b" seguía en cola y se retiró del pool
+
+
+@pytest.mark.asyncio
+async def test_stream_reports_execution_class_and_timings(monkeypatch):
+    executor = ToolExecutor(thread_workers=1)
+    monkeypatch.setattr(agent_routes, "tool_executor", executor)
+    wires = []
+    try:
+        async for ev in _graph(executor, [blocking_sleep]).astream_events(
+            _calls(("blocking_sleep", {"seconds": 0.2}), ("blocking_sleep", {"seconds": 0.2}))
+        ):
+            wire = agent_routes._event_to_wire(ev)
+            if wire is not None and wire["type"] in ("tool_start", "tool_timing", "tool_end"):
+                wires.append(wire)
+    finally:
+        executor.shutdown()
+
+    starts = [w for w in wires if w["type"] == "tool_start"]
+    timings = {w["run_id"]: w["data"] for w in wires if w["type"] == "tool_timing"}
+    ends = [w for w in wires if w["type"] == "tool_end"]
+    assert all(w["data"]["executor"]["execution"] == "thread" for w in starts)
+    assert {w["run_id"] for w in ends} == set(timings)
+    # con un solo hilo, una de las dos llamadas esperó en cola a la otra
+    assert max(t["queue_ms"] for t in timings.values()) >= 150
+    assert all(t["run_ms"] >= 190 for t in timings.values())
@@ -0,0 +1,95 @@
+"""Llamadas a tool repetidas en un turno: memo de resultados y paso final forzado."""
+
+import pytest
+
+pytest.importorskip("langgraph")
+pytest.importorskip("qgdiag_lib_arquitectura")
+
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+from langgraph.graph import StateGraph
+
+from app.agent import graph as graph_module
+from app.agent.context import Context
+from app.agent.state import State
+from app.agent.tool_loop import LOOP_ANSWER, MEMO_NOTE, repeated_calls, turn_memo
+from app.services.metrics import TOOL_CALL_REPEATS, TOOL_LOOP_FINALS, TOOL_MEMO_HITS
+
+
+def _call(sign, call_id):
+    return {"name": "get_horoscope", "args": {"sign": sign}, "id": call_id}
+
+
+def test_memo_keeps_successful_results_and_counts_repeats():
+    messages = [
+        HumanMessage(content="hola"),
+        AIMessage(content="", tool_calls=[_call("leo", "c1"), _call("aries", "c2")]),
+        ToolMessage(content="leo: ok", tool_call_id="c1"),
+        ToolMessage(content="boom", tool_call_id="c2", status="error"),
+        AIMessage(content="", tool_calls=[_call("leo", "c3")]),
+    ]
+
+    memo = turn_memo(messages)
+    assert list(memo.values()) == ["leo: ok"]  # los errores no se memorizan
+    assert [c["id"] for c in repeated_calls(messages)] == ["c3"]
+    assert [c["id"] for c in repeated_calls(messages, [_call("aries", "c4")])] == ["c3", "c4"]
+
+
+@pytest.mark.asyncio
+async def test_run_tools_answers_repeats_from_memo_and_runs_the_rest(monkeypatch):
+    executed = []
+    original = graph_module._tool_node.ainvoke
+
+    async def ainvoke(state, config=None, **kwargs):
+        executed.extend(c["id"] for c in state.messages[-1].tool_calls)
+        return await original(state, config, **kwargs)
+
+    monkeypatch.setattr(graph_module._tool_node, "ainvoke", ainvoke)
+    messages = [
+        HumanMessage(content="hola"),
+        AIMessage(content="", tool_calls=[_call("leo", "c1")]),
+        ToolMessage(content="leo: ok", tool_call_id="c1", name="get_horoscope"),
+        AIMessage(content="", tool_calls=[_call("leo", "c2"), _call("aries", "c3")]),
+    ]
+    # ToolNode necesita el runtime de un grafo
+    g = StateGraph(State, context_schema=Context)
+    g.add_node("tools", graph_module.run_tools)
+    g.add_edge("__start__", "tools")
+    hits = TOOL_MEMO_HITS.value("get_horoscope")
+
+    out = await g.compile().ainvoke({"messages": messages}, context=Context())
+
+    memo_msg, fresh = out["messages"][len(messages):]
+    assert executed == ["c3"]
+    assert memo_msg.tool_call_id == "c2" and memo_msg.content == f"leo: ok\n\n{MEMO_NOTE}"
+    assert fresh.tool_call_id == "c3" and fresh.content.startswith("aries:")
+    assert TOOL_MEMO_HITS.value("get_horoscope") == hits + 1
+
+
+@pytest.mark.asyncio
+async def test_looping_model_gets_a_forced_final_answer_step(override_settings):
+    override_settings(TOOL_LOOP_MAX_REPEATS=2)
+
+    class _LoopingChat:
+        def __init__(self):
+            self.prompts = []
+
+        async def astream(self, messages, config=None):
+            self.prompts.append(messages[0]["content"])
+            yield AIMessageChunk(content='Action: get_horoscope\nAction Input: {"sign": "leo"}')
+
+    chat = _LoopingChat()
+    repeats, finals = TOOL_CALL_REPEATS.value("engine-test"), TOOL_LOOP_FINALS.value("engine-test")
+
+    result = await graph_module.graph.ainvoke(
+        {"messages": [HumanMessage(content="horóscopo de leo")]},
+        context=Context(engine_id="engine-test", chat_model=chat),
+        recursion_limit=12,
+    )
+
+    final = result["messages"][-1]
+    assert final.content == LOOP_ANSWER and final.response_metadata["finish_reason"] == "tool_loop"
+    assert len(chat.prompts) == 4 and "Tools are no longer available" in chat.prompts[-1]
+    tool_results = [m.content for m in result["messages"] if isinstance(m, ToolMessage)]
+    assert MEMO_NOTE not in tool_results[0] and all(c.count(MEMO_NOTE) == 1 for c in tool_results[1:])
+    assert TOOL_CALL_REPEATS.value("engine-test") == repeats + 2
+    assert TOOL_LOOP_FINALS.value("engine-test") == finals + 1
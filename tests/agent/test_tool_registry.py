@@ -0,0 +1,172 @@
+"""Registro de tools: descubrimiento sin importar, carga diferida, subconjuntos por feature y selección por turno."""
+
+import sys
+import textwrap
+from importlib.metadata import EntryPoint
+
+import pytest
+
+pytest.importorskip("langgraph")
+pytest.importorskip("qgdiag_lib_arquitectura")
+
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langgraph.graph import MessagesState, StateGraph
+from langgraph.prebuilt import ToolNode
+
+from app.agent import graph as graph_module
+from app.agent import tool_registry as registry_module
+from app.agent.context import Context
+from app.agent.tool_executor import ToolExecutor
+from app.agent.tool_index import ToolIndex
+from app.agent.tool_registry import ToolRegistry
+
+
+@pytest.fixture
+def plugin_module(tmp_path, monkeypatch):
+    """Módulo de tools que aún no se ha importado."""
+    (tmp_path / "lazy_plugin_tools.py").write_text(textwrap.dedent('''
+        def add(a: int, b: int = 1) -> int:
+            """Adds two integers."""
+            return a + b
+
+        async def shout(text: str) -> str:
+            """Upper-cases the text."""
+            return text.upper()
+    '''))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield "lazy_plugin_tools"
+    sys.modules.pop("lazy_plugin_tools", None)
+
+
+def _registry(module, config=None, entry_points=(), monkeypatch=None):
+    if monkeypatch is not None:
+        monkeypatch.setattr(registry_module, "entry_points", lambda group: list(entry_points))
+    config = config if config is not None else {
+        "add": {"target": f"{module}:add", "description": "Adds numbers."},
+        "shout": {"target": f"{module}:shout", "description": "Shouts."},
+    }
+    return ToolRegistry.discover(config, group="test.tools", executor=ToolExecutor(thread_workers=1))
+
+
+async def _run(registry, *calls, feature=None):
+    g = StateGraph(MessagesState, context_schema=Context)
+    g.add_node("tools", ToolNode(registry.tools()))
+    g.add_edge("__start__", "tools")
+    msg = AIMessage(content="", tool_calls=[{"name": n, "args": a, "id": f"call-{i}"} for i, (n, a) in enumerate(calls)])
+    result = await g.compile().ainvoke({"messages": [msg]}, context=Context(feature=feature))
+    return result["messages"][1:]
+
+
+@pytest.mark.asyncio
+async def test_tools_are_imported_on_first_use(plugin_module, monkeypatch):
+    registry = _registry(plugin_module, monkeypatch=monkeypatch)
+
+    prompt = registry.forced_prompt(None)
+    assert "- add: Adds numbers." in prompt and "- shout: Shouts." in prompt
+    assert plugin_module not in sys.modules
+
+    (out,) = await _run(registry, ("add", {"a": 2}))
+    assert out.content == "3"
+    assert plugin_module in sys.modules
+    assert registry.loaded() == ["add"]
+
+
+def test_entry_points_are_discovered_and_config_overrides_them(plugin_module, monkeypatch):
+    eps = [
+        EntryPoint(name="add", value=f"{plugin_module}:add", group="test.tools"),
+        EntryPoint(name="shout", value=f"{plugin_module}:shout", group="test.tools"),
+    ]
+    registry = _registry(plugin_module, config={"add": {"description": "Suma."}}, entry_points=eps, monkeypatch=monkeypatch)
+
+    assert registry.snapshot()["add"]["source"] == "config"
+    assert registry.snapshot()["shout"]["source"] == "entry_point"
+    # sin descripción configurada, la del docstring (importa el módulo al construir el prompt)
+    prompt = registry.forced_prompt(None)
+    assert "- add: Suma." in prompt and "- shout: Upper-cases the text." in prompt
+
+
+@pytest.mark.asyncio
+async def test_each_feature_only_sees_its_tools(plugin_module, override_settings, monkeypatch):
+    registry = _registry(plugin_module, monkeypatch=monkeypatch)
+    override_settings(TOOL_FEATURES={"math": ["add"]})
+
+    assert "shout" not in registry.forced_prompt("math")
+    assert "shout" in registry.forced_prompt("other")
+
+    added, shouted = await _run(registry, ("add", {"a": 1, "b": 1}), ("shout", {"text": "hey"}), feature="math")
+    assert added.content == "2"
+    assert shouted.status == "error" and "not available" in shouted.content
+
+
+@pytest.mark.asyncio
+async def test_bad_arguments_and_broken_targets_become_tool_errors(plugin_module, monkeypatch):
+    config = {
+        "add": {"target": f"{plugin_module}:add", "description": "Adds numbers."},
+        "broken": {"target": "no_such_module_xyz:tool", "description": "Never loads."},
+    }
+    registry = _registry(plugin_module, config=config, monkeypatch=monkeypatch)
+
+    bad_args, broken = await _run(registry, ("add", {"a": "not a number"}), ("broken", {}))
+
+    assert bad_args.status == "error" and "invalid arguments" in bad_args.content
+    assert broken.status == "error" and "unavailable" in broken.content
+
+
+def test_index_ranks_by_relevance_across_accents_and_inflections():
+    index = ToolIndex()
+    index.add("listar_movimientos", "listar_movimientos Lista los movimientos de una cuenta")
+    index.add("bloquear_tarjeta", "bloquear_tarjeta Bloquea una tarjeta de crédito")
+    index.add("simular_hipoteca", "simular_hipoteca Simula la cuota de una hipoteca")
+    names = ["listar_movimientos", "bloquear_tarjeta", "simular_hipoteca"]
+
+    assert index.rank("Quiero BLOQUEAR mis tarjetas", names, 1) == ["bloquear_tarjeta"]
+    assert index.rank("¿qué cuota tendría la hipotéca?", names, 1) == ["simular_hipoteca"]
+    # sin coincidencias se conserva el orden del catálogo
+    assert index.rank("hola", names, 2) == names[:2]
+
+
+def test_select_offers_top_k_in_catalogue_order(override_settings):
+    config = {
+        "listar_movimientos": {"target": "x:a", "description": "Lista los movimientos de una cuenta."},
+        "bloquear_tarjeta": {"target": "x:b", "description": "Bloquea una tarjeta.", "keywords": ["robo", "perdida"]},
+        "simular_hipoteca": {"target": "x:c", "description": "Simula la cuota de una hipoteca."},
+    }
+    registry = ToolRegistry.discover(config, executor=ToolExecutor())
+    override_settings(TOOL_SELECTION_TOP_K=2)
+
+    offered, prompt = registry.select(None, "me han robado la cartera, ¿qué movimientos hay?")
+    assert offered == ["listar_movimientos", "bloquear_tarjeta"]
+    assert "simular_hipoteca" not in prompt
+
+    assert registry.select(None, "me han robado", full=True)[0] == list(config)
+    override_settings(TOOL_SELECTION_TOP_K=0)
+    assert registry.select(None, "me han robado")[0] == list(config)
+
+
+@pytest.mark.asyncio
+async def test_unoffered_tool_request_falls_back_to_full_catalogue(override_settings, monkeypatch):
+    config = {
+        "get_horoscope": {"target": "app.agent.tools:get_horoscope", "description": "Horoscope for a zodiac sign."},
+        "get_weather": {"target": "x:weather", "description": "Weather forecast for a city."},
+    }
+    monkeypatch.setattr(graph_module, "tool_registry", ToolRegistry.discover(config, executor=ToolExecutor()))
+    override_settings(TOOL_SELECTION_TOP_K=1)
+
+    class _Chat:
+        def __init__(self):
+            self.prompts = []
+            self.replies = ['Action: get_weather\nAction Input: {"city": "Leo"}', "Final Answer: ok"]
+
+        async def astream(self, messages, config=None):
+            self.prompts.append(messages[0]["content"])
+            yield AIMessageChunk(content=self.replies[len(self.prompts) - 1])
+
+    chat = _Chat()
+    ctx = Context(engine_id="engine-test", chat_model=chat)
+    result = await graph_module.graph.ainvoke(
+        {"messages": [HumanMessage(content="what does the horoscope say for leo?")]}, context=ctx, recursion_limit=6
+    )
+
+    assert result["messages"][-1].content == "ok"
+    assert "get_weather" not in chat.prompts[0]
+    assert "get_weather" in chat.prompts[1] and ctx.all_tools
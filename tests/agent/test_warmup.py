@@ -0,0 +1,58 @@
+"""Tests del warm-up de arranque (app.agent.warmup)."""
+
+import pytest
+
+pytest.importorskip("qgdiag_lib_arquitectura")
+
+from app.agent import warmup
+from app.agent.aicore_langchain import warm_connection_pool
+from app.agent.context import WARMUP_ENGINE_ID
+from app.agent.engine_router import engine_router
+from app.services.metrics import MODEL_TTFT
+from app.services.readiness import readiness
+
+
+@pytest.fixture(autouse=True)
+def _fresh_readiness():
+    readiness.reset()
+    yield
+    readiness.reset()
+
+
+@pytest.mark.asyncio
+async def test_synthetic_turn_runs_the_graph_without_network():
+    events = await warmup.synthetic_graph_turn()
+    assert events > 0
+
+
+@pytest.mark.asyncio
+async def test_synthetic_turn_skips_the_router_and_its_metrics(monkeypatch, override_settings):
+    monkeypatch.setenv("FEATURE", "chat")  # Context toma la feature del entorno
+    override_settings(ENGINE_POOLS={"chat": ["gpt-a", "gpt-b"]})
+    stats_before = dict(engine_router.stats)
+    ttft_before = MODEL_TTFT.count(WARMUP_ENGINE_ID)
+
+    assert await warmup.synthetic_graph_turn() > 0
+
+    assert engine_router.stats == stats_before
+    assert MODEL_TTFT.count(WARMUP_ENGINE_ID) == ttft_before
+    assert MODEL_TTFT.count("gpt-a") == MODEL_TTFT.count("gpt-b") == 0
+
+
+@pytest.mark.asyncio
+async def test_warm_connection_pool_opens_connections(fake_aicore):
+    _, base_url = fake_aicore()
+    assert await warm_connection_pool(base_url, connections=2, timeout=5) == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_steps_do_not_block_readiness(override_settings):
+    override_settings(AICORE_URL="http://127.0.0.1:9", WARMUP_STEP_TIMEOUT_S=2.0)  # nadie escucha
+    readiness.expect(*warmup.step_names())
+    assert not readiness.ready
+
+    await warmup.run_warmup()
+
+    snap = readiness.snapshot()
+    assert readiness.ready
+    assert {"warmup:aicore_pool", "warmup:chat_client", "warmup:graph_turn"} <= set(snap["done"])
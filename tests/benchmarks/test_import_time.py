@@ -0,0 +1,46 @@
+"""Tests del benchmark de tiempo de importación (benchmarks/import_time.py)."""
+
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SAMPLE = """\
+import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:       300 |        420 | encodings
+import time:        50 |         50 |     yaml.error
+import time:       200 |        250 |   yaml
+import time:      1000 |       1250 | app.settings
+"""
+
+
+@pytest.fixture(scope="module")
+def import_time():
+    spec = importlib.util.spec_from_file_location("import_time", os.path.join(ROOT, "benchmarks", "import_time.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_parse_importtime_output(import_time):
+    records = import_time.parse_importtime(SAMPLE)
+
+    assert [(r.name, r.depth) for r in records] == [
+        ("_io", 1), ("encodings", 0), ("yaml.error", 2), ("yaml", 1), ("app.settings", 0)
+    ]
+    assert import_time.total_us(records) == 420 + 1250
+    assert import_time.by_package(records) == {"app": 1000, "encodings": 300, "yaml": 250, "_io": 120}
+    assert import_time.deferred_violations(records, ("yaml", "langchain_tavily")) == ["yaml"]
+
+
+def test_service_import_does_not_load_deferred_modules(import_time):
+    pytest.importorskip("qgdiag_lib_arquitectura")
+
+    records = import_time.run_once()
+
+    assert import_time.deferred_violations(records) == []
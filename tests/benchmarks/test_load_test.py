@@ -0,0 +1,37 @@
+"""Smoke test del arnés de carga (benchmarks/load_test.py) a escala mínima."""
+
+import importlib.util
+import json
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("uvicorn")
+pytest.importorskip("qgdiag_lib_arquitectura")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _load_harness():
+    spec = importlib.util.spec_from_file_location("load_test", os.path.join(ROOT, "benchmarks", "load_test.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module  # las dataclasses del módulo lo necesitan
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_load_test_react_run_reports_percentiles(tmp_path):
+    harness = _load_harness()
+    out = tmp_path / "report.json"
+
+    code = harness.main([
+        "--endpoint", "run", "--requests", "4", "--concurrency", "2",
+        "--ttft", "0", "--tokens-per-s", "0", "--login-latency", "0", "--json", str(out),
+    ])
+
+    assert code == 0
+    (result,) = json.loads(out.read_text())["results"]
+    assert result["endpoint"] == "react-run"
+    assert result["ok"] == 4
+    assert set(result["latency_ms"]) == {"p50", "p95", "p99", "max"}
@@ -0,0 +1,53 @@
+"""Tests del runner de micro-benchmarks (benchmarks/micro.py)."""
+
+import importlib.util
+import json
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("qgdiag_lib_arquitectura")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="module")
+def micro():
+    spec = importlib.util.spec_from_file_location("micro", os.path.join(ROOT, "benchmarks", "micro.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_compare_flags_regressions_above_threshold_and_noise_floor(micro):
+    baseline = {"results": {"a@1B": {"seconds": 1e-3}, "b@1B": {"seconds": 1e-7}, "c@1B": {"skipped": "x"}}}
+    results = {"a@1B": {"seconds": 1.5e-3}, "b@1B": {"seconds": 5e-7}, "c@1B": {"seconds": 1.0}}
+
+    rows = {key: regression for key, _, _, _, regression in micro.compare(results, baseline, threshold=0.25)}
+
+    assert rows == {"a@1B": True, "b@1B": False}  # b está por debajo del suelo de ruido; c no tenía medida
+
+
+def test_run_case_skips_sizes_predicted_too_slow(micro):
+    def quadratic(n):
+        sum(range(n * n))
+
+    case = micro.Case("quadratic", quadratic, lambda n: n, sizes=(100, 200, 100000))
+    results = micro.run_case(case, case.sizes, max_call_s=0.5)
+
+    assert "seconds" in results["quadratic@100B"]
+    assert "seconds" in results["quadratic@200B"]
+    assert "skipped" in results["quadratic@100000B"]
+
+
+def test_save_then_compare_against_baseline(micro, tmp_path):
+    baseline = tmp_path / "micro.json"
+    args = ["--quick", "--filter", "to_langchain", "--baseline", str(baseline)]
+
+    assert micro.main(args + ["--save"]) == 0
+    saved = json.loads(baseline.read_text())
+    assert set(saved["results"]) == {"to_langchain/message@1024B", "to_langchain/message@16384B"}
+    # Contra sí misma no hay regresión salvo ruido extremo
+    assert micro.main(args + ["--threshold", "10"]) == 0
@@ -0,0 +1,84 @@
+"""Fixtures compartidas: servicios falsos locales (sin red) para los tests de integración."""
+
+import pytest
+
+
+@pytest.fixture
+def fake_aicore():
+    """
+    Factoría de AI Core falsos. Cada llamada arranca un servidor OpenAI-compatible
+    local con la configuración indicada y devuelve (FakeAICore, base_url).
+    """
+    pytest.importorskip("uvicorn")
+    from fakes.aicore import FakeAICore, FakeAICoreConfig
+    from fakes.server import LocalServer
+
+    servers = []
+
+    def _start(**config):
+        fake = FakeAICore(FakeAICoreConfig(**config))
+        srv = LocalServer(fake.app).start()
+        servers.append(srv)
+        return fake, srv.url
+
+    yield _start
+    for srv in servers:
+        srv.stop()
+
+
+@pytest.fixture
+def fake_history():
+    """Factoría de MS de historial falsos: devuelve (FakeHistoryMS, LocalServer)."""
+    pytest.importorskip("uvicorn")
+    from fakes.history import FakeHistoryConfig, FakeHistoryMS
+    from fakes.server import LocalServer
+
+    servers = []
+
+    def _start(**config):
+        fake = FakeHistoryMS(FakeHistoryConfig(**config))
+        srv = LocalServer(fake.app).start()
+        servers.append(srv)
+        return fake, srv
+
+    yield _start
+    for srv in servers:
+        srv.stop()
+
+
+@pytest.fixture
+def fake_guardrails():
+    """Factoría de MS de guardrails falsos: devuelve (FakeGuardrailsMS, LocalServer)."""
+    pytest.importorskip("uvicorn")
+    from fakes.guardrails import FakeGuardrailsConfig, FakeGuardrailsMS
+    from fakes.server import LocalServer
+
+    servers = []
+
+    def _start(**config):
+        fake = FakeGuardrailsMS(FakeGuardrailsConfig(**config))
+        srv = LocalServer(fake.app).start()
+        servers.append(srv)
+        return fake, srv
+
+    yield _start
+    for srv in servers:
+        srv.stop()
+
+
+@pytest.fixture
+def override_settings():
+    """
+    Publica una instantánea de settings con los valores indicados (override_settings(X=...));
+    al terminar el test se restaura la original. Los suscriptores reciben ambos cambios.
+    """
+    pytest.importorskip("qgdiag_lib_arquitectura")
+    from app.settings import settings_provider
+
+    original = settings_provider.current
+
+    def _override(**changes):
+        settings_provider.swap(settings_provider.current.model_copy(update=changes))
+
+    yield _override
+    settings_provider.swap(original)
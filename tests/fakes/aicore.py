@@ -0,0 +1,150 @@
+"""
+AI Core falso: endpoint OpenAI-compatible (/model/openai/chat/completions) con
+streaming SSE, latencia de primer token, tokens/s y errores configurables.
+"""
+
+import asyncio
+import json
+import re
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+_TOKEN_RE = re.compile(r"\S+\s*|\s+")
+
+
+@dataclass
+class FakeAICoreConfig:
+    # Respuestas del "modelo", en orden (la petición i recibe script[i % len(script)])
+    script: List[str] = field(default_factory=lambda: ["Final Answer: hola"])
+    # Si True, el índice del guion es el nº de resultados de tool tras el último
+    # mensaje de usuario (cada conversación sigue el guion aunque haya concurrencia)
+    script_by_turn: bool = False
+    ttft_s: float = 0.0
+    tokens_per_s: Optional[float] = None  # None = sin espera entre tokens
+    # Las primeras N peticiones fallan con `error_status`
+    fail_first: int = 0
+    error_status: int = 503
+    # Las primeras N peticiones (tras los fallos) se quedan colgadas sin emitir nada
+    stall_first: int = 0
+    stall_s: float = 30.0
+    # Latencia del login de AI Server (POST /login, ver FakeAIServerClient)
+    login_s: float = 0.0
+
+
+class FakeAICore:
+    def __init__(self, config: Optional[FakeAICoreConfig] = None):
+        self.config = config or FakeAICoreConfig()
+        self.requests = 0
+        self.requests_payloads: List[dict] = []
+        self.app = Starlette(
+            routes=[
+                Route("/model/openai/chat/completions", self.chat_completions, methods=["POST"]),
+                Route("/chat/completions", self.chat_completions, methods=["POST"]),
+                Route("/login", self.login, methods=["POST"]),
+            ]
+        )
+
+    async def login(self, request: Request):
+        await asyncio.sleep(self.config.login_s)
+        response = JSONResponse({"status": "ok"})
+        response.set_cookie("session", "fake-session")
+        return response
+
+    async def chat_completions(self, request: Request):
+        payload = await request.json()
+        n = self.requests
+        self.requests += 1
+        self.requests_payloads.append(payload)
+        cfg = self.config
+
+        if n < cfg.fail_first:
+            return JSONResponse({"error": {"message": "injected failure"}}, status_code=cfg.error_status)
+
+        stall = n < cfg.fail_first + cfg.stall_first
+        step = _tool_results_in_turn(payload) if cfg.script_by_turn else n
+        text = cfg.script[min(step, len(cfg.script) - 1) if cfg.script_by_turn else step % len(cfg.script)]
+        model = payload.get("model", "fake")
+        include_usage = bool((payload.get("stream_options") or {}).get("include_usage"))
+
+        if not payload.get("stream"):
+            await asyncio.sleep(cfg.stall_s if stall else cfg.ttft_s)
+            return JSONResponse(_completion(model, text))
+
+        async def events():
+            await asyncio.sleep(cfg.stall_s if stall else cfg.ttft_s)
+            tokens = _TOKEN_RE.findall(text)
+            for i, tok in enumerate(tokens):
+                if i and cfg.tokens_per_s:
+                    await asyncio.sleep(1.0 / cfg.tokens_per_s)
+                yield _sse(_chunk(model, {"role": "assistant", "content": tok} if i == 0 else {"content": tok}))
+            yield _sse(_chunk(model, {}, finish_reason="stop"))
+            if include_usage:
+                usage = {"prompt_tokens": _count_prompt(payload), "completion_tokens": len(tokens)}
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                yield _sse({**_chunk(model, {}), "choices": [], "usage": usage})
+            yield b"data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+
+class FakeAIServerClient:
+    """
+    Sustituto de ai_core.AIServerClient: mismo constructor y atributo `cookies`,
+    con un login HTTP síncrono contra el /login del AI Core falso.
+    """
+
+    def __init__(self, access_key: str, secret_key: str, base: str):
+        response = httpx.post(f"{base}/login", json={"access_key": access_key, "secret_key": secret_key})
+        response.raise_for_status()
+        self.cookies = response.cookies
+
+
+async def fake_retrieve_credentials(headers, latency_s: float = 0.0):
+    """Sustituto de retrieve_credentials: devuelve claves fijas tras `latency_s`."""
+    await asyncio.sleep(latency_s)
+    return "fake-access-key", "fake-secret-key"
+
+
+def _tool_results_in_turn(payload: dict) -> int:
+    count = 0
+    for m in payload.get("messages", []):
+        if m.get("role") == "user":
+            count = 0
+        elif m.get("role") == "tool":
+            count += 1
+    return count
+
+
+def _count_prompt(payload: dict) -> int:
+    return sum(len(str(m.get("content", "")).split()) for m in payload.get("messages", []))
+
+
+def _chunk(model: str, delta: dict, finish_reason: Optional[str] = None) -> dict:
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+def _completion(model: str, text: str) -> dict:
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+    }
+
+
+def _sse(obj: dict) -> bytes:
+    return f"data: {json.dumps(obj)}\n\n".encode("utf-8")
@@ -0,0 +1,44 @@
+"""
+MS de guardrails falso: bloquea los textos que contienen alguno de los términos
+configurados, con latencia configurable, y registra cada comprobación recibida.
+"""
+
+import asyncio
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+ENDPOINT = "/qgdiag-ms-guardrails/check"
+
+
+@dataclass
+class FakeGuardrailsConfig:
+    blocked_terms: Tuple[str, ...] = ("prohibido",)
+    latency_s: float = 0.0
+    status_code: int = 200  # != 200 simula el MS caído
+
+
+@dataclass
+class FakeGuardrailsMS:
+    config: FakeGuardrailsConfig = field(default_factory=FakeGuardrailsConfig)
+    checks: List[Tuple[str, str]] = field(default_factory=list)  # (stage, text)
+
+    def __post_init__(self):
+        self.app = Starlette(routes=[Route(ENDPOINT, self.check, methods=["POST"])])
+
+    async def check(self, request: Request):
+        body = await request.json()
+        self.checks.append((body["stage"], body["text"]))
+        cfg = self.config
+        if cfg.latency_s:
+            await asyncio.sleep(cfg.latency_s)
+        if cfg.status_code != 200:
+            return JSONResponse({"detail": "unavailable"}, status_code=cfg.status_code)
+        hits = [t for t in cfg.blocked_terms if t in body["text"].lower()]
+        return JSONResponse(
+            {"allowed": not hits, "reason": f"contains '{hits[0]}'" if hits else None, "categories": hits}
+        )
@@ -0,0 +1,50 @@
+"""
+MS de historial falso: sirve get-user-messages-by-conversation-id con un número
+de mensajes, tamaño de texto y latencia configurables.
+"""
+
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+ENDPOINT = "/qgdiag-ms-historial-de-conversacion/get-user-messages-by-conversation-id"
+
+
+@dataclass
+class FakeHistoryConfig:
+    messages: int = 10  # mensajes por conversación (alternando INPUT / RESPONSE)
+    message_chars: int = 200
+    latency_s: float = 0.0
+
+
+class FakeHistoryMS:
+    def __init__(self, config: FakeHistoryConfig = None):
+        self.config = config or FakeHistoryConfig()
+        self.requests = 0
+        self.app = Starlette(routes=[Route(ENDPOINT, self.get_messages, methods=["GET"])])
+
+    async def get_messages(self, request: Request):
+        self.requests += 1
+        cfg = self.config
+        if cfg.latency_s:
+            await asyncio.sleep(cfg.latency_s)
+        conversation_id = request.query_params.get("conversation_id", "conv")
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        text = ("lorem ipsum " * (cfg.message_chars // 12 + 1))[: cfg.message_chars]
+        return JSONResponse(
+            [
+                {
+                    "message_id": f"{conversation_id}-{i}",
+                    "message_type": "INPUT" if i % 2 == 0 else "RESPONSE",
+                    "date_created": (start + timedelta(seconds=i)).isoformat(),
+                    "insight_id": conversation_id,
+                    "message_text": text,
+                }
+                for i in range(cfg.messages)
+            ]
+        )
@@ -0,0 +1,50 @@
+"""Arranque de apps ASGI falsas en un uvicorn local (hilo aparte, puerto efímero)."""
+
+import asyncio
+import socket
+import threading
+import time
+
+import uvicorn
+
+
+class LocalServer:
+    """
+    Sirve `app` en 127.0.0.1 en un hilo propio. Uso:
+
+        with LocalServer(app) as srv:
+            httpx.get(srv.url + "/...")
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(("127.0.0.1", 0))
+        self.port = self._sock.getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        config = uvicorn.Config(app, log_level="warning", lifespan="off")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        asyncio.run(self._server.serve(sockets=[self._sock]))
+
+    def start(self):
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Fake server did not start")
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
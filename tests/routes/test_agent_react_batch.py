@@ -0,0 +1,67 @@
+"""Tests del endpoint POST /agent/react-batch."""
+
+import json
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("qgdiag_lib_arquitectura")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessage
+
+from app.services.auth import authenticated_headers
+from app.routes import agent as agent_router
+
+PARAMS = {"feature": "f", "model_id": "m", "version": "1"}
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.dependency_overrides[authenticated_headers] = lambda: {"Token": "t", "IAG-App-Id": "app"}
+    app.include_router(agent_router.router)
+    return TestClient(app)
+
+
+async def _fake_ainvoke(input_state, *, context, **kwargs):
+    text = input_state["messages"][0].content
+    if text == "boom":
+        raise RuntimeError("fallo del modelo")
+    return {"messages": [*input_state["messages"], AIMessage(content=f"eco: {text}")]}
+
+
+def test_react_batch_streams_per_item_results_and_errors(client):
+    session = object()
+    with patch.object(agent_router, "graph") as mock_graph, patch.object(
+        agent_router, "open_aicore_session", AsyncMock(return_value=session)
+    ) as mock_open:
+        mock_graph.ainvoke = AsyncMock(side_effect=_fake_ainvoke)
+        resp = client.post(
+            "/agent/react-batch",
+            params=PARAMS,
+            json={"items": [{"message": "a"}, {"message": "boom"}, {"message": "c"}], "concurrency": 2},
+        )
+
+    assert resp.status_code == 200
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    results = {l["data"]["index"]: l for l in lines if l["type"] in ("item_result", "item_error")}
+
+    assert results[0]["data"]["answer"] == "eco: a"
+    assert results[1]["type"] == "item_error"
+    assert "fallo del modelo" in results[1]["data"]["message"]
+    assert results[2]["data"]["answer"] == "eco: c"
+    assert lines[-1] == {**lines[-1], "type": "batch_end", "data": {"ok": 2, "errors": 1}}
+
+    # Un único login compartido por todo el lote
+    mock_open.assert_awaited_once()
+    contexts = [c.kwargs["context"] for c in mock_graph.ainvoke.call_args_list]
+    assert all(ctx.aicore_session is session for ctx in contexts)
+
+
+def test_react_batch_rejects_oversized_batches(client, override_settings):
+    override_settings(BATCH_MAX_ITEMS=1)
+    resp = client.post("/agent/react-batch", params=PARAMS, json={"items": [{"message": "a"}, {"message": "b"}]})
+    assert resp.status_code == 413
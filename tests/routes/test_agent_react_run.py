@@ -0,0 +1,113 @@
+"""Tests del endpoint POST /agent/react-run (response_mode)."""
+
+import json
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("qgdiag_lib_arquitectura")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessage, HumanMessage
+
+from app.agent.history_record import HistoryRecord
+from app.services.auth import authenticated_headers
+from app.routes import agent as agent_router
+
+PARAMS = {"feature": "f", "model_id": "m", "version": "1"}
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.dependency_overrides[authenticated_headers] = lambda: {"Token": "t", "IAG-App-Id": "app"}
+    app.include_router(agent_router.router)
+    return TestClient(app)
+
+
+def _fake_ainvoke(input_state, **kwargs):
+    user = input_state["messages"][0]
+    history = (HistoryRecord("human", "antes", "h1", 1.0), HistoryRecord("ai", "vale", "h2", 2.0))
+    return {"messages": [user, AIMessage(content="hola!", id="a1")], "history": history}
+
+
+@pytest.mark.parametrize(
+    "mode, expected",
+    [(None, None), ("answer", None), ("turn", 2), ("full", 4)],
+)
+def test_react_run_response_modes(client, mode, expected):
+    params = dict(PARAMS)
+    if mode:
+        params["response_mode"] = mode
+    with patch.object(agent_router, "graph") as mock_graph:
+        mock_graph.ainvoke = AsyncMock(side_effect=_fake_ainvoke)
+        resp = client.post("/agent/react-run", params=params, json={"message": "qué tal"})
+
+    assert resp.status_code == 200
+    data = json.loads(resp.content)["data"]
+    assert data["answer"] == "hola!"
+    if expected is None:
+        assert "state" not in data
+    else:
+        msgs = data["state"]["messages"]
+        assert len(msgs) == expected
+        assert msgs[-1]["content"] == "hola!"
+        if mode == "full":
+            assert msgs[0]["type"] == "human" and msgs[0]["response_metadata"]["message_id"] == "h1"
+
+
+def test_turn_mode_without_the_user_message_id_keeps_only_the_last_turn(client):
+    def rewritten(input_state, **kwargs):
+        old = [HumanMessage(content="antes", id="h1"), AIMessage(content="vale", id="a0")]
+        return {"messages": [*old, HumanMessage(content="qué tal", id="otro"), AIMessage(content="hola!", id="a1")]}
+
+    with patch.object(agent_router, "graph") as mock_graph:
+        mock_graph.ainvoke = AsyncMock(side_effect=rewritten)
+        resp = client.post("/agent/react-run", params={**PARAMS, "response_mode": "turn"}, json={"message": "qué tal"})
+
+    msgs = json.loads(resp.content)["data"]["state"]["messages"]
+    assert [m["content"] for m in msgs] == ["qué tal", "hola!"]
+
+
+def test_react_run_rejects_unknown_response_mode(client):
+    resp = client.post(
+        "/agent/react-run", params={**PARAMS, "response_mode": "everything"}, json={"message": "x"}
+    )
+    assert resp.status_code == 422
+
+
+@pytest.mark.parametrize(
+    "path, params, body",
+    [
+        ("/agent/react-run", {**PARAMS, "response_mode": "everything"}, {"message": "x"}),
+        ("/agent/react-run", PARAMS, {"no_message": 1}),
+        ("/agent/react-stream", PARAMS, {"no_message": 1}),
+    ],
+)
+def test_rejected_request_releases_its_admission_ticket(client, path, params, body):
+    from app.services.admission import admission
+
+    before = admission.snapshot()["active"]
+    for _ in range(3):
+        assert client.post(path, params=params, json=body).status_code == 422
+    assert admission.snapshot()["active"] == before
+
+
+def test_stream_holds_its_ticket_until_the_stream_ends(client):
+    from app.services.admission import admission
+
+    seen = []
+
+    async def astream_events(*args, **kwargs):
+        seen.append(admission.snapshot()["active"])
+        yield {"event": "on_chain_start", "name": "call_model", "run_id": "r", "data": {}}
+
+    before = admission.snapshot()["active"]
+    with patch.object(agent_router, "graph") as mock_graph:
+        mock_graph.astream_events = astream_events
+        resp = client.post("/agent/react-stream", params=PARAMS, json={"message": "hola"})
+
+    assert resp.status_code == 200
+    assert seen == [before + 1] and admission.snapshot()["active"] == before
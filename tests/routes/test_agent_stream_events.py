@@ -85,3 +85,14 @@ def test_event_to_wire_chat_model_end_exposes_tool_calls():
 
     tool_calls = payload.get("tool_calls")
     assert tool_calls and tool_calls[0]["function"]["name"] == "lookup"
+
+
+def test_event_to_wire_maps_engine_route_custom_event():
+    decision = {"engine_id": "e2", "pool": ["e1", "e2"], "reason": "pool", "scores": {"e1": 0.4, "e2": None}}
+    event = {"event": "on_custom_event", "name": "engine_route", "run_id": "run-789", "data": decision}
+
+    wire_event = _event_to_wire(event)
+
+    assert wire_event["type"] == "routing"
+    assert wire_event["data"]["engine_id"] == "e2"
+    json.dumps(wire_event)
@@ -0,0 +1,103 @@
+"""Tests para app.services.admission"""
+
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("qgdiag_lib_arquitectura")
+
+from app.services.admission import AdmissionController, AdmissionRejected, parse_weights
+
+
+def _controller(**overrides):
+    cfg = dict(max_concurrency=2, max_per_tenant=2, max_queue=10, max_wait_s=5.0)
+    cfg.update(overrides)
+    return AdmissionController(**cfg)
+
+
+@pytest.mark.asyncio
+class TestAdmissionController:
+
+    async def test_waits_for_global_slot(self):
+        ctl = _controller(max_concurrency=1)
+        first = await ctl.acquire("a")
+        waiting = asyncio.create_task(ctl.acquire("b"))
+        await asyncio.sleep(0)
+        assert ctl.snapshot()["queued"] == 1
+
+        first.release()
+        second = await asyncio.wait_for(waiting, 1)
+        assert second.tenant == "b"
+        assert ctl.snapshot()["active"] == 1
+        second.release()
+        second.release()  # idempotente
+        assert ctl.snapshot()["active"] == 0
+
+    async def test_per_tenant_cap_lets_other_tenants_through(self):
+        ctl = _controller(max_concurrency=3, max_per_tenant=1)
+        await ctl.acquire("a")
+        blocked = asyncio.create_task(ctl.acquire("a"))
+        await asyncio.sleep(0)
+        other = await asyncio.wait_for(ctl.acquire("b"), 0.5)
+
+        assert not blocked.done()
+        assert other.tenant == "b"
+        blocked.cancel()
+
+    async def test_weighted_fair_order_between_tenants(self):
+        ctl = _controller(max_concurrency=1, max_per_tenant=10, max_wait_s=60, weights={"heavy": 3.0})
+        holder = await ctl.acquire("warmup")
+        order = []
+
+        async def run(tenant):
+            async with await ctl.acquire(tenant):
+                order.append(tenant)
+
+        tasks = [asyncio.create_task(run("light")) for _ in range(4)]
+        tasks += [asyncio.create_task(run("heavy")) for _ in range(4)]
+        await asyncio.sleep(0)
+        holder.release()
+        await asyncio.wait_for(asyncio.gather(*tasks), 1)
+
+        # Con peso 3, 'heavy' consigue ~3 huecos por cada uno de 'light' mientras ambos esperan.
+        assert order[:4].count("heavy") == 3
+
+    async def test_queue_full_is_rejected_with_429(self):
+        ctl = _controller(max_concurrency=1, max_queue=1)
+        await ctl.acquire("a")
+        queued = asyncio.create_task(ctl.acquire("a"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as exc:
+            await ctl.acquire("b")
+        assert exc.value.status_code == 429
+        assert int(exc.value.headers["Retry-After"]) >= 1
+        queued.cancel()
+
+    async def test_wait_timeout_is_shed_with_503(self):
+        ctl = _controller(max_concurrency=1, max_wait_s=0.05)
+        ctl._service_time_s = 0.01
+        await ctl.acquire("a")
+
+        with pytest.raises(AdmissionRejected) as exc:
+            await ctl.acquire("b")
+        assert exc.value.status_code == 503
+        snap = ctl.snapshot()
+        assert snap["queued"] == 0
+        assert snap["rejected"]["deadline"] == 1
+
+    async def test_expired_deadline_is_rejected_without_queueing(self):
+        ctl = _controller(max_concurrency=1)
+        await ctl.acquire("a")
+
+        with pytest.raises(AdmissionRejected) as exc:
+            await ctl.acquire("b", deadline=time.monotonic() - 1)
+        assert exc.value.status_code == 503
+        assert ctl.snapshot()["queued"] == 0
+
+
+def test_parse_weights():
+    assert parse_weights("app-a=2, app-b=0.5,,bad") == {"app-a": 2.0, "app-b": 0.5}
+    assert parse_weights("") == {}
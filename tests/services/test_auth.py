@@ -0,0 +1,93 @@
+"""Tests de la dependencia de autenticación con caché de tokens (app.services.auth)."""
+
+import base64
+import json
+import time
+
+import pytest
+
+pytest.importorskip("qgdiag_lib_arquitectura")
+pytest.importorskip("fastapi")
+
+from starlette.requests import Request
+
+from app.services import auth
+from app.services.auth import TokenCache, peek_jwt
+from app.services.jwks import JwksManager
+
+
+def make_jwt(kid="k1", exp_in=3600, **claims):
+    def enc(obj):
+        return base64.urlsafe_b64encode(json.dumps(obj).encode()).rstrip(b"=").decode()
+    payload = dict(claims, sub="user")
+    if exp_in is not None:
+        payload["exp"] = int(time.time() + exp_in)
+    return f"{enc({'alg': 'RS256', 'kid': kid})}.{enc(payload)}.signature"
+
+
+def make_request(token, app_id="app"):
+    headers = [(b"authorization", f"Bearer {token}".encode()), (b"iag-app-id", app_id.encode())]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers, "query_string": b""})
+
+
+@pytest.fixture
+def verifier(monkeypatch):
+    calls = []
+
+    async def fake_verify(request):
+        calls.append(request.headers.get("Authorization"))
+        return {"Token": request.headers["Authorization"][7:], "IAG-App-Id": request.headers["IAG-App-Id"]}
+
+    idp_kids = ["k1"]
+
+    async def fetch():
+        return {kid: [{"kty": "RSA"}] for kid in idp_kids}
+
+    manager = JwksManager(fetch, min_refresh_interval_s=0)
+    cache = TokenCache()
+    manager.subscribe(lambda jwks, keys: cache.retain_kids(keys))
+    monkeypatch.setattr(auth, "get_authenticated_headers", fake_verify)
+    monkeypatch.setattr(auth, "jwks_manager", manager)
+    monkeypatch.setattr(auth, "token_cache", cache)
+    return calls, manager, cache, idp_kids
+
+
+def test_peek_jwt_reads_header_and_claims_without_verifying():
+    header, claims = peek_jwt(make_jwt(kid="abc", exp_in=None, scope="x"))
+    assert header["kid"] == "abc" and claims == {"scope": "x", "sub": "user"}
+    assert peek_jwt("not-a-jwt") is None and peek_jwt("a.b.c") is None
+
+
+@pytest.mark.asyncio
+async def test_verified_token_is_reused_until_it_expires(verifier):
+    calls, manager, cache, _ = verifier
+    await manager.refresh()
+    token = make_jwt()
+
+    first = await auth.authenticated_headers(make_request(token))
+    second = await auth.authenticated_headers(make_request(token))
+    await auth.authenticated_headers(make_request(token, app_id="other"))  # otra app: otra entrada
+
+    assert first == second == {"Token": token, "IAG-App-Id": "app"}
+    assert len(calls) == 2
+
+    await auth.authenticated_headers(make_request(make_jwt(exp_in=2)))  # expira dentro del margen
+    await auth.authenticated_headers(make_request(make_jwt(exp_in=None)))  # sin exp
+    assert len(cache) == 2
+
+
+@pytest.mark.asyncio
+async def test_unknown_kid_reloads_jwks_before_verifying_and_rotation_purges_cache(verifier):
+    calls, manager, cache, idp_kids = verifier
+    await manager.refresh()
+    old = make_jwt(kid="k1")
+    await auth.authenticated_headers(make_request(old))
+    assert len(cache) == 1
+
+    idp_kids[:] = ["k2"]  # rotación: k1 retirada, k2 nueva
+    await auth.authenticated_headers(make_request(make_jwt(kid="k2")))
+
+    assert manager.has_kid("k2") and manager.version == 2
+    assert len(cache) == 1  # la entrada firmada con k1 se descartó
+    await auth.authenticated_headers(make_request(old))
+    assert len(calls) == 3  # el token con k1 vuelve a verificarse
@@ -0,0 +1,186 @@
+"""Caché compartida: backends en memoria y SQLite, niveles y su uso desde los clientes."""
+
+import sqlite3
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("qgdiag_lib_arquitectura")
+
+from app.agent import aicore_langchain
+from app.agent.ms_clients.prompt_client import PromptClient
+from app.schemas.prompt_schema import PromptWire
+from app.services import cache as cache_module
+from app.services.cache import CacheNamespace, MemoryCache, SQLiteCache, TieredCache
+
+
+def test_memory_cache_expires_and_evicts_least_recently_used(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    cache = MemoryCache(max_entries=2)
+
+    cache.set("a", b"1", 10)
+    cache.set("b", b"2", 10)
+    assert cache.get("a") == b"1"  # "a" pasa a ser la más reciente
+    cache.set("c", b"3", 10)
+    assert cache.get("b") is None and cache.get("c") == b"3"
+
+    now[0] += 11
+    assert cache.get("a") is None and len(cache) == 1
+
+
+def test_sqlite_cache_is_shared_between_connections(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    writer, reader = SQLiteCache(path), SQLiteCache(path)
+
+    writer.set("k", b"value", 60)
+    assert reader.get("k") == b"value"
+
+    reader.delete("k")
+    assert writer.get("k") is None
+    assert (tmp_path / "cache.sqlite").stat().st_mode & 0o777 == 0o600
+    writer.close()
+    reader.close()
+
+
+def test_sqlite_prune_keeps_at_most_max_entries(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite"), max_entries=3, prune_every=5)
+    for i in range(5):
+        cache.set(f"k{i}", b"x", 60 + i)
+
+    assert cache.stats()["entries"] == 3
+    assert cache.get("k0") is None and cache.get("k4") == b"x"  # se descartan las que antes caducan
+
+
+def test_backend_errors_count_as_misses(tmp_path, monkeypatch):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite"))
+
+    def broken():
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(cache, "_connection", broken)
+    cache.set("k", b"v", 60)
+    assert cache.get("k") is None
+
+
+def test_tiered_cache_reads_through_and_serves_hot_keys_locally(tmp_path):
+    shared = SQLiteCache(str(tmp_path / "cache.sqlite"))
+    other_worker = TieredCache(MemoryCache(), SQLiteCache(shared.path), local_ttl_s=5)
+    shared.set("k", b"v", 60)
+
+    assert other_worker.get("k") == b"v"
+    shared.delete("k")
+    assert other_worker.get("k") == b"v"  # del L1 hasta que caduque (local_ttl_s)
+    assert other_worker.shared.get("k") is None
+
+
+def test_namespace_round_trips_json_and_is_disabled_without_ttl():
+    backend = MemoryCache()
+    ns = CacheNamespace("ns", 60, backend)
+
+    ns.set("k", {"a": [1, 2]})
+    assert ns.get("k") == {"a": [1, 2]}
+    assert backend.get("ns:k") is not None
+
+    off = CacheNamespace("off", 0, backend)
+    off.set("k", 1)
+    assert off.get("k") is None
+
+
+@pytest.mark.asyncio
+async def test_aicore_session_is_reused_until_invalidated(monkeypatch):
+    calls = []
+
+    async def retrieve_credentials(headers):
+        calls.append("credentials")
+        return "ak", "sk"
+
+    class FakeServer:
+        def __init__(self, access_key, secret_key, base):
+            calls.append("login")
+            self.cookies = {"session": "abc"}
+
+    monkeypatch.setattr(aicore_langchain, "retrieve_credentials", retrieve_credentials)
+    monkeypatch.setattr(aicore_langchain, "ai_core", SimpleNamespace(AIServerClient=FakeServer))
+    monkeypatch.setattr(aicore_langchain, "_SESSIONS", CacheNamespace("aicore_session", 60, MemoryCache()))
+    monkeypatch.setattr(aicore_langchain, "_SECRETS", CacheNamespace("aicore_secret", 60, MemoryCache()))
+    headers = {"Authorization": "Bearer t"}
+
+    first = await aicore_langchain.open_aicore_session(headers=headers, base_url="https://aicore")
+    second = await aicore_langchain.open_aicore_session(headers=headers, base_url="https://aicore")
+    assert calls == ["credentials", "login"]
+    assert second.cookies == first.cookies == {"session": "abc"}
+
+    await aicore_langchain.invalidate_aicore_session(headers, "https://aicore")
+    await aicore_langchain.open_aicore_session(headers=headers, base_url="https://aicore")
+    assert calls == ["credentials", "login"] * 2
+
+
+@pytest.mark.asyncio
+async def test_shared_aicore_session_never_holds_the_secret_key(tmp_path, monkeypatch):
+    calls = []
+
+    async def retrieve_credentials(headers):
+        calls.append("credentials")
+        return "ak", "sk-secreta"
+
+    class FakeServer:
+        def __init__(self, access_key, secret_key, base):
+            calls.append("login")
+            self.cookies = {"session": "abc"}
+
+    shared = SQLiteCache(str(tmp_path / "cache.sqlite"))
+    monkeypatch.setattr(aicore_langchain, "retrieve_credentials", retrieve_credentials)
+    monkeypatch.setattr(aicore_langchain, "ai_core", SimpleNamespace(AIServerClient=FakeServer))
+    monkeypatch.setattr(aicore_langchain, "_SESSIONS", CacheNamespace("aicore_session", 60, shared))
+    monkeypatch.setattr(aicore_langchain, "_SECRETS", CacheNamespace("aicore_secret", 60, MemoryCache()))
+    headers = {"Authorization": "Bearer t"}
+
+    await aicore_langchain.open_aicore_session(headers=headers, base_url="https://aicore")
+    with sqlite3.connect(shared.path) as conn:
+        stored = b"".join(value for (value,) in conn.execute("SELECT value FROM cache_entries"))
+    assert b"abc" in stored and b"sk-secreta" not in stored
+
+    # Otro worker: sin la secret key en memoria pide credenciales, pero no repite el login
+    monkeypatch.setattr(aicore_langchain, "_SECRETS", CacheNamespace("aicore_secret", 60, MemoryCache()))
+    session = await aicore_langchain.open_aicore_session(headers=headers, base_url="https://aicore")
+    assert calls == ["credentials", "login", "credentials"]
+    assert session.secret_key == "sk-secreta" and session.cookies == {"session": "abc"}
+    shared.close()
+
+
+@pytest.mark.asyncio
+async def test_async_namespace_runs_sqlite_off_the_event_loop(tmp_path, monkeypatch):
+    shared = SQLiteCache(str(tmp_path / "cache.sqlite"))
+    ns = CacheNamespace("ns", 60, TieredCache(MemoryCache(), shared, local_ttl_s=5))
+    threads = []
+    get = shared.get
+    monkeypatch.setattr(shared, "get", lambda key: threads.append(threading.current_thread()) or get(key))
+
+    await ns.aset("k", {"a": 1})
+    shared.set("ns:otra", b"[2]", 60)  # escrito por otro worker
+
+    assert await ns.aget("k") == {"a": 1} and threads == []  # del L1, sin tocar SQLite
+    assert await ns.aget("otra") == [2]
+    assert threads and threads[0] is not threading.main_thread()
+    shared.close()
+
+
+@pytest.mark.asyncio
+async def test_prompt_downloaded_by_one_worker_is_adopted_by_another():
+    calls = []
+
+    async def fetch(feature, name, etag):
+        calls.append(feature)
+        return PromptWire(feature=feature, name=name, prompt_text="Hola {feature}", version="v1"), "v1"
+
+    shared = MemoryCache()
+    first = PromptClient(fetch, ttl_s=60, shared=CacheNamespace("prompts", 60, shared))
+    second = PromptClient(fetch, ttl_s=60, shared=CacheNamespace("prompts", 60, shared))
+
+    await first.preload(["chat"])
+    await second.preload(["chat"])
+
+    assert calls == ["chat"]
+    assert second.get("chat").version == "v1" and second.get("chat").render(feature="chat") == "Hola chat"
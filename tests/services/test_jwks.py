@@ -0,0 +1,82 @@
+"""Tests del gestor de JWKS (app.services.jwks)."""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("qgdiag_lib_arquitectura")
+
+from app.services.jwks import JwksManager, index_jwks
+
+
+class FakeIdp:
+    def __init__(self, *kids, latency_s=0.01):
+        self.kids = list(kids)
+        self.latency_s = latency_s
+        self.calls = 0
+
+    async def fetch(self):
+        self.calls += 1
+        await asyncio.sleep(self.latency_s)
+        return {kid: [{"kty": "RSA", "kid": kid}] for kid in self.kids}
+
+
+def test_index_accepts_library_and_rfc7517_formats():
+    assert index_jwks({"a": [{"kty": "RSA"}]}) == {"a": [{"kty": "RSA"}]}
+    rfc = {"keys": [{"kid": "a", "kty": "RSA"}, {"kid": "b", "kty": "EC"}]}
+    assert sorted(index_jwks(rfc)) == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_unknown_kid_refresh_is_single_flight():
+    idp = FakeIdp("old")
+    manager = JwksManager(idp.fetch, min_refresh_interval_s=0)
+    await manager.refresh("startup")
+    idp.kids.append("rotated")
+
+    results = await asyncio.gather(*(manager.ensure_kid("rotated") for _ in range(50)))
+
+    assert all(results)
+    assert idp.calls == 2  # arranque + una sola recarga compartida
+
+
+@pytest.mark.asyncio
+async def test_unknown_kid_is_negatively_cached_and_rate_limited():
+    idp = FakeIdp("a")
+    manager = JwksManager(idp.fetch, min_refresh_interval_s=0, negative_ttl_s=60)
+    await manager.refresh()
+
+    assert await manager.ensure_kid("bogus") is False
+    assert await manager.ensure_kid("bogus") is False  # caché negativa: sin recarga
+    assert idp.calls == 2
+
+    limited = JwksManager(idp.fetch, min_refresh_interval_s=60)
+    await limited.refresh()
+    assert await limited.ensure_kid("x") is False
+    assert await limited.ensure_kid("y") is False  # otro kid, pero dentro del intervalo mínimo
+    assert idp.calls == 4
+
+
+@pytest.mark.asyncio
+async def test_background_refresh_notifies_subscribers_and_survives_errors():
+    idp = FakeIdp("a", latency_s=0)
+    manager = JwksManager(idp.fetch, refresh_s=0.02, jitter=0.5, min_refresh_interval_s=0.01)
+    seen = []
+    manager.subscribe(lambda jwks, keys: seen.append(sorted(keys)))
+    fetch_ok = idp.fetch
+
+    async def flaky():
+        if idp.calls == 1:
+            idp.calls += 1
+            raise ConnectionError("idp down")
+        return await fetch_ok()
+
+    manager._fetch = flaky
+    await manager.refresh()
+    idp.kids = ["b"]
+    manager.start()
+    await asyncio.sleep(0.2)
+    await manager.stop()
+
+    assert seen[0] == ["a"] and seen[-1] == ["b"]
+    assert all(0.01 <= manager.next_delay() <= 0.03 for _ in range(100))
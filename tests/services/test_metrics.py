@@ -0,0 +1,53 @@
+import time
+
+from app.services.metrics import Gauge, Histogram, Registry
+
+
+def test_histogram_buckets_are_cumulative_and_le_inclusive():
+    h = Histogram("lat_seconds", "latency", ("node",), buckets=(0.1, 1.0))
+    for v in (0.05, 0.1, 0.5, 3.0):
+        h.observe(v, "call_model")
+
+    lines = h.render()
+    assert 'lat_seconds_bucket{node="call_model",le="0.1"} 2' in lines
+    assert 'lat_seconds_bucket{node="call_model",le="1"} 3' in lines
+    assert 'lat_seconds_bucket{node="call_model",le="+Inf"} 4' in lines
+    assert 'lat_seconds_count{node="call_model"} 4' in lines
+    assert h.count("call_model") == 4
+    assert abs(h.sum("call_model") - 3.65) < 1e-9
+
+
+def test_registry_render_exposition_format():
+    reg = Registry()
+    c = reg.counter("rejected_total", "rejections", ("reason",))
+    c.inc("queue_full")
+    c.inc("queue_full", amount=2)
+    g = reg.gauge("active", "active streams")
+    g.inc()
+    reg.gauge("queued", "queue depth", fn=lambda: 7)
+    # Registrar dos veces devuelve la misma métrica
+    assert reg.counter("rejected_total", "rejections", ("reason",)) is c
+
+    text = reg.render()
+    assert "# TYPE rejected_total counter" in text
+    assert 'rejected_total{reason="queue_full"} 3' in text
+    assert "\nactive 1\n" in text
+    assert "\nqueued 7\n" in text
+    assert text.endswith("\n")
+
+
+def test_label_values_are_escaped():
+    g = Gauge("g", "help", ("engine_id",))
+    g.set(1, 'a"b\\c')
+    assert 'g{engine_id="a\\"b\\\\c"} 1' in g.render()
+
+
+def test_observe_is_cheap():
+    h = Histogram("x", "x", ("engine_id",))
+    n = 20000
+    started = time.perf_counter()
+    for i in range(n):
+        h.observe(i * 0.001, "e1")
+    per_call = (time.perf_counter() - started) / n
+    # Margen amplio para CI; en local ronda 0.5 µs
+    assert per_call < 20e-6
@@ -0,0 +1,116 @@
+"""Tests del perfilado bajo demanda y del monitor de bloqueos del event loop."""
+
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("qgdiag_lib_arquitectura")
+
+from app.services import profiling
+from app.services.profiling import LoopLagMonitor, ProfilerBusy, sample_cpu, sample_tasks
+
+
+def _blocking_login():
+    time.sleep(0.3)
+
+
+def _busy_loop(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        sum(range(1000))
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_monitor_captures_blocking_stack():
+    monitor = LoopLagMonitor(interval_s=0.02, threshold_s=0.1)
+    monitor.start()
+    try:
+        await asyncio.sleep(0.05)
+        _blocking_login()
+        await asyncio.sleep(0.1)
+    finally:
+        await monitor.stop()
+
+    snap = monitor.snapshot()
+    assert not snap["running"]
+    assert snap["max_lag_ms"] >= 200
+    stall = snap["stalls"][0]
+    assert stall["lag_ms"] >= 200
+    assert any("_blocking_login" in line for line in stall["stack"])
+
+
+@pytest.mark.asyncio
+async def test_sample_cpu_folds_loop_thread_stacks():
+    profile_task = asyncio.create_task(sample_cpu(0.3, interval_s=0.005))
+    await asyncio.sleep(0.02)
+    _busy_loop(0.2)
+    folded = await profile_task
+
+    lines = folded.splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) > 0
+    assert any("_busy_loop" in line for line in lines)
+    assert all(";" in line.rsplit(" ", 1)[0] for line in lines)
+
+
+@pytest.mark.asyncio
+async def test_sample_tasks_shows_awaiting_coroutines():
+    async def waiting_for_history():
+        await asyncio.sleep(1)
+
+    task = asyncio.create_task(waiting_for_history(), name="req-1")
+    try:
+        folded = await sample_tasks(0.1, interval_s=0.02)
+    finally:
+        task.cancel()
+    assert any(line.startswith("task:req-1;") and "waiting_for_history" in line for line in folded.splitlines())
+
+
+@pytest.mark.asyncio
+async def test_only_one_profile_at_a_time():
+    first = asyncio.create_task(sample_tasks(0.2, interval_s=0.02))
+    await asyncio.sleep(0.01)
+    with pytest.raises(ProfilerBusy):
+        await sample_cpu(0.05)
+    await first
+    assert not profiling._profile_lock.locked()
+
+
+def test_admin_endpoints_require_admin_app(override_settings):
+    pytest.importorskip("fastapi")
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.services.auth import authenticated_headers
+    from app.routes import admin
+
+    app = FastAPI()
+    app.include_router(admin.router)
+    app.dependency_overrides[authenticated_headers] = lambda: {"IAG-App-Id": "ops"}
+    client = TestClient(app)
+
+    override_settings(ADMIN_APP_IDS=[])
+    assert client.get("/admin/loop-lag").status_code == 403
+    assert client.get("/admin/admission").status_code == 403  # lista las apps con su cola
+
+    override_settings(ADMIN_APP_IDS=["ops"])
+    resp = client.get("/admin/profile", params={"seconds": 0.1, "interval_ms": 5})
+    assert resp.status_code == 200
+    assert resp.headers["content-disposition"].startswith('attachment; filename="profile-cpu-')
+    assert client.get("/admin/loop-lag").json()["running"] is False
+    assert "tenants" in client.get("/admin/admission").json()
+
+
+def test_admin_app_ids_env_var_is_a_comma_separated_list():
+    import os
+    import subprocess
+    import sys
+
+    env = {**os.environ, "ADMIN_APP_IDS": "app1, app2", "PYTHONPATH": os.pathsep.join(sys.path)}
+    out = subprocess.run(
+        [sys.executable, "-c", "from app.settings import settings; print(settings.ADMIN_APP_IDS)"],
+        env=env, capture_output=True, text=True, timeout=60,
+    )
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.strip().splitlines()[-1] == "['app1', 'app2']"
@@ -0,0 +1,57 @@
+"""Tests del estado de arranque (readiness) y de /ready."""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("qgdiag_lib_arquitectura")
+
+from app.services.readiness import STARTUP_STEP_SECONDS, Readiness
+
+
+@pytest.mark.asyncio
+async def test_ready_only_after_every_expected_step_finishes():
+    r = Readiness()
+    r.expect("jwks", "warmup")
+    assert not r.ready
+
+    async with r.step("jwks"):
+        await asyncio.sleep(0)
+    assert not r.ready and r.snapshot()["pending"] == ["warmup"]
+
+    r.mark_done("warmup")
+    snap = r.snapshot()
+    assert r.ready and snap["ready_after_s"] is not None and set(snap["done"]) == {"jwks", "warmup"}
+    assert STARTUP_STEP_SECONDS.count("jwks") >= 1
+
+
+@pytest.mark.asyncio
+async def test_failed_step_keeps_worker_unready_until_retried():
+    r = Readiness()
+    with pytest.raises(ConnectionError):
+        async with r.step("jwks"):
+            raise ConnectionError("idp down")
+    assert not r.ready and r.snapshot()["failed"] == {"jwks": "ConnectionError: idp down"}
+
+    async with r.step("jwks"):
+        pass
+    assert r.ready and r.snapshot()["failed"] == {}
+
+
+def test_ready_endpoint_reports_503_until_startup_completes():
+    pytest.importorskip("fastapi")
+    from fastapi.testclient import TestClient
+    import main
+
+    main.readiness.reset()
+    client = TestClient(main.app)
+    try:
+        main.readiness.expect("jwks")
+        resp = client.get("/ready")
+        assert resp.status_code == 503 and resp.json()["pending"] == ["jwks"]
+        assert client.get("/health").status_code == 200  # liveness no depende del arranque
+
+        main.readiness.mark_done("jwks")
+        assert client.get("/ready").status_code == 200
+    finally:
+        main.readiness.reset()
@@ -0,0 +1,165 @@
+"""Tests de la recarga en caliente de settings (app.settings.SettingsProvider)."""
+
+import asyncio
+
+import pytest
+from pydantic import ValidationError
+
+pytest.importorskip("qgdiag_lib_arquitectura")
+
+from app.settings import PinnedSettingsMiddleware, SettingsProvider, _SettingsProxy, settings, settings_provider
+
+
+@pytest.fixture
+def config_files(tmp_path):
+    config = tmp_path / "config.yaml"
+    overrides = tmp_path / "overrides.yaml"
+    config.write_text("ENGINE_ID: engine-a\nBATCH_MAX_ITEMS: 10\n")
+    return config, overrides
+
+
+def test_reload_swaps_snapshot_and_reports_changed_fields(config_files):
+    config, overrides = config_files
+    provider = SettingsProvider(str(config), str(overrides))
+    seen = []
+    provider.subscribe(lambda old, new, changed: seen.append((old.ENGINE_ID, new.ENGINE_ID, changed)))
+    first = provider.current
+
+    overrides.write_text("ENGINE_ID: engine-b\n")
+    assert provider.changed_on_disk()
+    assert provider.reload() == {"ENGINE_ID"}
+
+    assert provider.current is not first and provider.current.BATCH_MAX_ITEMS == 10
+    assert seen == [("engine-a", "engine-b", {"ENGINE_ID"})] and provider.version == 2
+    assert provider.reload() == set() and provider.version == 2  # sin cambios no hay nueva versión
+
+
+def test_invalid_file_keeps_previous_snapshot(config_files):
+    config, overrides = config_files
+    provider = SettingsProvider(str(config), str(overrides))
+    overrides.write_text("BATCH_MAX_ITEMS: no-es-un-numero\n")
+
+    with pytest.raises(Exception):
+        provider.reload()
+
+    assert provider.current.BATCH_MAX_ITEMS == 10 and provider.last_error
+
+
+def test_proxy_reads_pinned_snapshot_and_is_read_only(config_files):
+    config, overrides = config_files
+    provider = SettingsProvider(str(config), str(overrides))
+    proxy = _SettingsProxy(provider)
+
+    with provider.pinned():
+        overrides.write_text("ENGINE_ID: engine-b\n")
+        provider.reload()
+        assert proxy.ENGINE_ID == "engine-a"  # la petición en curso conserva su instantánea
+    assert proxy.ENGINE_ID == "engine-b"
+
+    with pytest.raises(AttributeError):
+        proxy.ENGINE_ID = "patched"
+    with pytest.raises(ValidationError):
+        provider.current.ENGINE_ID = "patched"
+    assert proxy.ENGINE_ID == "engine-b"
+
+
+def test_swap_publishes_a_new_snapshot_to_subscribers(config_files):
+    config, overrides = config_files
+    provider = SettingsProvider(str(config), str(overrides))
+    seen = []
+    provider.subscribe(lambda old, new, changed: seen.append(changed))
+
+    assert provider.swap(provider.current.model_copy(update={"ENGINE_ID": "swapped"})) == {"ENGINE_ID"}
+
+    assert provider.current.ENGINE_ID == "swapped" and provider.version == 2 and seen == [{"ENGINE_ID"}]
+    assert provider.reload() == {"ENGINE_ID"} and provider.current.ENGINE_ID == "engine-a"  # los ficheros mandan
+
+
+@pytest.mark.asyncio
+async def test_in_flight_request_keeps_its_snapshot_across_a_reload(override_settings):
+    override_settings(ENGINE_ID="before")
+    release = asyncio.Event()
+    seen = []
+
+    async def app(scope, receive, send):
+        seen.append(settings.ENGINE_ID)
+        await release.wait()
+        seen.append(settings.ENGINE_ID)
+
+    request = asyncio.create_task(PinnedSettingsMiddleware(app)({"type": "http"}, None, None))
+    await asyncio.sleep(0)
+    override_settings(ENGINE_ID="after")
+    release.set()
+    await request
+
+    assert seen == ["before", "before"] and settings.ENGINE_ID == "after"
+
+
+def test_reload_reconfigures_router_admission_and_retires_old_pool(tmp_path, monkeypatch):
+    from app.agent import aicore_langchain
+    from app.agent.engine_router import engine_router
+    from app.services.admission import admission
+
+    overrides = tmp_path / "overrides.yaml"
+    monkeypatch.setattr(settings_provider, "overrides_path", str(overrides))
+    old_url = settings.AICORE_URL
+    aicore_langchain._shared_transports(old_url)
+    engine_router.record("engine-x", ttft_s=0.5)
+    try:
+        overrides.write_text(
+            "AICORE_URL: http://aicore-dr.local\n"
+            "ENGINE_POOLS:\n  chat: [engine-x, engine-y]\n"
+            "ADMISSION_MAX_CONCURRENCY: 3\n"
+        )
+        changed = settings_provider.reload()
+
+        assert {"AICORE_URL", "ENGINE_POOLS", "ADMISSION_MAX_CONCURRENCY"} <= changed
+        assert engine_router.pool_for("chat", None) == ["engine-x", "engine-y"]
+        assert engine_router.stats["engine-x"].samples == 1  # las estadísticas se conservan
+        assert admission.max_concurrency == 3
+        assert old_url not in aicore_langchain._TRANSPORTS
+    finally:
+        overrides.unlink(missing_ok=True)
+        settings_provider.reload()
+    assert engine_router.pool_for("chat", None) == [settings.ENGINE_ID]
+
+
+def test_reload_reaches_objects_built_at_import_and_reports_restart_only_fields(override_settings):
+    from app.agent import aicore_langchain
+    from app.agent.ms_clients.prompt_client import prompt_client
+    from app.agent.resilience import breaker_for
+    from app.services.auth import token_cache
+    from app.services.jwks import jwks_manager
+    from app.services.usage import usage_accountant
+
+    breaker = breaker_for("engine-reload")
+    override_settings(
+        AICORE_SESSION_CACHE_TTL_S=11.0,
+        PROMPTS_TTL_S=12.0,
+        AICORE_BREAKER_RESET_S=13.0,
+        JWKS_REFRESH_S=14.0,
+        AUTH_CACHE_MAX_TTL_S=15.0,
+        USAGE_FLUSH_INTERVAL_S=16.0,
+        TOKENIZER_CACHE_SIZE=17,
+    )
+
+    assert aicore_langchain._SESSIONS.ttl_s == aicore_langchain._SECRETS.ttl_s == 11.0
+    assert prompt_client.ttl_s == prompt_client._shared.ttl_s == 12.0
+    assert breaker.reset_timeout_s == 13.0 and jwks_manager.refresh_s == 14.0
+    assert token_cache.max_ttl_s == 15.0 and usage_accountant.flush_interval_s == 16.0
+    assert settings_provider.snapshot()["pending_restart"] == ["TOKENIZER_CACHE_SIZE"]
+
+
+@pytest.mark.asyncio
+async def test_requests_pinned_to_a_retired_url_reuse_the_draining_pool():
+    from app.agent import aicore_langchain
+
+    url = "http://aicore-retirado.local"
+    pool = aicore_langchain._shared_transports(url)
+    assert aicore_langchain.retire_transports(url, grace_s=0.05)
+
+    assert aicore_langchain._shared_transports(url) is pool  # petición en curso con la instantánea anterior
+    await asyncio.sleep(0.1)
+    late = aicore_langchain._shared_transports(url)
+    assert late is not pool and url not in aicore_langchain._TRANSPORTS and url not in aicore_langchain._DRAINING
+    aicore_langchain._RETIRED.discard(url)
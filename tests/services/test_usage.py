@@ -0,0 +1,215 @@
+"""Contabilidad de tokens y envío por lotes al MS de control de gastos (app.services.usage)."""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("qgdiag_lib_arquitectura")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessageChunk, HumanMessage
+
+from app.agent.context import WARMUP_ENGINE_ID, Context
+from app.agent.deadline import deadline_after
+from app.agent.engine_router import engine_router
+from app.agent.graph import graph
+from app.routes import agent as agent_router
+from app.schemas.usage_schema import QuotaWire
+from app.services.auth import authenticated_headers
+from app.agent.tokens import tokenizer
+from app.agent.ms_clients.spend_client import SpendClient
+from app.services.usage import USAGE_FLUSHES, BudgetExceeded, UsageAccountant, usage_accountant
+
+
+class FakeSpendMS:
+    def __init__(self, quotas=()):
+        self.reports = []
+        self.quotas = list(quotas)
+        self.fail = False
+
+    async def report(self, records):
+        if self.fail:
+            raise ConnectionError("control de gastos caído")
+        self.reports.append(records)
+
+    async def get_quotas(self):
+        return self.quotas
+
+
+@pytest.mark.asyncio
+async def test_records_are_aggregated_and_flushed_in_one_batch():
+    ms = FakeSpendMS()
+    acc = UsageAccountant(ms.report, ms.get_quotas)
+    acc.record("app-a", "engine-1", 100, 20)
+    acc.record("app-a", "engine-1", 50, 10, estimated=True)
+    acc.record("app-b", "engine-1", 7, 3)
+
+    assert await acc.flush() == 2
+    assert await acc.flush() == 0  # nada pendiente: no hay petición
+
+    (batch,) = ms.reports
+    by_app = {r.app_id: r for r in batch}
+    assert (by_app["app-a"].prompt_tokens, by_app["app-a"].completion_tokens) == (150, 30)
+    assert (by_app["app-a"].calls, by_app["app-a"].estimated_calls) == (2, 1)
+    assert by_app["app-b"].window_end >= by_app["app-b"].window_start
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_is_retried_with_new_usage_and_sent_at_shutdown():
+    ms = FakeSpendMS()
+    acc = UsageAccountant(ms.report, ms.get_quotas)
+    acc.record("app-a", "engine-1", 10, 1)
+    ms.fail = True
+    with pytest.raises(ConnectionError):
+        await acc.flush()
+    assert acc.last_error
+
+    acc.record("app-a", "engine-1", 5, 1)
+    ms.fail = False
+    await acc.stop()
+
+    (batch,) = ms.reports
+    assert (batch[0].prompt_tokens, batch[0].calls) == (15, 2)
+
+
+class _Rejected(Exception):
+    status_code = 401
+
+
+@pytest.mark.asyncio
+async def test_unauthorized_flush_is_counted_and_kept_for_retry():
+    ms = FakeSpendMS()
+    acc = UsageAccountant(ms.report, ms.get_quotas)
+    acc.record("app-a", "engine-1", 10, 1)
+    before = USAGE_FLUSHES.value("unauthorized")
+
+    async def rejected(records):
+        raise _Rejected("401 Unauthorized")
+
+    acc._report = rejected
+    with pytest.raises(_Rejected):
+        await acc.flush()
+
+    assert USAGE_FLUSHES.value("unauthorized") == before + 1
+    assert acc._pending[("app-a", "engine-1")].prompt_tokens == 10
+
+
+@pytest.mark.asyncio
+async def test_spend_client_sends_service_credentials(override_settings, monkeypatch):
+    override_settings(SERVICE_TOKEN="svc-token", SERVICE_APP_ID="agent")
+    sent = []
+
+    class _Response:
+        def raise_for_status(self):
+            pass
+
+    class _Rest:
+        async def post_call(self, endpoint, headers, json):
+            sent.append(headers)
+            return _Response()
+
+    client = SpendClient()
+    monkeypatch.setattr(client, "_client", lambda timeout: _Rest())
+    await client.report([])
+
+    assert sent == [{"Token": "svc-token", "IAG-App-Id": "agent"}]
+
+
+@pytest.mark.asyncio
+async def test_budget_check_uses_quota_snapshot_minus_local_spend(override_settings):
+    override_settings(USAGE_BUDGET_CHECK_ENABLED=True)
+    ms = FakeSpendMS([QuotaWire(app_id="app-a", remaining_tokens=100), QuotaWire(app_id="app-b", blocked=True)])
+    acc = UsageAccountant(ms.report, ms.get_quotas, quota_refresh_s=30)
+    await acc.refresh_quotas()
+
+    acc.check_budget("app-a")
+    acc.check_budget("app-desconocida")  # sin cuota: sin límite
+    with pytest.raises(BudgetExceeded) as exc:
+        acc.check_budget("app-b")
+    assert exc.value.status_code == 429 and exc.value.headers["Retry-After"] == "30"
+
+    acc.record("app-a", "engine-1", 80, 20)
+    assert acc.over_budget("app-a")
+
+
+class _UsageChat:
+    def __init__(self, with_usage):
+        self.with_usage = with_usage
+
+    async def astream(self, messages, config=None):
+        yield AIMessageChunk(content="Final Answer: ")
+        usage = {"input_tokens": 42, "output_tokens": 5, "total_tokens": 47} if self.with_usage else None
+        yield AIMessageChunk(content="hola", usage_metadata=usage)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("with_usage", [True, False])
+async def test_call_model_records_provider_or_estimated_usage(override_settings, monkeypatch, with_usage):
+    override_settings(USAGE_ENABLED=True)
+    monkeypatch.setattr(usage_accountant, "_pending", {})
+    ctx = Context(engine_id="engine-test", chat_model=_UsageChat(with_usage), headers={"IAG-App-Id": "app-a"})
+
+    await graph.ainvoke({"messages": [HumanMessage(content="hola")]}, context=ctx, recursion_limit=4)
+
+    totals = usage_accountant._pending[("app-a", "engine-test")]
+    if with_usage:
+        assert (totals.prompt_tokens, totals.completion_tokens, totals.estimated_calls) == (42, 5, 0)
+    else:
+        assert totals.completion_tokens == tokenizer.count("Final Answer: hola")
+        assert totals.prompt_tokens > 0 and totals.estimated_calls == 1
+
+
+@pytest.mark.asyncio
+async def test_warmup_turn_records_no_usage_nor_router_stats(override_settings, monkeypatch):
+    override_settings(USAGE_ENABLED=True)
+    monkeypatch.setattr(usage_accountant, "_pending", {})
+    monkeypatch.setattr(engine_router, "stats", {})
+    ctx = Context(engine_id=WARMUP_ENGINE_ID, chat_model=_UsageChat(True), headers={"IAG-App-Id": "app-a"})
+
+    await graph.ainvoke({"messages": [HumanMessage(content="hola")]}, context=ctx, recursion_limit=4)
+
+    assert usage_accountant._pending == {} and engine_router.stats == {}
+
+
+class _HangingChat:
+    async def astream(self, messages, config=None):
+        yield AIMessageChunk(content="Final Answer: texto ya generado")
+        await asyncio.sleep(10)
+
+
+@pytest.mark.asyncio
+async def test_text_discarded_on_timeout_is_still_billed(fake_guardrails, override_settings, monkeypatch):
+    # Guardrails lentos: vence el deadline sin verificar la salida y el texto se descarta
+    _, srv = fake_guardrails(latency_s=2)
+    override_settings(
+        GUARDRAILS_ENABLED=True,
+        GUARDRAILS_URL="http://127.0.0.1",
+        GUARDRAILS_PORT=str(srv.port),
+        GUARDRAILS_FAIL_OPEN=False,
+        USAGE_ENABLED=True,
+    )
+    monkeypatch.setattr(usage_accountant, "_pending", {})
+    ctx = Context(
+        engine_id="engine-test", chat_model=_HangingChat(), headers={"IAG-App-Id": "app-a"}, deadline=deadline_after(0.3)
+    )
+
+    result = await graph.ainvoke({"messages": [HumanMessage(content="hola")]}, context=ctx, recursion_limit=4)
+
+    assert "texto ya generado" not in result["messages"][-1].content
+    totals = usage_accountant._pending[("app-a", "engine-test")]
+    assert totals.completion_tokens == tokenizer.count("Final Answer: texto ya generado")
+
+
+def test_react_run_rejects_tenant_over_budget(override_settings, monkeypatch):
+    override_settings(USAGE_BUDGET_CHECK_ENABLED=True)
+    monkeypatch.setattr(usage_accountant, "_quotas", {"app": QuotaWire(app_id="app", blocked=True)})
+    app = FastAPI()
+    app.dependency_overrides[authenticated_headers] = lambda: {"Token": "t", "IAG-App-Id": "app"}
+    app.include_router(agent_router.router)
+
+    resp = TestClient(app).post(
+        "/agent/react-run", params={"feature": "f", "model_id": "m", "version": "1"}, json={"message": "x"}
+    )
+
+    assert resp.status_code == 429 and "Retry-After" in resp.headers